@@ -1,9 +1,12 @@
 import django_filters
 
 from apps.contact.models import Contact
+from utils.filters import SearchFilter
 
 
 class ContactFilter(django_filters.FilterSet):
+    search = SearchFilter()
+
     class Meta:
         model = Contact
         fields = {
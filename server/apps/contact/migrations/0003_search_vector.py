@@ -0,0 +1,30 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from utils.search import get_search_vector_sql, get_trigram_index_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0002_trigram_extension'),
+        ('contact', '0002_auto_20201019_0758'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='contact_con_search__ac2468_gin'),
+        ),
+        migrations.RunSQL(*get_search_vector_sql('contact_contact', [('first_name', 'A'), ('last_name', 'A'), ('job_title', 'B'), ('comment', 'C')])),
+        migrations.RunSQL(*get_trigram_index_sql('contact_contact', 'first_name')),
+        migrations.RunSQL(*get_trigram_index_sql('contact_contact', 'last_name')),
+    ]
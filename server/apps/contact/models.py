@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django_enumfield import enum
@@ -46,6 +48,11 @@ class Contact(MetaInformationAbstractModel, models.Model):
     email = models.EmailField(verbose_name=_('Email'), blank=True, null=True)
     phone = models.CharField(verbose_name=_('Phone'), max_length=32, blank=True, null=True)
     comment = models.TextField(verbose_name=_('Comment'), blank=True, null=True)
+    # updated by a database trigger (see utils/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'])]
 
     def __str__(self):
         return f'{self.designation.name} {self.first_name} {self.last_name}'
@@ -1,12 +1,13 @@
 import graphene
-from graphene_django_extras import DjangoObjectField, PageGraphqlPagination, \
-    DjangoObjectType
+from graphene_django_extras import DjangoObjectField, DjangoObjectType
 
 from apps.contact.enums import CommunicationMediumGrapheneEnum, DesignationGrapheneEnum, \
     GenderGrapheneEnum
 from apps.contact.filters import ContactFilter
 from apps.contact.models import Contact, Communication
+from utils.dataloaders import load_file_url, load_foreign_key, load_many_to_many
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 
 
 class CommunicationType(DjangoObjectType):
@@ -14,7 +15,17 @@ class CommunicationType(DjangoObjectType):
         model = Communication
         filter_fields = []
 
+    # columns read by the custom resolvers, kept by the optimizer (see utils/optimizer.py)
+    source_fields = {'attachment_url': ['attachment']}
+
     medium = graphene.Field(CommunicationMediumGrapheneEnum)
+    attachment_url = graphene.String()
+
+    def resolve_attachment_url(root, info, **kwargs):
+        return load_file_url(info, root.attachment)
+
+    def resolve_contact(root, info, **kwargs):
+        return load_foreign_key(info, root, 'contact')
 
 
 class CommunicationListType(CustomDjangoListObjectType):
@@ -29,6 +40,7 @@ class CommunicationListType(CustomDjangoListObjectType):
 class ContactType(DjangoObjectType):
     class Meta:
         model = Contact
+        exclude_fields = ('search_vector',)
 
     designation = graphene.Field(DesignationGrapheneEnum)
     gender = graphene.Field(GenderGrapheneEnum)
@@ -37,6 +49,15 @@ class ContactType(DjangoObjectType):
                                                         page_size_query_param='pageSize'
                                                     ))
 
+    def resolve_organization(root, info, **kwargs):
+        return load_foreign_key(info, root, 'organization')
+
+    def resolve_country(root, info, **kwargs):
+        return load_foreign_key(info, root, 'country')
+
+    def resolve_countries_of_operation(root, info, **kwargs):
+        return load_many_to_many(info, root, 'countries_of_operation')
+
 
 class ContactListType(CustomDjangoListObjectType):
     class Meta:
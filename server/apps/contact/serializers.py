@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from apps.contact.models import Contact, Communication
+from apps.contrib.serializers import RelatedObjectsSerializerMixin
 
 
 class CommonCommunicationValidatorMixin(object):
@@ -14,21 +15,24 @@ class CommonContactValidatorMixin(object):
         return phone
 
 
-class CommunicationSerializer(CommonCommunicationValidatorMixin,
+class CommunicationSerializer(RelatedObjectsSerializerMixin,
+                              CommonCommunicationValidatorMixin,
                               serializers.ModelSerializer):
     class Meta:
         model = Communication
         fields = '__all__'
 
 
-class ContactWithoutOrganizationSerializer(CommonContactValidatorMixin,
+class ContactWithoutOrganizationSerializer(RelatedObjectsSerializerMixin,
+                                           CommonContactValidatorMixin,
                                            serializers.ModelSerializer):
     class Meta:
         model = Contact
         exclude = ['organization']
 
 
-class ContactSerializer(CommonContactValidatorMixin,
+class ContactSerializer(RelatedObjectsSerializerMixin,
+                        CommonContactValidatorMixin,
                         serializers.ModelSerializer):
     class Meta:
         model = Contact
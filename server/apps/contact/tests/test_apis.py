@@ -1,7 +1,10 @@
 import json
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from apps.users.roles import MONITORING_EXPERT_REVIEWER, GUEST
-from utils.factories import CountryFactory, ContactFactory, OrganizationFactory
+from utils.factories import CommunicationFactory, CountryFactory, ContactFactory, OrganizationFactory
 from utils.permissions import PERMISSION_DENIED_MESSAGE
 from utils.tests import HelixGraphQLTestCase, create_user_with_role
 
@@ -177,3 +180,34 @@ class TestDeleteContact(HelixGraphQLTestCase):
 
         content = json.loads(response.content)
         self.assertIn(PERMISSION_DENIED_MESSAGE, content['errors'][0]['message'])
+
+
+class TestCommunicationListQuery(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.query_str = '''
+            query CommunicationList {
+              communicationList {
+                results {
+                  id
+                  attachmentUrl
+                }
+              }
+            }
+        '''
+        self.force_login(create_user_with_role(MONITORING_EXPERT_REVIEWER))
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(self.query_str)
+        self.assertResponseNoErrors(response)
+        return len(context.captured_queries), json.loads(response.content)
+
+    def test_attachment_url_is_loaded_with_the_communications(self):
+        CommunicationFactory.create_batch(2)
+        initial_count, _ = self._count_queries()
+
+        CommunicationFactory.create_batch(5)
+        final_count, content = self._count_queries()
+
+        self.assertEqual(initial_count, final_count)
+        self.assertEqual(len(content['data']['communicationList']['results']), 7)
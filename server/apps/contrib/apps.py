@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_save, post_delete, m2m_changed
 
 
 class ContribConfig(AppConfig):
     name = 'apps.contrib'
+
+    def ready(self):
+        from utils.counts import bump_table_version, get_versioned_models
+        from utils.db import check_connections, mark_connections_idle
+
+        # table versions are used to invalidate the cached list counts and responses
+        for model in get_versioned_models():
+            label = model._meta.label_lower
+            post_save.connect(bump_table_version, sender=model,
+                              dispatch_uid=f'bump_table_version_on_save_{label}')
+            post_delete.connect(bump_table_version, sender=model,
+                                dispatch_uid=f'bump_table_version_on_delete_{label}')
+            # sent with the through model
+            m2m_changed.connect(bump_table_version, sender=model,
+                                dispatch_uid=f'bump_table_version_on_m2m_change_{label}')
+        # persistent database connections idle for a while are checked before they are used
+        request_started.connect(check_connections, dispatch_uid='check_connections')
+        request_finished.connect(mark_connections_idle, dispatch_uid='mark_connections_idle')
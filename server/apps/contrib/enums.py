@@ -0,0 +1,7 @@
+import graphene
+
+from apps.contrib.models import Job
+
+from utils.enums import enum_description
+
+JobStatusGrapheneEnum = graphene.Enum.from_enum(Job.STATUS, description=enum_description)
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_QUERY = 'query Benchmark { __typename }'
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Client:
+    """
+    Keep-alive connection posting the graphql query
+    """
+    def __init__(self, url: str, body: bytes, headers: dict):
+        parts = urlsplit(url)
+        self.host, self.port, self.path = parts.hostname, parts.port or 80, parts.path or '/'
+        self.body = body
+        self.headers = {'Content-Type': 'application/json', **headers}
+        self.connection = None
+
+    def request(self) -> bool:
+        if self.connection is None:
+            self.connection = HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            self.connection.request('POST', self.path, self.body, self.headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, ConnectionError):
+            self.connection.close()
+            self.connection = None
+            return False
+        return response.status == 200 and b'"errors"' not in content
+
+
+class Command(BaseCommand):
+    help = 'Measure the startup time and the steady-state throughput of the graphql endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str,
+                            help='Graphql url of a running server, otherwise gunicorn is started '
+                                 'with the profile of HELIX_ENVIRONMENT (see helix/gunicorn.py).')
+        parser.add_argument('--workers', type=int, help='Gunicorn workers of the started server.')
+        parser.add_argument('--query', type=str, help='File with the graphql query.')
+        parser.add_argument('--variables', type=str, default='{}', help='Variables of the query (json).')
+        parser.add_argument('--header', action='append', default=[],
+                            help='eg. "Cookie: sessionid=..." for the authenticated queries.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds before the measure.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of the measure.')
+        parser.add_argument('--startup-timeout', type=float, default=120)
+
+    def start_server(self, workers):
+        port = get_free_port()
+        env = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}')
+        if workers:
+            env['GUNICORN_WORKERS'] = str(workers)
+        # next to the python of the virtualenv, or in the PATH
+        gunicorn = shutil.which('gunicorn', path=os.path.dirname(sys.executable)) or shutil.which('gunicorn')
+        if gunicorn is None:
+            raise CommandError('gunicorn is not installed.')
+        process = subprocess.Popen(
+            [gunicorn, '-c', 'python:helix.gunicorn', 'helix.asgi:application'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        return process, f'http://127.0.0.1:{port}/graphql'
+
+    def wait_until_ready(self, client: Client, process, timeout: float) -> float:
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if process is not None and process.poll() is not None:
+                raise CommandError(f'The server exited with {process.returncode}.')
+            if client.request():
+                return time.perf_counter() - start
+            time.sleep(0.1)
+        raise CommandError(f'The server did not answer the query within {timeout} seconds.')
+
+    def run_clients(self, url, body, headers, concurrency, warmup, duration):
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        measure_start = time.perf_counter() + warmup
+        end = measure_start + duration
+
+        def run():
+            client = Client(url, body, headers)
+            while True:
+                start = time.perf_counter()
+                if start >= end:
+                    return
+                ok = client.request()
+                if start < measure_start:
+                    continue
+                with lock:
+                    if ok:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=run) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(latencies), errors[0]
+
+    def handle(self, *args, **options):
+        query = DEFAULT_QUERY
+        if options['query']:
+            with open(options['query']) as fp:
+                query = fp.read()
+        body = json.dumps(dict(query=query, variables=json.loads(options['variables']))).encode()
+        headers = dict(
+            [part.strip() for part in header.split(':', 1)]
+            for header in options['header']
+        )
+
+        process, url = None, options['url']
+        if url is None:
+            process, url = self.start_server(options['workers'])
+        try:
+            startup = self.wait_until_ready(Client(url, body, headers), process, options['startup_timeout'])
+            latencies, errors = self.run_clients(
+                url, body, headers, options['concurrency'], options['warmup'], options['duration'],
+            )
+        finally:
+            if process is not None:
+                # graceful shutdown, as on a deploy
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+
+        if process is not None:
+            self.stdout.write(f'Startup: {startup:.2f}s until the first response')
+        self.stdout.write(
+            f'Throughput: {len(latencies) / options["duration"]:.1f} requests/s '
+            f'({len(latencies)} requests, {errors} errors, concurrency {options["concurrency"]})'
+        )
+        self.stdout.write('Latency: ' + ', '.join(
+            f'p{int(share * 100)} {percentile(latencies, share) * 1000:.1f}ms'
+            for share in (0.5, 0.95, 0.99)
+        ))
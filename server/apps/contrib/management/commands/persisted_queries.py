@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from graphql import parse, validate
+
+from apps.contrib.models import PersistedQuery
+from helix.schema import schema
+from utils.backends import document_backend, get_query_hash
+
+
+class Command(BaseCommand):
+    help = 'Register or export the persisted queries manifest ({"<sha256 hash>": "<query>"}).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['register', 'export'])
+        parser.add_argument('manifest', type=str)
+        parser.add_argument('--clear', action='store_true',
+                            help='Remove the persisted queries missing from the manifest.')
+
+    def register(self, manifest, clear=False):
+        with open(manifest) as fp:
+            queries = json.load(fp)
+        for query_hash, query in queries.items():
+            if get_query_hash(query) != query_hash:
+                raise CommandError(f'Hash mismatch for {query_hash}.')
+            errors = validate(schema, parse(query), document_backend.get_validation_rules(schema))
+            if errors:
+                raise CommandError(f'Invalid query {query_hash}: {errors[0].message}')
+        with transaction.atomic():
+            existing = set(PersistedQuery.objects.values_list('hash', flat=True))
+            for query_hash, query in queries.items():
+                if query_hash not in existing:
+                    PersistedQuery.objects.create(query=query)
+            if clear:
+                PersistedQuery.objects.exclude(hash__in=queries.keys()).delete()
+        self.stdout.write(self.style.SUCCESS(f'Registered {len(queries.keys() - existing)} queries.'))
+
+    def export(self, manifest):
+        queries = dict(PersistedQuery.objects.order_by('hash').values_list('hash', 'query'))
+        with open(manifest, 'w') as fp:
+            json.dump(queries, fp, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Exported {len(queries)} queries.'))
+
+    def handle(self, *args, **options):
+        if options['action'] == 'register':
+            self.register(options['manifest'], clear=options['clear'])
+        else:
+            self.export(options['manifest'])
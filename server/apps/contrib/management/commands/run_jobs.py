@@ -0,0 +1,39 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from utils.jobs import run_next_job
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs, the workers can run on as many processes and hosts as needed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once there are no pending jobs.')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds between the checks for new jobs.')
+
+    def stop(self, *args):
+        # the current job is finished first
+        self.stopped = True
+
+    def handle(self, *args, **options):
+        self.stopped = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        count = 0
+        while not self.stopped:
+            close_old_connections()
+            instance = run_next_job()
+            if instance is not None:
+                count += 1
+                self.stdout.write(f'{instance} {instance.STATUS(instance.status).name}')
+                continue
+            if options['burst']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs.'))
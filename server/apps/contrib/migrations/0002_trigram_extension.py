@@ -0,0 +1,13 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:19
+
+import apps.contrib.models
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_enumfield.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contrib', '0002_trigram_extension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, verbose_name='Name')),
+                ('kwargs', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, verbose_name='Arguments')),
+                ('status', django_enumfield.db.fields.EnumField(default=0, enum=apps.contrib.models.Job.STATUS)),
+                ('priority', models.SmallIntegerField(default=0, help_text='Jobs with a higher priority run first.', verbose_name='Priority')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run At')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='Maximum Attempts')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('result', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='Result')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created At')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(status=0), fields=['-priority', 'run_at'], name='contrib_job_pending_idx'),
+        ),
+    ]
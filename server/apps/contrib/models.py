@@ -1,8 +1,14 @@
 from uuid import uuid4
 
+from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from django_enumfield import enum
+
+from utils.backends import get_query_hash
 
 
 class UUIDAbstractModel(models.Model):
@@ -27,3 +33,83 @@ class MetaInformationAbstractModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class PersistedQuery(models.Model):
+    """
+    Query registered from the client manifest, requested with the SHA-256 hash of its text
+    """
+    hash = models.CharField(verbose_name=_('Hash'), max_length=64, unique=True)
+    query = models.TextField(verbose_name=_('Query'))
+    created_at = models.DateTimeField(verbose_name=_('Created At'), default=timezone.now)
+
+    CACHE_KEY = 'persisted_query_{}'
+
+    @classmethod
+    def get_query(cls, hash: str):
+        """
+        Returns the query text of the hash or None
+        """
+        key = cls.CACHE_KEY.format(hash)
+        query = cache.get(key)
+        if query is None:
+            query = cls.objects.filter(hash=hash).values_list('query', flat=True).first()
+            if query is not None:
+                cache.set(key, query, None)
+        return query
+
+    def save(self, *args, **kwargs):
+        self.hash = get_query_hash(self.query)
+        super().save(*args, **kwargs)
+        cache.delete(self.CACHE_KEY.format(self.hash))
+
+    def __str__(self):
+        return self.hash
+
+
+class Job(models.Model):
+    """
+    Background job run by the `run_jobs` workers (see utils/jobs.py)
+    """
+    class STATUS(enum.Enum):
+        PENDING = 0
+        RUNNING = 1
+        COMPLETED = 2
+        FAILED = 3
+
+        __labels__ = {
+            PENDING: _("Pending"),
+            RUNNING: _("Running"),
+            COMPLETED: _("Completed"),
+            FAILED: _("Failed"),
+        }
+
+    name = models.CharField(verbose_name=_('Name'), max_length=128)
+    kwargs = JSONField(verbose_name=_('Arguments'), default=dict, blank=True)
+    status = enum.EnumField(enum=STATUS, verbose_name=_('Status'), default=STATUS.PENDING)
+    priority = models.SmallIntegerField(verbose_name=_('Priority'), default=0,
+                                        help_text=_('Jobs with a higher priority run first.'))
+    run_at = models.DateTimeField(verbose_name=_('Run At'), default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=0)
+    max_attempts = models.PositiveSmallIntegerField(verbose_name=_('Maximum Attempts'), default=3)
+    started_at = models.DateTimeField(verbose_name=_('Started At'), blank=True, null=True)
+    finished_at = models.DateTimeField(verbose_name=_('Finished At'), blank=True, null=True)
+    result = JSONField(verbose_name=_('Result'), blank=True, null=True)
+    error = models.TextField(verbose_name=_('Error'), blank=True, null=True)
+    created_by = models.ForeignKey('users.User', verbose_name=_('Created By'),
+                                   blank=True, null=True,
+                                   related_name='+', on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(verbose_name=_('Created At'), default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the queue of the workers
+            models.Index(fields=['-priority', 'run_at'], name='contrib_job_pending_idx',
+                         condition=Q(status=0)),
+        ]
+
+    def can_be_viewed_by(self, user) -> bool:
+        return user.is_superuser or (self.created_by_id is not None and self.created_by_id == user.id)
+
+    def __str__(self):
+        return f'Job {self.name} {self.id}'
@@ -0,0 +1,32 @@
+import graphene
+from graphene.types.generic import GenericScalar
+from graphene_django_extras import DjangoObjectType
+
+from apps.contrib.enums import JobStatusGrapheneEnum
+from apps.contrib.models import Job
+from utils.dataloaders import FileUrlDataLoader, get_dataloader
+
+
+class JobType(DjangoObjectType):
+    class Meta:
+        model = Job
+        exclude_fields = ('kwargs', 'error')
+
+    status = graphene.Field(JobStatusGrapheneEnum)
+    result = GenericScalar()
+    file_url = graphene.String(description='Url of the file produced by the job eg. an export')
+
+    def resolve_file_url(root, info, **kwargs):
+        if isinstance(root.result, dict) and root.result.get('file'):
+            return get_dataloader(info, FileUrlDataLoader).load(root.result['file'])
+        return None
+
+
+class Query:
+    job = graphene.Field(JobType, id=graphene.ID(required=True))
+
+    def resolve_job(root, info, id):
+        instance = Job.objects.filter(id=id).first()
+        if instance is not None and instance.can_be_viewed_by(info.context.user):
+            return instance
+        return None
@@ -1,3 +1,11 @@
+from collections import defaultdict
+from typing import Mapping, Optional, Tuple
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
 class MetaInformationSerializerMixin(object):
     """
     Responsible to add following fields into the validated data
@@ -15,3 +23,123 @@ class MetaInformationSerializerMixin(object):
                 'last_modified_by': self.context['request'].user
             })
         return attrs
+
+
+class RelatedObjects:
+    """
+    Instances referenced by the primary keys of a payload, loaded with one IN query per model
+    """
+    def __init__(self):
+        self.querysets = dict()
+        self.pks = defaultdict(set)
+        self.instances = dict()
+
+    @staticmethod
+    def get_queryset(field):
+        if not isinstance(field, BatchedPrimaryKeyRelatedField) or field.pk_field is not None:
+            return None
+        queryset = field.get_queryset()
+        if queryset is None or queryset.query.where:
+            # eg. limit_choices_to, checked by the field itself
+            return None
+        return queryset
+
+    @staticmethod
+    def to_python(queryset, pk):
+        try:
+            return queryset.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            return None
+
+    def collect(self, serializer, data):
+        """
+        Collects the primary keys of the relations of the serializer, and of its nested serializers
+        """
+        if not isinstance(data, Mapping):
+            return
+        for field in serializer.fields.values():
+            value = data.get(field.field_name)
+            if field.read_only or value is None:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                for each in value if isinstance(value, list) else []:
+                    self.collect(field.child, each)
+                continue
+            if isinstance(field, serializers.Serializer):
+                self.collect(field, value)
+                continue
+            if isinstance(field, ManyRelatedField):
+                field, values = field.child_relation, value if isinstance(value, list) else []
+            else:
+                values = [value]
+            queryset = self.get_queryset(field)
+            if queryset is None:
+                continue
+            self.querysets.setdefault(queryset.model, queryset)
+            self.pks[queryset.model].update(
+                pk for pk in (self.to_python(queryset, each) for each in values) if pk is not None
+            )
+
+    def load(self):
+        for model, pks in self.pks.items():
+            self.instances[model] = self.querysets[model].in_bulk(pks)
+
+    def lookup(self, field, pk) -> Tuple[bool, Optional[object]]:
+        """
+        Returns whether the primary key was loaded, and its instance (None if it does not exist)
+        """
+        queryset = self.get_queryset(field)
+        if queryset is None:
+            return False, None
+        pk = self.to_python(queryset, pk)
+        if pk is None or pk not in self.pks[queryset.model]:
+            return False, None
+        return True, self.instances[queryset.model].get(pk)
+
+
+class BatchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    Takes the instance from the related objects of the root serializer, instead of a query for each pk
+    """
+    def to_internal_value(self, data):
+        related_objects = getattr(self.root, 'related_objects', None)
+        if related_objects is not None:
+            loaded, instance = related_objects.lookup(self, data)
+            if loaded:
+                if instance is None:
+                    self.fail('does_not_exist', pk_value=data)
+                return instance
+        return super().to_internal_value(data)
+
+
+class RelatedObjectsSerializerMixin(object):
+    """
+    Resolves the primary keys of all the relations of the payload, including the nested serializers,
+    with one query per model
+
+    The instances are also available to the permission checks of the mutations, see `get_related`.
+    """
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+
+    @property
+    def related_objects(self) -> RelatedObjects:
+        if self.parent is not None:
+            return getattr(self.root, 'related_objects', None)
+        if getattr(self, '_related_objects', None) is None:
+            self._related_objects = RelatedObjects()
+            self._related_objects.collect(self, getattr(self, 'initial_data', None))
+            self._related_objects.load()
+        return self._related_objects
+
+    def get_related(self, field_name: str):
+        """
+        Instance of the relation in the payload, None if missing or it does not exist
+        """
+        field = self.fields[field_name]
+        pk = self.initial_data.get(field_name)
+        if pk is None:
+            return None
+        try:
+            return field.to_internal_value(pk)
+        except serializers.ValidationError:
+            return None
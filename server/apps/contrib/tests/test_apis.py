@@ -0,0 +1,404 @@
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import graphene
+
+from django.core import management
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from mock import patch
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from apps.contrib.models import PersistedQuery
+from helix.schema import schema
+from helix.views import CustomGraphQLView
+from utils.backends import document_backend, get_query_hash
+from utils.dataloaders import get_dataloader
+from utils.executors import ConcurrentExecutor
+from utils.factories import CountryFactory
+from utils.instrumentation import RequestTimings, archive_metrics, metrics_registry
+from utils.middleware import TimingMiddleware
+from utils.replicas import PRIMARY_COOKIE, choose_replica
+from utils.tests import HelixGraphQLTestCase, HelixTestCase
+
+
+class TestPersistedQuery(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.user = self.create_user()
+        self.me_query = '''
+            query MeQuery {
+                me {
+                    email
+                }
+            }
+        '''
+        self.me_query_hash = get_query_hash(self.me_query)
+
+    def persisted_query(self, query_hash):
+        return self._client.post(
+            self.GRAPHQL_URL,
+            json.dumps({
+                'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': query_hash}},
+            }),
+            content_type='application/json',
+        )
+
+    def test_register_and_export_manifest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = os.path.join(directory, 'manifest.json')
+            with open(manifest, 'w') as fp:
+                json.dump({self.me_query_hash: self.me_query}, fp)
+            management.call_command('persisted_queries', 'register', manifest)
+            self.assertEqual(PersistedQuery.get_query(self.me_query_hash), self.me_query)
+
+            exported = os.path.join(directory, 'exported.json')
+            management.call_command('persisted_queries', 'export', exported)
+            with open(exported) as fp:
+                self.assertEqual(json.load(fp), {self.me_query_hash: self.me_query})
+
+    def test_register_rejects_hash_mismatch(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as fp:
+            json.dump({'abc': self.me_query}, fp)
+            fp.flush()
+            with self.assertRaises(management.CommandError):
+                management.call_command('persisted_queries', 'register', fp.name)
+        self.assertFalse(PersistedQuery.objects.exists())
+
+    def test_execute_persisted_query(self):
+        PersistedQuery.objects.create(query=self.me_query)
+        self.force_login(self.user)
+        response = self.persisted_query(self.me_query_hash)
+
+        content = json.loads(response.content)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(content['data']['me']['email'], self.user.email)
+
+    def test_unknown_persisted_query(self):
+        response = self.persisted_query(get_query_hash('query { me { id } }'))
+
+        content = json.loads(response.content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(content['errors'][0]['message'], 'PersistedQueryNotFound')
+
+    def test_document_is_parsed_once(self):
+        document = document_backend.document_from_string(schema, self.me_query)
+        self.assertIs(document_backend.document_from_string(schema, self.me_query), document)
+
+        invalid = document_backend.document_from_string(schema, 'query { unknownField }')
+        self.assertTrue(invalid.execute().invalid)
+
+
+class TestQueryCost(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.nested_query = '''
+            query NestedQuery($pageSize: Int) {
+                countryList(pageSize: $pageSize) {
+                    results {
+                        entries(pageSize: $pageSize) {
+                            results {
+                                id
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+
+    def test_query_cost_in_extensions(self):
+        response = self.query(self.nested_query, variables={'pageSize': 10})
+
+        content = json.loads(response.content)
+        self.assertResponseNoErrors(response)
+        # 10 countries, each with 10 entries
+        self.assertEqual(content['extensions']['cost']['requestedQueryCost'], 10 + 10 * 10)
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=100)
+    def test_query_over_budget_is_rejected(self):
+        response = self.query(self.nested_query, variables={'pageSize': 10})
+
+        content = json.loads(response.content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the maximum allowed cost', content['errors'][0]['message'])
+        self.assertNotIn('data', content)
+        self.assertEqual(content['extensions']['cost']['requestedQueryCost'], 110)
+
+    @override_settings(GRAPHQL_MAX_QUERY_DEPTH=3)
+    def test_query_depth_is_limited(self):
+        # the documents are cached along with their validation
+        document_backend.documents.clear()
+        response = self.query(self.nested_query, variables={'pageSize': 10})
+
+        content = json.loads(response.content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the maximum allowed depth', content['errors'][0]['message'])
+        document_backend.documents.clear()
+
+
+@override_settings(GRAPHQL_INSTRUMENTATION_SAMPLE_RATE=1, METRICS_TOKEN='secret')
+class TestInstrumentation(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        metrics_registry.clear()
+        self.user = self.create_user()
+        self.me_query = '''
+            query MeQuery {
+                me {
+                    email
+                }
+            }
+        '''
+
+    def test_server_timing_and_metrics(self):
+        self.force_login(self.user)
+        response = self.query(self.me_query)
+
+        self.assertResponseNoErrors(response)
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertIn('desc="me"', response['Server-Timing'])
+
+        response = self._client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('helix_graphql_requests_total{operation="MeQuery"} 1', content)
+        self.assertIn('helix_graphql_resolver_calls_total{operation="MeQuery",path="me"} 1', content)
+
+    def test_metrics_of_all_the_workers(self):
+        self.force_login(self.user)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.assertResponseNoErrors(self.query(self.me_query))
+            # written by another worker, then archived once it exited
+            with open(os.path.join(directory, '1.json'), 'w') as file:
+                json.dump({'operations': [[['MeQuery'], 2, 0.2, 4, 0.1]], 'fields': []}, file)
+            response = self._client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertIn('helix_graphql_requests_total{operation="MeQuery"} 3', response.content.decode())
+
+            archive_metrics(directory, 1)
+            self.assertFalse(os.path.exists(os.path.join(directory, '1.json')))
+            response = self._client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertIn('helix_graphql_requests_total{operation="MeQuery"} 3', response.content.decode())
+
+    def test_metrics_requires_token(self):
+        response = self._client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(GRAPHQL_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.query(self.me_query)
+
+        self.assertResponseNoErrors(response)
+        self.assertNotIn('Server-Timing', response)
+
+
+# the resolvers wait for each other, so the test fails (BrokenBarrierError) if they do not overlap
+BARRIER_TIMEOUT = 10
+
+
+def wait_for_each_other(barrier):
+    if barrier is not None:
+        barrier.wait()
+
+
+def execute_sql(context, count):
+    # as the execute wrappers of the connections
+    if context.timings is None:
+        return
+    for _ in range(count):
+        context.timings(lambda *args: None, 'SELECT 1', None, False, {})
+
+
+class BarrierDataLoader(DataLoader):
+    def __init__(self, name, barrier, *args, **kwargs):
+        self.name = name
+        self.barrier = barrier
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        wait_for_each_other(self.barrier)
+        return Promise.resolve([f'{self.name}{key}:{threading.current_thread().name}' for key in keys])
+
+
+class BarrierType(graphene.ObjectType):
+    first = graphene.String()
+    second = graphene.String()
+
+    def resolve_first(root, info):
+        return get_dataloader(info, BarrierDataLoader, 'first', info.context.barrier).load(root)
+
+    def resolve_second(root, info):
+        return get_dataloader(info, BarrierDataLoader, 'second', info.context.barrier).load(root)
+
+
+class BarrierQuery(graphene.ObjectType):
+    one = graphene.Field(BarrierType)
+    two = graphene.Field(BarrierType)
+
+    def resolve_one(root, info):
+        wait_for_each_other(info.context.barrier)
+        execute_sql(info.context, 1)
+        return 1
+
+    def resolve_two(root, info):
+        wait_for_each_other(info.context.barrier)
+        execute_sql(info.context, 2)
+        return 2
+
+
+@override_settings(GRAPHQL_EXECUTOR_THREADS=4)
+class TestConcurrentExecutor(HelixTestCase):
+    def execute(self, barrier=None, timings=None):
+        context = SimpleNamespace(barrier=barrier, timings=timings)
+        context.graphql_executor = ConcurrentExecutor(context)
+        return graphene.Schema(query=BarrierQuery).execute(
+            '{ one { first second } two { first second } }',
+            context=context,
+            executor=context.graphql_executor,
+            middleware=[TimingMiddleware()],
+        )
+
+    def test_root_fields_and_batches_run_concurrently(self):
+        # reached by the two root fields, then by the batches of the two loaders
+        result = self.execute(threading.Barrier(2, timeout=BARRIER_TIMEOUT))
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['one']['first'].split(':')[0], 'first1')
+        self.assertEqual(result.data['two']['second'].split(':')[0], 'second2')
+        self.assertTrue(result.data['one']['first'].split(':')[1].startswith('graphql'))
+        # the keys of each loader are still batched together
+        self.assertEqual(result.data['one']['first'].split(':')[1], result.data['two']['first'].split(':')[1])
+
+    def test_sql_is_recorded_for_the_field_of_its_thread(self):
+        timings = RequestTimings()
+        result = self.execute(threading.Barrier(2, timeout=BARRIER_TIMEOUT), timings)
+        self.assertIsNone(result.errors)
+        self.assertEqual(timings.sql_count, 3)
+        self.assertEqual(timings.fields['one'].sql_count, 1)
+        self.assertEqual(timings.fields['two'].sql_count, 2)
+
+    @override_settings(GRAPHQL_EXECUTOR_THREADS=0)
+    def test_without_threads(self):
+        result = self.execute()
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['one']['first'], f'first1:{threading.current_thread().name}')
+
+
+@override_settings(READ_REPLICAS=['default'])
+class TestReadReplicas(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.user = self.create_user()
+        self.list_query = '{ countryList { totalCount } }'
+        self.login_query = '''
+            mutation Login($email: String!, $password: String!) {
+                login(input: {email: $email, password: $password}) {
+                    errors {
+                        field
+                    }
+                }
+            }
+        '''
+
+    @patch('utils.middleware.choose_replica', return_value='default')
+    def test_queries_are_routed_to_a_replica(self, choose):
+        self.assertResponseNoErrors(self.query(self.list_query))
+        choose.assert_called_once()
+        # me reads from the primary
+        self.query('{ me { email } countryList { totalCount } }')
+        choose.assert_called_once()
+
+    @override_settings(LIST_COUNT_STRATEGY='cached')
+    @patch('utils.middleware.choose_replica', return_value='default')
+    def test_counts_are_not_cached_from_a_lagging_replica(self, choose):
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.assertResponseNoErrors(self.query(self.list_query))
+            return len([each for each in context.captured_queries if 'COUNT(' in each['sql']])
+
+        CountryFactory.create()
+        # written within REPLICA_MAX_LAG, the replica could miss it
+        self.assertEqual(count_queries(), 1)
+        self.assertEqual(count_queries(), 1)
+        with override_settings(REPLICA_MAX_LAG=0):
+            self.assertEqual(count_queries(), 1)
+            self.assertEqual(count_queries(), 0)
+
+    @patch('utils.middleware.choose_replica', return_value='default')
+    def test_session_is_pinned_to_the_primary_after_a_write(self, choose):
+        response = self.query(self.login_query, variables={'email': self.user.email,
+                                                           'password': self.user.raw_password})
+        self.assertResponseNoErrors(response)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        choose.assert_not_called()
+        self.query(self.list_query)
+        choose.assert_not_called()
+        # once the window is over
+        self._client.cookies.pop(PRIMARY_COOKIE)
+        response = self.query(self.list_query)
+        choose.assert_called_once()
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_lagging_replicas_are_not_used(self):
+        with patch('utils.replicas.get_replica_lag', return_value=0):
+            self.assertEqual(choose_replica(), 'default')
+        with patch('utils.replicas.get_replica_lag', return_value=60):
+            self.assertIsNone(choose_replica())
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE_TIMEOUT=300)
+class TestResponseCache(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        CountryFactory.create()
+        self.list_query = '{ countryList { totalCount results { id name } } }'
+
+    def execute(self):
+        return patch.object(CustomGraphQLView, 'execute_graphql_request', autospec=True,
+                            side_effect=CustomGraphQLView.execute_graphql_request)
+
+    def test_cached_until_a_write(self):
+        with self.execute() as execute:
+            first = self.query(self.list_query)
+            self.assertResponseNoErrors(first)
+            # same normalized query
+            second = self.query(' '.join(self.list_query.split()).replace('{ ', '{'))
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(execute.call_count, 1)
+            CountryFactory.create()
+            content = self.query(self.list_query).json()
+            self.assertEqual(execute.call_count, 2)
+            self.assertEqual(content['data']['countryList']['totalCount'], 2)
+
+    def test_cached_per_role(self):
+        with self.execute() as execute:
+            self.query(self.list_query)
+            self.force_login(self.create_user())
+            self.query(self.list_query)
+            self.assertEqual(execute.call_count, 2)
+
+    def test_other_fields_are_not_cached(self):
+        with self.execute() as execute:
+            self.query('{ me { email } countryList { totalCount } }')
+            self.query('{ me { email } countryList { totalCount } }')
+            self.assertEqual(execute.call_count, 2)
+
+    def test_permission_flags_are_not_cached(self):
+        query = '{ countryList { results { entries { results { id canEdit canDelete } } } } }'
+        self.force_login(self.create_user())
+        with self.execute() as execute:
+            self.assertResponseNoErrors(self.query(query))
+            self.query(query)
+            self.assertEqual(execute.call_count, 2)
+
+    def test_etag(self):
+        response = self._client.get(self.GRAPHQL_URL, {'query': self.list_query}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self._client.get(self.GRAPHQL_URL, {'query': self.list_query},
+                                    HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        CountryFactory.create()
+        response = self._client.get(self.GRAPHQL_URL, {'query': self.list_query},
+                                    HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,231 @@
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.storage import Storage
+from django.db import connections, transaction
+from django.db.models.deletion import Collector
+from django.test import override_settings
+from django.utils import timezone
+from mock import patch
+
+from apps.contrib.models import Job
+from apps.country.models import Country
+from apps.entry.models import EntryFigureAggregate, Figure
+from utils.counts import PendingTableVersions, get_count_cache_key
+from utils.db import ConnectionPool, PoolTimeout, check_connections, close_old_connections, mark_connections_idle
+from utils.factories import CountryFactory, EventFactory
+from utils.file_urls import get_cache_key, get_file_urls, get_local_cache
+from utils.jobs import claim_job, enqueue, job, run_next_job
+from utils.tests import HelixTestCase
+
+CALLS = []
+
+
+@job('tests.record')
+def record(value):
+    CALLS.append(value)
+    return {'value': value}
+
+
+@job('tests.fail')
+def fail():
+    raise ValueError('failed')
+
+
+@override_settings(JOBS_EAGER=False)
+class TestJobs(HelixTestCase):
+    def setUp(self) -> None:
+        CALLS.clear()
+
+    def test_jobs_run_by_priority(self):
+        record.enqueue(value='low', priority=-1)
+        enqueue('tests.record', value='default')
+        record.enqueue(value='high', priority=10)
+        record.enqueue(value='later', priority=20, run_at=timezone.now() + timedelta(hours=1))
+        while run_next_job():
+            pass
+        self.assertEqual(CALLS, ['high', 'default', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.STATUS.COMPLETED).count(), 3)
+        self.assertEqual(Job.objects.get(kwargs__value='high').result, {'value': 'high'})
+
+    def test_failed_job_is_retried_with_backoff(self):
+        instance = fail.enqueue(max_attempts=2)
+        run_next_job()
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, Job.STATUS.PENDING)
+        self.assertEqual(instance.attempts, 1)
+        self.assertGreater(instance.run_at, timezone.now())
+        self.assertIn('failed', instance.error)
+        # not yet
+        self.assertIsNone(claim_job())
+        Job.objects.filter(id=instance.id).update(run_at=timezone.now())
+        run_next_job()
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, Job.STATUS.FAILED)
+        self.assertEqual(instance.attempts, 2)
+
+    def test_stale_running_job_is_claimed_again(self):
+        instance = record.enqueue(value='stale')
+        Job.objects.filter(id=instance.id).update(
+            status=Job.STATUS.RUNNING,
+            attempts=1,
+            started_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(claim_job().id, instance.id)
+
+    def test_eager_jobs(self):
+        with self.settings(JOBS_EAGER=True):
+            instance = record.enqueue(value='eager')
+        self.assertEqual(instance.status, Job.STATUS.COMPLETED)
+        self.assertEqual(CALLS, ['eager'])
+
+
+class SignedStorage(Storage):
+    querystring_auth = True
+    bucket_name = 'bucket'
+
+    def __init__(self):
+        self.signed = []
+
+    def url(self, name):
+        self.signed.append(name)
+        return f'https://{self.bucket_name}/{name}?signature={len(self.signed)}'
+
+
+class TestFileUrls(HelixTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        get_local_cache().clear()
+        self.storage = SignedStorage()
+
+    def test_urls_are_signed_once(self):
+        urls = get_file_urls(['a.pdf', 'b.pdf', 'a.pdf', None], self.storage)
+        self.assertEqual(set(urls), {'a.pdf', 'b.pdf'})
+        self.assertEqual(sorted(self.storage.signed), ['a.pdf', 'b.pdf'])
+        self.assertEqual(get_file_urls(['a.pdf', 'b.pdf'], self.storage), urls)
+        self.assertEqual(len(self.storage.signed), 2)
+
+    def test_shared_cache_is_used_by_other_processes(self):
+        urls = get_file_urls(['a.pdf'], self.storage)
+        # as seen by another process, with an empty local cache
+        get_local_cache().clear()
+        self.assertEqual(get_file_urls(['a.pdf'], self.storage), urls)
+        self.assertEqual(len(self.storage.signed), 1)
+        self.assertEqual(cache.get(get_cache_key(self.storage, 'a.pdf')), urls['a.pdf'])
+
+    def test_cache_key_is_stable(self):
+        self.assertEqual(
+            get_cache_key(self.storage, 'a.pdf'),
+            'file_url_' + hashlib.sha256(
+                b'apps.contrib.tests.test_models.SignedStorage:bucket:a.pdf'
+            ).hexdigest()
+        )
+
+
+class TestConnectionHealthCheck(HelixTestCase):
+    def test_idle_connections_are_checked(self):
+        connection = connections['default']
+        connection.ensure_connection()
+        with override_settings(DB_HEALTH_CHECK_IDLE=0), \
+                patch.object(connection, 'in_atomic_block', False), \
+                patch.object(connection, 'is_usable', return_value=False) as is_usable, \
+                patch.object(connection, 'close') as close:
+            check_connections()
+            # not marked idle by a finished request
+            is_usable.assert_not_called()
+            mark_connections_idle()
+            check_connections()
+            is_usable.assert_called_once()
+            close.assert_called_once()
+
+    def test_obsolete_connections_are_closed_outside_transactions(self):
+        connection = connections['default']
+        with patch.object(connection, 'close_if_unusable_or_obsolete') as close:
+            # the transaction of the test
+            close_old_connections()
+            close.assert_not_called()
+            with patch.object(connection, 'in_atomic_block', False):
+                close_old_connections()
+            close.assert_called_once()
+
+
+class FakeConnection:
+    closed = False
+    autocommit = True
+
+    def get_transaction_status(self):
+        return 0
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(HelixTestCase):
+    def get_pool(self, **kwargs):
+        return ConnectionPool(**dict(
+            dict(min_size=1, max_size=2, timeout=0.1, max_idle=60, max_lifetime=60, check_idle=60),
+            **kwargs
+        ))
+
+    def test_checkout_is_bounded(self):
+        pool = self.get_pool()
+        first, second = pool.get(FakeConnection), pool.get(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.get(FakeConnection)
+        # waits for a returned connection
+        threading.Timer(0.02, pool.put, [first]).start()
+        self.assertIs(pool.get(FakeConnection), first)
+        self.assertEqual(pool.get_stats()['timeouts'], 1)
+        self.assertEqual(pool.get_stats()['in_use'], 2)
+
+    def test_closed_and_idle_connections_are_discarded(self):
+        pool = self.get_pool(max_idle=0)
+        first, second = pool.get(FakeConnection), pool.get(FakeConnection)
+        pool.put(first)
+        pool.put(second)
+        # the idle connections beyond min_size are closed
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.get_stats()['size'], 1)
+        second.closed = True
+        # a closed connection is replaced on the checkout
+        self.assertIsNot(pool.get(FakeConnection), second)
+        self.assertEqual(pool.get_stats()['created'], 3)
+
+
+class TestTableVersions(HelixTestCase):
+    def test_versions_are_bumped_once_per_model_and_transaction(self):
+        connection = transaction.get_connection()
+
+        def on_commit(func, using=None):
+            # run on commit, instead of immediately as in the other tests
+            connection.on_commit(func)
+
+        with patch('django.db.transaction.on_commit', side_effect=on_commit), \
+                patch('utils.counts._set_table_versions') as set_versions:
+            with transaction.atomic():
+                CountryFactory.create_batch(3)
+                bumped = [models for (models,), _ in set_versions.call_args_list if Country in models]
+                self.assertEqual(len(bumped), 1)
+                pending = [func for _, func in connection.run_on_commit if isinstance(func, PendingTableVersions)]
+                self.assertEqual(len(pending), 1)
+                self.assertIn(Country, pending[0].models)
+
+    def test_unversioned_models_are_fast_deleted(self):
+        collector = Collector(using='default')
+        self.assertTrue(collector.can_fast_delete(Job.objects.all()))
+        self.assertTrue(collector.can_fast_delete(EntryFigureAggregate.objects.all()))
+        self.assertFalse(collector.can_fast_delete(Country.objects.all()))
+
+    def test_count_keys_follow_the_lookups_of_the_filters(self):
+        country = CountryFactory.create()
+        event = EventFactory.create()
+        qs = Figure.objects.filter(entry__event__countries=country)
+        key, _ = get_count_cache_key(qs)
+        # two hops away from the figures
+        event.countries.add(country)
+        self.assertNotEqual(get_count_cache_key(qs)[0], key)
@@ -2,13 +2,16 @@ import graphene
 from graphene.types.utils import get_type
 from graphene_django_extras import (
     DjangoObjectType, 
-    PageGraphqlPagination, 
     DjangoObjectField
 )
 
 from apps.contact.schema import ContactListType
 from apps.country.models import Country, CountryRegion, ContextualUpdate, Summary
+from apps.entry.models import CountryFigureAggregate
+from utils.dataloaders import get_dataloader, load_foreign_key, load_reverse_foreign_key, \
+    LatestReverseForeignKeyDataLoader, SumDataLoader
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 
 
 class CountryRegionType(DjangoObjectType):
@@ -24,6 +27,12 @@ class ContextualUpdateType(DjangoObjectType):
     created_by = graphene.Field('apps.users.schema.UserType')
     last_modified_by = graphene.Field('apps.users.schema.UserType')
 
+    def resolve_created_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'created_by')
+
+    def resolve_last_modified_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'last_modified_by')
+
 
 class ContextualUpdateListType(CustomDjangoListObjectType):
     class Meta:
@@ -41,6 +50,12 @@ class SummaryType(DjangoObjectType):
     last_modified_by = graphene.Field('apps.users.schema.UserType')
     created_by = graphene.Field('apps.users.schema.UserType')
 
+    def resolve_created_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'created_by')
+
+    def resolve_last_modified_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'last_modified_by')
+
 
 class SummaryListType(CustomDjangoListObjectType):
     class Meta:
@@ -82,6 +97,23 @@ class CountryType(DjangoObjectType):
         pagination=PageGraphqlPagination(
             page_size_query_param='pageSize'
         ), accessor='entries'))
+    total_figures = graphene.Field(graphene.Int)
+    figure_aggregates = graphene.List('apps.entry.schema.FigureAggregateType')
+
+    def resolve_total_figures(root, info, **kwargs):
+        return get_dataloader(info, SumDataLoader, CountryFigureAggregate, 'country', 'total_figures').load(root.pk)
+
+    def resolve_figure_aggregates(root, info, **kwargs):
+        return load_reverse_foreign_key(info, root, CountryFigureAggregate, 'country')
+
+    def resolve_region(root, info, **kwargs):
+        return load_foreign_key(info, root, 'region')
+
+    def resolve_last_summary(root, info, **kwargs):
+        return get_dataloader(info, LatestReverseForeignKeyDataLoader, Summary, 'country').load(root.pk)
+
+    def resolve_last_contextual_update(root, info, **kwargs):
+        return get_dataloader(info, LatestReverseForeignKeyDataLoader, ContextualUpdate, 'country').load(root.pk)
 
     @staticmethod
     def get_queryset(queryset, info):
@@ -1,9 +1,12 @@
 import django_filters
 
 from apps.crisis.models import Crisis
+from utils.filters import SearchFilter
 
 
 class CrisisFilter(django_filters.FilterSet):
+    search = SearchFilter()
+
     class Meta:
         model = Crisis
         fields = {
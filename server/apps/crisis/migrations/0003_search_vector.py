@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from utils.search import get_search_vector_sql, get_trigram_index_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0002_trigram_extension'),
+        ('crisis', '0002_auto_20201019_0758'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crisis',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='crisis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='crisis_cris_search__fbf4f7_gin'),
+        ),
+        migrations.RunSQL(*get_search_vector_sql('crisis_crisis', [('name', 'A'), ('crisis_narrative', 'B')])),
+        migrations.RunSQL(*get_trigram_index_sql('crisis_crisis', 'name')),
+    ]
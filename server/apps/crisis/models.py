@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django_enumfield import enum
@@ -20,6 +22,11 @@ class Crisis(MetaInformationAbstractModel, models.Model):
     crisis_narrative = models.TextField(_('Crisis Narrative/Summary'))
     countries = models.ManyToManyField('country.Country', verbose_name=_('Countries'),
                                        related_name='crises')
+    # updated by a database trigger (see utils/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'])]
 
     def __str__(self):
         return self.name
@@ -1,22 +1,34 @@
 import graphene
-from graphene_django_extras import DjangoObjectType, PageGraphqlPagination, DjangoObjectField
+from graphene_django_extras import DjangoObjectType, DjangoObjectField
 
 from apps.crisis.enums import CrisisTypeGrapheneEnum
 from apps.crisis.filters import CrisisFilter
 from apps.crisis.models import Crisis
+from apps.entry.models import CrisisFigureAggregate
 from apps.event.schema import EventListType
+from utils.dataloaders import get_dataloader, load_reverse_foreign_key, SumDataLoader
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 
 
 class CrisisType(DjangoObjectType):
     class Meta:
         model = Crisis
+        exclude_fields = ('search_vector',)
 
     crisis_type = graphene.Field(CrisisTypeGrapheneEnum)
     events = DjangoPaginatedListObjectField(EventListType,
                                             pagination=PageGraphqlPagination(
                                                 page_size_query_param='pageSize'
                                             ))
+    total_figures = graphene.Field(graphene.Int)
+    figure_aggregates = graphene.List('apps.entry.schema.FigureAggregateType')
+
+    def resolve_total_figures(root, info, **kwargs):
+        return get_dataloader(info, SumDataLoader, CrisisFigureAggregate, 'crisis', 'total_figures').load(root.pk)
+
+    def resolve_figure_aggregates(root, info, **kwargs):
+        return load_reverse_foreign_key(info, root, CrisisFigureAggregate, 'crisis')
 
 
 class CrisisListType(CustomDjangoListObjectType):
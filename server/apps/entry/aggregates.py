@@ -0,0 +1,247 @@
+from collections import defaultdict
+from typing import Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear
+
+from apps.entry.models import (
+    Entry,
+    Figure,
+    EntryFigureAggregate,
+    EventFigureAggregate,
+    CrisisFigureAggregate,
+    CountryFigureAggregate,
+)
+from apps.event.models import Event
+from utils.counts import bump_table_version
+from utils.jobs import enqueue
+
+# (aggregate model, owner field, lookup from the figure to the owner)
+AGGREGATES = (
+    (EntryFigureAggregate, 'entry', 'entry'),
+    (EventFigureAggregate, 'event', 'entry__event'),
+    (CrisisFigureAggregate, 'crisis', 'entry__event__crisis'),
+    (CountryFigureAggregate, 'country', 'entry__event__countries'),
+)
+
+
+def get_owners(entry_ids: Iterable[int]) -> dict:
+    """
+    Returns the owners of the aggregates for each entry
+    eg. {entry_id: {'entry': [entry_id], 'event': [event_id], 'crisis': [crisis_id], 'country': [...]}}
+    """
+    entries = list(Entry.objects.filter(id__in=entry_ids).values_list('id', 'event_id', 'event__crisis_id'))
+    countries = defaultdict(list)
+    for event_id, country_id in Event.countries.through.objects.filter(
+        event_id__in={event_id for _, event_id, _ in entries}
+    ).values_list('event_id', 'country_id'):
+        countries[event_id].append(country_id)
+    return {
+        entry_id: dict(entry=[entry_id], event=[event_id], crisis=[crisis_id], country=countries[event_id])
+        for entry_id, event_id, crisis_id in entries
+    }
+
+
+def _apply_deltas(deltas: dict):
+    emptied = defaultdict(set)
+    # deterministic order of the row locks, for the concurrent updates
+    for key in sorted(deltas, key=lambda key: (key[0]._meta.label, *key[1:])):
+        model, field, owner_id, term, role, year = key
+        total, count = deltas[key]
+        if not total and not count:
+            continue
+        lookup = {f'{field}_id': owner_id, 'term': term, 'role': role, 'year': year}
+        updated = model.objects.filter(**lookup).update(
+            total_figures=F('total_figures') + total,
+            figures_count=F('figures_count') + count,
+        )
+        if not updated and count > 0:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**lookup, total_figures=total, figures_count=count)
+            except IntegrityError:
+                # created by a concurrent transaction
+                model.objects.filter(**lookup).update(
+                    total_figures=F('total_figures') + total,
+                    figures_count=F('figures_count') + count,
+                )
+        if count < 0:
+            emptied[(model, field)].add(owner_id)
+    for (model, field), owner_ids in emptied.items():
+        model.objects.filter(**{f'{field}_id__in': owner_ids}, figures_count__lte=0).delete()
+
+
+def update_figure_aggregates(added: List[Figure] = (), removed: List[Figure] = (), removed_owners: dict = None):
+    """
+    Adds the added and subtracts the removed figures from the aggregates of their
+    entry, event, crisis and countries
+
+    removed_owners are the owners of the removed figures (see get_owners) when they are no longer
+    those of their entry, eg. its previous event.
+    """
+    figures = [(figure, 1) for figure in added] + [(figure, -1) for figure in removed]
+    if not figures:
+        return
+    owners = get_owners({figure.entry_id for figure, _ in figures})
+    deltas = defaultdict(lambda: [0, 0])
+    for figure, sign in figures:
+        figure_owners = removed_owners if sign < 0 and removed_owners is not None else owners
+        for model, field, _ in AGGREGATES:
+            for owner_id in figure_owners.get(figure.entry_id, {}).get(field, []):
+                delta = deltas[(model, field, owner_id, int(figure.term), int(figure.role), figure.start_date.year)]
+                delta[0] += sign * figure.total_figures
+                delta[1] += sign
+    with transaction.atomic():
+        _apply_deltas(deltas)
+    # updated without the signals
+    for model, _, _ in AGGREGATES:
+        bump_table_version(model)
+
+
+def rebuild_figure_aggregates(field: str = None, owner_ids: Iterable[int] = None):
+    """
+    Recalculates the aggregates from the figures, of all the owners or only of the given ones
+    """
+    for model, owner_field, lookup in AGGREGATES:
+        if field and field != owner_field:
+            continue
+        aggregates = model.objects.all()
+        figures = Figure.objects.annotate(owner=F(lookup)).filter(owner__isnull=False)
+        if owner_ids is not None:
+            aggregates = aggregates.filter(**{f'{owner_field}_id__in': owner_ids})
+            figures = figures.filter(owner__in=owner_ids)
+        figures = figures.order_by().values(
+            'owner', 'term', 'role', year=ExtractYear('start_date'),
+        ).annotate(
+            total=Sum('total_figures'),
+            count=Count('id'),
+        )
+        with transaction.atomic():
+            aggregates.delete()
+            model.objects.bulk_create([
+                model(**{f'{owner_field}_id': each['owner']},
+                      term=each['term'],
+                      role=each['role'],
+                      year=each['year'],
+                      total_figures=each['total'],
+                      figures_count=each['count'])
+                for each in figures.iterator()
+            ], batch_size=1000)
+        bump_table_version(model)
+
+
+def rebuild_event_aggregates(event_ids: Iterable[int]):
+    """
+    Recalculates the aggregates of the events with their crises and countries
+    """
+    event_ids = [each for each in set(event_ids) if each is not None]
+    if not event_ids:
+        return
+    crisis_ids = Event.objects.filter(id__in=event_ids).values_list('crisis_id', flat=True)
+    country_ids = Event.countries.through.objects.filter(
+        event_id__in=event_ids
+    ).values_list('country_id', flat=True)
+    rebuild_figure_aggregates('event', event_ids)
+    rebuild_figure_aggregates('crisis', set(crisis_ids))
+    rebuild_figure_aggregates('country', set(country_ids))
+
+
+# receivers, connected in apps.entry.apps
+# the rebuilds of the crises and countries of the events run in the background (see apps/entry/jobs.py)
+
+class DeletedEntries:
+    """
+    Entries deleted by the transaction, their figures are subtracted at once by entry_pre_delete
+
+    Registered as a callback of the transaction (doing nothing), so it is dropped with it.
+    """
+    def __init__(self):
+        self.ids = set()
+
+    def __call__(self):
+        pass
+
+
+def get_deleted_entry_ids() -> set:
+    connection = transaction.get_connection()
+    for _, func in connection.run_on_commit:
+        if isinstance(func, DeletedEntries):
+            return func.ids
+    deleted = DeletedEntries()
+    # not transaction.on_commit, which runs the callbacks immediately in the tests
+    connection.on_commit(deleted)
+    return deleted.ids
+
+
+def get_aggregated_figures(entry_id: int) -> List[Figure]:
+    return list(Figure.objects.filter(entry_id=entry_id).only(
+        'entry_id', 'term', 'role', 'start_date', 'total_figures',
+    ))
+
+
+def figure_post_delete(sender, instance: Figure, **kwargs):
+    if instance.entry_id in get_deleted_entry_ids():
+        return
+    update_figure_aggregates(removed=[instance])
+
+
+def entry_pre_delete(sender, instance: Entry, **kwargs):
+    # sent in the transaction of the delete, before the figures are deleted one by one
+    update_figure_aggregates(removed=get_aggregated_figures(instance.pk))
+    get_deleted_entry_ids().add(instance.pk)
+
+
+def entry_post_delete(sender, instance: Entry, **kwargs):
+    get_deleted_entry_ids().discard(instance.pk)
+
+
+def entry_pre_save(sender, instance: Entry, **kwargs):
+    instance._previous_owners = None
+    if instance.pk:
+        previous_event_id = Entry.objects.filter(
+            pk=instance.pk
+        ).values_list('event_id', flat=True).first()
+        if previous_event_id is not None and previous_event_id != instance.event_id:
+            instance._previous_owners = get_owners([instance.pk])
+
+
+def entry_post_save(sender, instance: Entry, created: bool, **kwargs):
+    previous_owners = getattr(instance, '_previous_owners', None)
+    if not created and previous_owners:
+        # the figures of the entry move to the aggregates of its new event
+        figures = get_aggregated_figures(instance.pk)
+        update_figure_aggregates(added=figures, removed=figures, removed_owners=previous_owners)
+
+
+def event_pre_save(sender, instance: Event, **kwargs):
+    instance._previous_crisis_id = None
+    if instance.pk:
+        instance._previous_crisis_id = Event.objects.filter(
+            pk=instance.pk
+        ).values_list('crisis_id', flat=True).first()
+
+
+def event_post_save(sender, instance: Event, created: bool, **kwargs):
+    previous_crisis_id = getattr(instance, '_previous_crisis_id', None)
+    if not created and previous_crisis_id and previous_crisis_id != instance.crisis_id:
+        enqueue('entry.rebuild_figure_aggregates', field='crisis',
+                owner_ids=[previous_crisis_id, instance.crisis_id])
+
+
+def event_countries_changed(sender, instance, action: str, reverse: bool, pk_set: set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_country_ids = [instance.pk]
+        else:
+            instance._cleared_country_ids = list(instance.countries.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        country_ids = getattr(instance, '_cleared_country_ids', [])
+    elif action in ('post_add', 'post_remove'):
+        # reverse: country.events.add(...)
+        country_ids = [instance.pk] if reverse else pk_set
+    else:
+        return
+    if country_ids:
+        enqueue('entry.rebuild_figure_aggregates', field='country', owner_ids=list(country_ids))
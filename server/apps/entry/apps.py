@@ -1,5 +1,32 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 
 
 class EntryConfig(AppConfig):
     name = 'apps.entry'
+
+    def ready(self):
+        from apps.entry import aggregates
+        # registers the jobs
+        from apps.entry import jobs  # noqa: F401
+        from apps.entry.models import Entry, Figure
+        from apps.event.models import Event
+
+        # figure aggregates, the figure saves are handled in Figure.save
+        post_delete.connect(aggregates.figure_post_delete, sender=Figure,
+                            dispatch_uid='figure_aggregates_on_figure_delete')
+        # the figures of the deleted entries are subtracted at once
+        pre_delete.connect(aggregates.entry_pre_delete, sender=Entry,
+                           dispatch_uid='figure_aggregates_on_entry_pre_delete')
+        post_delete.connect(aggregates.entry_post_delete, sender=Entry,
+                            dispatch_uid='figure_aggregates_on_entry_delete')
+        pre_save.connect(aggregates.entry_pre_save, sender=Entry,
+                         dispatch_uid='figure_aggregates_on_entry_pre_save')
+        post_save.connect(aggregates.entry_post_save, sender=Entry,
+                          dispatch_uid='figure_aggregates_on_entry_save')
+        pre_save.connect(aggregates.event_pre_save, sender=Event,
+                         dispatch_uid='figure_aggregates_on_event_pre_save')
+        post_save.connect(aggregates.event_post_save, sender=Event,
+                          dispatch_uid='figure_aggregates_on_event_save')
+        m2m_changed.connect(aggregates.event_countries_changed, sender=Event.countries.through,
+                            dispatch_uid='figure_aggregates_on_event_countries_change')
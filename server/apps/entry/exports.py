@@ -0,0 +1,197 @@
+import csv
+import datetime
+from tempfile import TemporaryFile
+from typing import Iterable, Iterator, List
+
+import openpyxl
+from django.conf import settings
+from django.db.models import F, Func, IntegerField, Max
+from django.utils import timezone
+
+from apps.entry.filters import EntryFilter, FigureFilter
+from apps.entry.imports import ENUM_COLUMNS
+from apps.entry.models import Entry, Figure
+
+# size of the chunks of the xlsx file sent to the client
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """
+    File-like object returning what is written, for the csv writer
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows: Iterable[list]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _get_xlsx_value(value):
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        # excel does not support the timezones
+        return timezone.make_naive(value, timezone.utc)
+    return value
+
+
+def stream_xlsx(rows: Iterable[list]) -> Iterator[bytes]:
+    """
+    The write only workbook keeps the rows in a temporary file, the xlsx (zip) file is only
+    complete once saved, so it is sent after all the rows have been written
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append([_get_xlsx_value(value) for value in row])
+    with TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while chunk := file.read(XLSX_CHUNK_SIZE):
+            yield chunk
+
+
+WRITERS = {
+    'csv': (stream_csv, 'text/csv'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+class BaseExport:
+    """
+    Rows of the filtered queryset, read with a server side cursor
+
+    columns: (header, lookup of values_list)
+    """
+    model = None
+    filterset_class = None
+    columns = ()
+    name = None
+
+    def __init__(self, data: dict, request=None):
+        self.filterset = self.filterset_class(data, queryset=self.model.objects.all(), request=request)
+
+    def is_valid(self) -> bool:
+        return self.filterset.is_valid()
+
+    @property
+    def errors(self) -> dict:
+        return self.filterset.errors
+
+    def get_queryset(self):
+        queryset = self.filterset.qs
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return queryset
+
+    def get_header(self, queryset) -> List[str]:
+        return [header for header, _ in self.columns]
+
+    def get_row(self, values: tuple) -> list:
+        return [', '.join(value) if isinstance(value, list) else value for value in values]
+
+    def get_rows(self) -> Iterator[list]:
+        queryset = self.get_queryset()
+        yield self.get_header(queryset)
+        for values in queryset.values_list(
+            *[lookup for _, lookup in self.columns]
+        ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            yield self.get_row(values)
+
+
+class EntryExport(BaseExport):
+    model = Entry
+    filterset_class = EntryFilter
+    name = 'entries'
+    columns = (
+        ('id', 'id'),
+        ('url', 'url'),
+        ('article_title', 'article_title'),
+        ('source', 'source'),
+        ('publisher', 'publisher'),
+        ('publish_date', 'publish_date'),
+        ('source_methodology', 'source_methodology'),
+        ('source_excerpt', 'source_excerpt'),
+        ('source_breakdown', 'source_breakdown'),
+        ('event', 'event_id'),
+        ('event_name', 'event__name'),
+        ('idmc_analysis', 'idmc_analysis'),
+        ('methodology', 'methodology'),
+        ('tags', 'tags'),
+        ('created_at', 'created_at'),
+    )
+
+
+class FigureExport(BaseExport):
+    """
+    Same columns as the figure import, the age and strata disaggregations are flattened into
+    age_<n>_from, age_<n>_to, age_<n>_value and stratum_<n>_date, stratum_<n>_value columns
+    """
+    model = Figure
+    filterset_class = FigureFilter
+    name = 'figures'
+    columns = (
+        ('uuid', 'uuid'),
+        ('entry', 'entry_id'),
+        ('district', 'district'),
+        ('town', 'town'),
+        ('quantifier', 'quantifier'),
+        ('reported', 'reported'),
+        ('unit', 'unit'),
+        ('household_size', 'household_size'),
+        ('total_figures', 'total_figures'),
+        ('term', 'term'),
+        ('type', 'type'),
+        ('role', 'role'),
+        ('start_date', 'start_date'),
+        ('include_idu', 'include_idu'),
+        ('excerpt_idu', 'excerpt_idu'),
+        ('is_disaggregated', 'is_disaggregated'),
+        ('displacement_urban', 'displacement_urban'),
+        ('displacement_rural', 'displacement_rural'),
+        ('location_camp', 'location_camp'),
+        ('location_non_camp', 'location_non_camp'),
+        ('sex_male', 'sex_male'),
+        ('sex_female', 'sex_female'),
+        ('conflict', 'conflict'),
+        ('conflict_political', 'conflict_political'),
+        ('conflict_criminal', 'conflict_criminal'),
+        ('conflict_communal', 'conflict_communal'),
+        ('conflict_other', 'conflict_other'),
+        ('age_json', 'age_json'),
+        ('strata_json', 'strata_json'),
+    )
+
+    def get_header(self, queryset) -> List[str]:
+        # the number of flattened columns is the largest disaggregation of the exported figures
+        sizes = queryset.order_by().aggregate(
+            age=Max(Func(F('age_json'), function='cardinality', output_field=IntegerField())),
+            strata=Max(Func(F('strata_json'), function='cardinality', output_field=IntegerField())),
+        )
+        self.age_size = sizes['age'] or 0
+        self.strata_size = sizes['strata'] or 0
+        header = [header for header, _ in self.columns[:-2]]
+        for index in range(1, self.age_size + 1):
+            header.extend([f'age_{index}_from', f'age_{index}_to', f'age_{index}_value'])
+        for index in range(1, self.strata_size + 1):
+            header.extend([f'stratum_{index}_date', f'stratum_{index}_value'])
+        return header
+
+    def get_row(self, values: tuple) -> list:
+        *values, age_json, strata_json = values
+        row = [
+            ENUM_COLUMNS[header](value).name if header in ENUM_COLUMNS and value is not None else value
+            for (header, _), value in zip(self.columns, values)
+        ]
+        row[0] = str(row[0])
+        age_json = sorted(age_json or [], key=lambda each: each.get('age_from') or 0)
+        strata_json = sorted(strata_json or [], key=lambda each: each.get('date') or '')
+        for index in range(self.age_size):
+            each = age_json[index] if index < len(age_json) else {}
+            row.extend([each.get('age_from'), each.get('age_to'), each.get('value')])
+        for index in range(self.strata_size):
+            each = strata_json[index] if index < len(strata_json) else {}
+            row.extend([each.get('date'), each.get('value')])
+        return row
@@ -1,11 +1,23 @@
 import django_filters
 
-from apps.entry.models import Entry
+from apps.entry.models import Entry, Figure
+from utils.filters import SearchFilter
 
 
 class EntryFilter(django_filters.FilterSet):
+    search = SearchFilter()
+
     class Meta:
         model = Entry
         fields = {
             'article_title': ('icontains',),
         }
+
+
+class FigureFilter(django_filters.FilterSet):
+    class Meta:
+        model = Figure
+        fields = {
+            'unit': ('exact',),
+            'start_date': ('lte', 'gte'),
+        }
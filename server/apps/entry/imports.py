@@ -0,0 +1,263 @@
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import zipfile
+from itertools import islice
+from typing import Iterable, Iterator, List
+from uuid import UUID, uuid4
+
+import openpyxl
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest
+from django.utils.translation import gettext
+
+from apps.entry.aggregates import update_figure_aggregates
+from apps.entry.models import Entry, Figure
+from apps.entry.serializers import NestedFigureSerializer
+from utils.counts import bump_table_version
+from utils.error_types import ArrayNestedErrorType, CustomErrorType, serializer_error_to_error_types
+
+ENUM_COLUMNS = {
+    'quantifier': Figure.QUANTIFIER,
+    'unit': Figure.UNIT,
+    'term': Figure.TERM,
+    'type': Figure.TYPE,
+    'role': Figure.ROLE,
+}
+JSON_COLUMNS = ('age_json', 'strata_json')
+# flattened disaggregations of the exports (see apps/entry/exports.py), eg. age_1_from
+FLATTENED_COLUMNS = (
+    ('age_json', re.compile(r'^age_(\d+)_(from|to|value)$'), {'from': 'age_from', 'to': 'age_to'}),
+    ('strata_json', re.compile(r'^stratum_(\d+)_(date|value)$'), {}),
+)
+
+
+class InvalidImportFile(Exception):
+    pass
+
+
+class FigureImportSerializer(NestedFigureSerializer):
+    """
+    Same validation as the figures of an entry, the entries and the uniqueness of the uuids
+    are checked for a whole chunk by FigureImport
+    """
+    class Meta(NestedFigureSerializer.Meta):
+        extra_kwargs = {
+            'uuid': {'validators': []},
+        }
+
+
+def read_csv(file) -> Iterator[dict]:
+    yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig'))
+
+
+def read_xlsx(file) -> Iterator[dict]:
+    # read_only streams the rows of the sheet
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(each).strip() if each is not None else '' for each in next(rows, [])]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        workbook.close()
+
+
+READERS = {
+    '.csv': read_csv,
+    '.xlsx': read_xlsx,
+}
+
+
+def get_rows(file, name: str) -> Iterator[dict]:
+    """
+    Rows of the csv or xlsx file, with the snake_case figure fields as the header
+    """
+    reader = READERS.get(os.path.splitext(name or '')[1].lower())
+    if reader is None:
+        raise InvalidImportFile(gettext('Only %(extensions)s files can be imported.') % {
+            'extensions': ', '.join(READERS)
+        })
+    try:
+        yield from reader(file)
+    except (ValueError, KeyError, csv.Error, zipfile.BadZipFile) as e:
+        raise InvalidImportFile(gettext('The file could not be read: %(error)s') % {'error': e}) from e
+
+
+def _unflatten(row: dict) -> dict:
+    row = dict(row)
+    for column, pattern, names in FLATTENED_COLUMNS:
+        items = {}
+        for key in list(row):
+            match = pattern.match((key or '').strip())
+            if not match:
+                continue
+            value = row.pop(key)
+            if value is not None and value != '':
+                index, name = match.groups()
+                items.setdefault(int(index), {})[names.get(name, name)] = value
+        if items and not row.get(column):
+            row[column] = [items[index] for index in sorted(items)]
+    return row
+
+
+def clean_row(row: dict) -> dict:
+    """
+    Drops the empty cells, the enums may be given by their names (as in the graphql api),
+    the age and strata disaggregations as json or flattened as in the exports
+    """
+    data = {}
+    for key, value in _unflatten(row).items():
+        if not key:
+            continue
+        key = key.strip()
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        if isinstance(value, datetime.datetime):
+            value = value.date()
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if key in ENUM_COLUMNS and isinstance(value, str) and value in ENUM_COLUMNS[key].__members__:
+            value = ENUM_COLUMNS[key][value].value
+        if key in JSON_COLUMNS and isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        if key in JSON_COLUMNS and isinstance(value, list):
+            for each in value:
+                if isinstance(each, dict):
+                    # required by the disaggregation serializers
+                    each.setdefault('uuid', str(uuid4()))
+                    if isinstance(each.get('date'), datetime.datetime):
+                        each['date'] = each['date'].date()
+        data[key] = value
+    return data
+
+
+def _is_uuid(value) -> bool:
+    try:
+        UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+class FigureImport:
+    """
+    Creates the figures of the rows, validated and written by chunks
+
+    The rows are identified by their uuid (NOT_FOUND_<row number> without it) in the errors.
+    Unless partial, nothing is created when any row is invalid, otherwise the valid rows are kept and
+    a chunk failing on write is rolled back to its savepoint and reported.
+    """
+    def __init__(self, user, partial: bool = False, chunk_size: int = None):
+        self.user = user
+        self.partial = partial
+        self.chunk_size = chunk_size or settings.FIGURE_IMPORT_CHUNK_SIZE
+        self.created_count = 0
+        self.errors: List[ArrayNestedErrorType] = []
+        self.request = HttpRequest()
+        self.request.user = user
+        self._uuids = set()
+        self._entries = {}
+
+    def get_errors(self) -> List[CustomErrorType]:
+        if not self.errors:
+            return []
+        return [CustomErrorType(field='figures', array_errors=self.errors)]
+
+    def _add_error(self, key: str, errors: List[CustomErrorType]):
+        self.errors.append(ArrayNestedErrorType(key=key, object_errors=errors))
+
+    def _get_entries(self, ids: set) -> dict:
+        # entry which can not be updated by the user is None
+        missing = {each for each in ids if each not in self._entries}
+        if missing:
+            entries = Entry.objects.select_related('created_by').in_bulk(missing)
+            for id in missing:
+                entry = entries.get(id)
+                if entry is not None and not Figure.can_be_created_by(self.user, entry=entry):
+                    entry = None
+                self._entries[id] = entry
+        return {id: self._entries[id] for id in ids}
+
+    def _validate(self, chunk: List[tuple]) -> List[Figure]:
+        entry_ids = set()
+        for _, row in chunk:
+            try:
+                entry_ids.add(int(row.get('entry')))
+            except (TypeError, ValueError):
+                pass
+        entries = self._get_entries(entry_ids)
+        existing_uuids = {
+            str(each) for each in Figure.objects.filter(
+                uuid__in=[row['uuid'] for _, row in chunk if _is_uuid(row.get('uuid'))]
+            ).values_list('uuid', flat=True)
+        }
+        figures = []
+        for position, row in chunk:
+            key = str(row.get('uuid') or f'NOT_FOUND_{position}')
+            errors = []
+            entry_id = row.pop('entry', None)
+            try:
+                entry = entries.get(int(entry_id))
+            except (TypeError, ValueError):
+                entry = None
+            if entry is None:
+                errors.append(CustomErrorType(
+                    field='entry',
+                    messages=gettext('Entry does not exist or you cannot create a figure into it.')
+                ))
+            serializer = FigureImportSerializer(data=row, context={'request': self.request})
+            if not serializer.is_valid():
+                errors.extend(serializer_error_to_error_types(serializer.errors, row))
+            elif 'uuid' in serializer.validated_data:
+                uuid = str(serializer.validated_data['uuid'])
+                if uuid in existing_uuids or uuid in self._uuids:
+                    errors.append(CustomErrorType(
+                        field='uuid',
+                        messages=gettext('Figure with this uuid already exists.')
+                    ))
+                self._uuids.add(uuid)
+            if errors:
+                self._add_error(key, errors)
+                continue
+            figure = Figure(**serializer.validated_data, entry=entry)
+            # bulk_create does not call save
+            figure.total_figures = figure.calculate_total_figures()
+            figures.append(figure)
+        return figures
+
+    def _write(self, figures: List[Figure]):
+        try:
+            with transaction.atomic():
+                Figure.objects.bulk_create(figures)
+                update_figure_aggregates(added=figures)
+        except IntegrityError as e:
+            for figure in figures:
+                self._add_error(str(figure.uuid), [CustomErrorType(field='non_field_errors', messages=str(e))])
+            return
+        self.created_count += len(figures)
+
+    def run(self, rows: Iterable[dict]) -> 'FigureImport':
+        # the header is the first row
+        rows = ((position, clean_row(row)) for position, row in enumerate(rows, start=2))
+        with transaction.atomic():
+            while chunk := list(islice(rows, self.chunk_size)):
+                figures = self._validate(chunk)
+                if figures and (self.partial or not self.errors):
+                    self._write(figures)
+            if self.errors and not self.partial:
+                transaction.set_rollback(True)
+                self.created_count = 0
+        if self.created_count:
+            # bulk_create does not send post_save
+            bump_table_version(Figure)
+        return self
@@ -0,0 +1,90 @@
+import json
+import logging
+from functools import lru_cache
+from typing import List
+
+import boto3
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.core.files.temp import NamedTemporaryFile
+
+from apps.entry.aggregates import rebuild_event_aggregates, rebuild_figure_aggregates
+from apps.entry.exports import WRITERS, EntryExport, FigureExport
+from apps.entry.models import SourcePreview
+from apps.entry.previews import LocalPreviewBackend
+from utils.jobs import job
+
+logger = logging.getLogger(__name__)
+
+EXPORTS = {export.name: export for export in (EntryExport, FigureExport)}
+EXPORT_FOLDER = 'exports'
+
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    # the clients are thread safe, and costly to create
+    return boto3.client('lambda')
+
+
+def fail_preview(instance):
+    """
+    Fails the preview of the failed render job, and the previews waiting for its render
+    """
+    if 'preview_id' in instance.kwargs:
+        preview = SourcePreview.objects.filter(id=instance.kwargs['preview_id']).first()
+    else:
+        preview = SourcePreview.objects.filter(token=instance.kwargs['token']).first()
+    if preview is None or preview.completed or preview.reason:
+        return
+    error = (instance.error or '').strip().splitlines()
+    preview.finish(reason=f'Rendering failed: {error[-1]}' if error else 'Rendering failed.')
+
+
+@job('entry.invoke_preview_lambda', priority=10, on_failure=fail_preview)
+def invoke_preview_lambda(url: str, token: str):
+    payload = dict(
+        url=url,
+        token=token,
+        filename=f'{token}.pdf',
+    )
+    logger.info(f'Invoking lambda function for preview {url} {token}')
+    get_lambda_client().invoke(
+        FunctionName=settings.LAMBDA_HTML_TO_PDF,
+        InvocationType='Event',
+        Payload=json.dumps(payload)
+    )
+
+
+@job('entry.render_preview', priority=10, on_failure=fail_preview)
+def render_preview(preview_id: int):
+    preview = SourcePreview.objects.filter(id=preview_id).first()
+    if preview is not None:
+        LocalPreviewBackend.render(preview)
+
+
+@job('entry.rebuild_figure_aggregates')
+def rebuild_figure_aggregates_job(field: str, owner_ids: List[int]):
+    rebuild_figure_aggregates(field, owner_ids)
+
+
+@job('entry.rebuild_event_aggregates')
+def rebuild_event_aggregates_job(event_ids: List[int]):
+    rebuild_event_aggregates(event_ids)
+
+
+@job('entry.export', priority=-10)
+def export(name: str, file_format: str, filters: dict, key: str) -> dict:
+    """
+    Writes the export into the storage, the file is the result of the job
+    """
+    instance = EXPORTS[name](filters)
+    if not instance.is_valid():
+        raise ValueError(json.dumps(instance.errors))
+    stream, _ = WRITERS[file_format]
+    with NamedTemporaryFile() as file:
+        for chunk in stream(instance.get_rows()):
+            file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        file.seek(0)
+        path = default_storage.save(f'{EXPORT_FOLDER}/{key}/{name}.{file_format}', File(file))
+    return {'file': path}
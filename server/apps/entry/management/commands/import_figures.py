@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.entry.imports import FigureImport, InvalidImportFile, get_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Import the figures of a csv or xlsx file, created by the given user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument('--user', type=str, required=True,
+                            help='Username of the creator of the figures.')
+        parser.add_argument('--partial', action='store_true',
+                            help='Keep the valid rows when some are invalid.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def write_errors(self, errors, prefix=''):
+        for error in errors or []:
+            name = f'{prefix}{getattr(error, "field", None) or getattr(error, "key", "")}'
+            if error.messages:
+                self.stderr.write(f'{name}: {error.messages}')
+            self.write_errors(error.object_errors, prefix=f'{name}.')
+            self.write_errors(getattr(error, 'array_errors', None), prefix=f'{name}.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist.')
+        figure_import = FigureImport(user, partial=options['partial'], chunk_size=options['chunk_size'])
+        with open(options['path'], 'rb') as file:
+            try:
+                figure_import.run(get_rows(file, options['path']))
+            except InvalidImportFile as e:
+                raise CommandError(str(e))
+        self.write_errors(figure_import.get_errors())
+        self.stdout.write(self.style.SUCCESS(f'Imported {figure_import.created_count} figures.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.entry.aggregates import AGGREGATES, rebuild_figure_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the figure aggregates of the entries, events, crises and countries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', type=str,
+                            choices=[field for _, field, _ in AGGREGATES])
+
+    def handle(self, *args, **options):
+        for model, field, _ in AGGREGATES:
+            if options['only'] and field not in options['only']:
+                continue
+            rebuild_figure_aggregates(field)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {model.objects.count()} {field} aggregates.'))
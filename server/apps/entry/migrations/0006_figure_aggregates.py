@@ -0,0 +1,79 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:07
+
+import apps.entry.models
+from django.db import migrations, models
+import django.db.models.deletion
+import django_enumfield.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crisis', '0002_auto_20201019_0758'),
+        ('event', '0003_remove_triggersubtype_trigger'),
+        ('country', '0001_initial'),
+        ('entry', '0005_remove_sourcepreview_pdf_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventFigureAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.TERM)),
+                ('role', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.ROLE)),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('total_figures', models.BigIntegerField(default=0, verbose_name='Total Figures')),
+                ('figures_count', models.IntegerField(default=0, verbose_name='Number of Figures')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='figure_aggregates', to='event.Event', verbose_name='Event')),
+            ],
+            options={
+                'unique_together': {('event', 'term', 'role', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EntryFigureAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.TERM)),
+                ('role', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.ROLE)),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('total_figures', models.BigIntegerField(default=0, verbose_name='Total Figures')),
+                ('figures_count', models.IntegerField(default=0, verbose_name='Number of Figures')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='figure_aggregates', to='entry.Entry', verbose_name='Entry')),
+            ],
+            options={
+                'unique_together': {('entry', 'term', 'role', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CrisisFigureAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.TERM)),
+                ('role', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.ROLE)),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('total_figures', models.BigIntegerField(default=0, verbose_name='Total Figures')),
+                ('figures_count', models.IntegerField(default=0, verbose_name='Number of Figures')),
+                ('crisis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='figure_aggregates', to='crisis.Crisis', verbose_name='Crisis')),
+            ],
+            options={
+                'unique_together': {('crisis', 'term', 'role', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CountryFigureAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.TERM)),
+                ('role', django_enumfield.db.fields.EnumField(enum=apps.entry.models.Figure.ROLE)),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('total_figures', models.BigIntegerField(default=0, verbose_name='Total Figures')),
+                ('figures_count', models.IntegerField(default=0, verbose_name='Number of Figures')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='figure_aggregates', to='country.Country', verbose_name='Country')),
+            ],
+            options={
+                'unique_together': {('country', 'term', 'role', 'year')},
+            },
+        ),
+    ]
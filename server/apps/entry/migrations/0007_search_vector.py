@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from utils.search import get_search_vector_sql, get_trigram_index_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0002_trigram_extension'),
+        ('entry', '0006_figure_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='entry_entry_search__52b8f7_gin'),
+        ),
+        migrations.RunSQL(*get_search_vector_sql('entry_entry', [('article_title', 'A'), ('source_excerpt', 'B'), ('idmc_analysis', 'C')])),
+        migrations.RunSQL(*get_trigram_index_sql('entry_entry', 'article_title')),
+    ]
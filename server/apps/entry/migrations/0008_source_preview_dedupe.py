@@ -0,0 +1,51 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:22
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+# frozen copy of apps.entry.previews.normalize_url
+IGNORED_QUERY_PARAMETERS = ('fbclid', 'gclid', 'mc_cid', 'mc_eid')
+IGNORED_QUERY_PARAMETER_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{netloc}:{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in IGNORED_QUERY_PARAMETERS
+        and not key.lower().startswith(IGNORED_QUERY_PARAMETER_PREFIXES)
+    )
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+
+def set_normalized_urls(apps, schema_editor):
+    SourcePreview = apps.get_model('entry', 'SourcePreview')
+    for preview in SourcePreview.objects.only('id', 'url').iterator():
+        SourcePreview.objects.filter(id=preview.id).update(normalized_url=normalize_url(preview.url))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0007_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourcepreview',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Content Hash'),
+        ),
+        migrations.AddField(
+            model_name='sourcepreview',
+            name='normalized_url',
+            field=models.TextField(blank=True, db_index=True, null=True, verbose_name='Normalized Source URL'),
+        ),
+        migrations.RunPython(set_normalized_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0008_source_preview_dedupe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourcepreview',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Rendered At'),
+        ),
+    ]
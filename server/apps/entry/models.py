@@ -1,21 +1,27 @@
 from collections import OrderedDict
-import json
+from datetime import timedelta
 import logging
+from typing import Optional
 import uuid
 
-import boto3
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField, JSONField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.db.models import Sum
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _, gettext
 from django_enumfield import enum
 
 from apps.contrib.models import MetaInformationAbstractModel, UUIDAbstractModel
-from apps.users.roles import ADMIN
+from apps.entry.previews import get_preview_backend, normalize_url
 
+from utils.counts import bump_table_version
+from utils.db import lock_name
 from utils.fields import CachedFileField
+from utils.permissions import get_user_permissions
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -25,44 +31,111 @@ class SourcePreview(MetaInformationAbstractModel):
     PREVIEW_FOLDER = 'source/previews'
 
     url = models.URLField(verbose_name=_('Source URL'))
+    normalized_url = models.TextField(verbose_name=_('Normalized Source URL'),
+                                      blank=True, null=True, db_index=True)
     token = models.CharField(verbose_name=_('Token'),
                              max_length=64, db_index=True,
                              blank=True, null=True)
     pdf = CachedFileField(verbose_name=_('Rendered Pdf'),
                           blank=True, null=True,
                           upload_to=PREVIEW_FOLDER)
+    content_hash = models.CharField(verbose_name=_('Content Hash'), max_length=64,
+                                    blank=True, null=True)
+    # of the pdf, kept by the previews reusing it
+    rendered_at = models.DateTimeField(verbose_name=_('Rendered At'), blank=True, null=True)
     completed = models.BooleanField(default=False)
     reason = models.TextField(verbose_name=_('Error Reason'),
                               blank=True, null=True)
 
+    @classmethod
+    def get_recent_render(cls, normalized_url: str, exclude: int = None) -> Optional['SourcePreview']:
+        """
+        Completed preview of the url whose pdf was rendered within the PREVIEW_REUSE_WINDOW
+        """
+        if not settings.PREVIEW_REUSE_WINDOW:
+            return None
+        return cls.objects.filter(
+            normalized_url=normalized_url,
+            completed=True,
+            rendered_at__gte=timezone.now() - timedelta(seconds=settings.PREVIEW_REUSE_WINDOW),
+        ).exclude(pk=exclude).order_by('-rendered_at').first()
+
+    @classmethod
+    def get_in_flight_render(cls, normalized_url: str, exclude: int = None) -> Optional['SourcePreview']:
+        """
+        Preview of the url being rendered, the ones enqueued before the JOB_TIMEOUT are not waited for
+        """
+        return cls.objects.filter(
+            normalized_url=normalized_url,
+            completed=False,
+            reason__isnull=True,
+            modified_at__gte=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT),
+        ).exclude(pk=exclude).order_by('-modified_at').first()
+
+    @staticmethod
+    def lock_url(normalized_url: str):
+        # the requests and the renders of the url wait for each other until their transaction ends
+        lock_name(f'source_preview:{normalized_url}')
+
     @classmethod
     def get_pdf(cls, url: str, instance: 'SourcePreview' = None, **kwargs) -> 'SourcePreview':
         """
-        Based on the url, generate a pdf and store it.
+        Based on the url, generate a pdf and store it (see apps/entry/previews.py).
+        The recent pdf of the same url is reused instead, and the preview is completed at once.
+        While the url is being rendered for another preview, the preview waits for that render
+        (see finish).
         """
         if not instance:
             token = str(uuid.uuid4())
             instance = cls(token=token)
         instance.url = url
-        # TODO: remove .pdf in production... this will happen after webhook
-        instance.pdf = cls.PREVIEW_FOLDER + '/' + instance.token + '.pdf'
-
-        instance.save()
-
-        payload = dict(
-            url=url,
-            token=instance.token,
-            filename=f'{instance.token}.pdf',
-        )
-        logger.info(f'Invoking lambda function for preview {url} {instance.token}')
-        client = boto3.client('lambda')
-        client.invoke(
-            FunctionName=settings.LAMBDA_HTML_TO_PDF,
-            InvocationType='Event',
-            Payload=json.dumps(payload)
-        )
+        instance.normalized_url = normalize_url(url)
+        instance.reason = None
+        with transaction.atomic():
+            cls.lock_url(instance.normalized_url)
+            recent = cls.get_recent_render(instance.normalized_url, exclude=instance.pk)
+            if recent is not None:
+                instance.pdf = recent.pdf.name
+                instance.content_hash = recent.content_hash
+                instance.rendered_at = recent.rendered_at
+                instance.completed = True
+                instance.save()
+                return instance
+            in_flight = cls.get_in_flight_render(instance.normalized_url, exclude=instance.pk)
+            # replaced by the content hash once rendered
+            instance.pdf = cls.PREVIEW_FOLDER + '/' + instance.token + '.pdf'
+            instance.content_hash = None
+            instance.rendered_at = None
+            instance.completed = False
+
+            instance.save()
+            if in_flight is None:
+                get_preview_backend().generate(instance)
         return instance
 
+    def finish(self, pdf: str = None, content_hash: str = None, reason: str = None):
+        """
+        Completes the preview with its rendered pdf, or fails it with the reason, and the previews
+        of the same url waiting for its render with it
+        """
+        values = dict(completed=reason is None, reason=reason)
+        if reason is None:
+            values.update(pdf=pdf, content_hash=content_hash, rendered_at=timezone.now())
+        for field, value in values.items():
+            setattr(self, field, value)
+        with transaction.atomic():
+            if self.normalized_url:
+                self.lock_url(self.normalized_url)
+                waiting = SourcePreview.objects.filter(
+                    normalized_url=self.normalized_url,
+                    completed=False,
+                    reason__isnull=True,
+                ).exclude(pk=self.pk).update(**values, modified_at=timezone.now())
+                if waiting:
+                    # updated without the signals
+                    bump_table_version(SourcePreview)
+            self.save()
+
 
 class Figure(MetaInformationAbstractModel, UUIDAbstractModel, models.Model):
     class QUANTIFIER(enum.Enum):
@@ -199,7 +272,15 @@ class Figure(MetaInformationAbstractModel, UUIDAbstractModel, models.Model):
         """
         used to check before deleting as well
         """
-        return self.entry.can_be_updated_by(user)
+        permissions = get_user_permissions(user)
+        if permissions.is_admin:
+            return True
+        if self._meta.get_field('entry').is_cached(self):
+            created_by_id = self.entry.created_by_id
+        else:
+            # the owner only, not the whole entry
+            created_by_id = Entry.objects.filter(pk=self.entry_id).values_list('created_by', flat=True).first()
+        return permissions.is_owner_or_admin(created_by_id)
 
     @staticmethod
     def clean_idu(values: dict, instance=None) -> OrderedDict:
@@ -210,11 +291,22 @@ class Figure(MetaInformationAbstractModel, UUIDAbstractModel, models.Model):
                 errors['excerpt_idu'] = gettext('This field is required. ')
         return errors
 
-    def save(self, *args, **kwargs):
-        self.total_figures = self.reported
+    def calculate_total_figures(self) -> int:
         if self.unit == self.UNIT.HOUSEHOLD:
-            self.total_figures = self.reported * self.household_size
-        return super().save(*args, **kwargs)
+            return self.reported * self.household_size
+        return self.reported
+
+    def save(self, *args, **kwargs):
+        from apps.entry.aggregates import update_figure_aggregates
+
+        self.total_figures = self.calculate_total_figures()
+        with transaction.atomic():
+            old = None
+            if self.pk:
+                old = Figure.objects.select_for_update().filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            # deletes are handled by the post_delete receiver
+            update_figure_aggregates(added=[self], removed=[old] if old else [])
 
     def __str__(self):
         return f'{self.quantifier.label} {self.reported} {self.term.label}'
@@ -255,10 +347,15 @@ class Entry(MetaInformationAbstractModel, models.Model):
     reviewers = models.ManyToManyField('users.User', verbose_name=_('Reviewers'),
                                        blank=True,
                                        related_name='review_entries')
+    # updated by a database trigger (see utils/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'])]
 
     @property
     def total_figures(self):
-        return self.figures.aggregate(total=Sum('total_figures'))['total']
+        return self.figure_aggregates.aggregate(total=Sum('total_figures'))['total']
 
     @staticmethod
     def clean_url_and_document(values: dict, instance=None) -> OrderedDict:
@@ -277,10 +374,55 @@ class Entry(MetaInformationAbstractModel, models.Model):
         """
         used to check before deleting as well
         """
-        if user.is_superuser \
-                or ADMIN in user.groups.values_list('name', flat=True):
-            return True
-        return self.created_by == user
+        return get_user_permissions(user).is_owner_or_admin(self.created_by_id)
 
     def __str__(self):
         return f'Entry {self.article_title}'
+
+
+class FigureAggregateAbstractModel(models.Model):
+    """
+    Sum of the total figures by term, role and year (of the start date)
+
+    Kept in sync by apps/entry/aggregates.py, rebuild with `./manage.py rebuild_figure_aggregates`
+    """
+    term = enum.EnumField(enum=Figure.TERM, verbose_name=_('Term'))
+    role = enum.EnumField(enum=Figure.ROLE, verbose_name=_('Role'))
+    year = models.PositiveSmallIntegerField(verbose_name=_('Year'))
+    total_figures = models.BigIntegerField(verbose_name=_('Total Figures'), default=0)
+    figures_count = models.IntegerField(verbose_name=_('Number of Figures'), default=0)
+
+    class Meta:
+        abstract = True
+
+
+class EntryFigureAggregate(FigureAggregateAbstractModel):
+    entry = models.ForeignKey('Entry', verbose_name=_('Entry'),
+                              related_name='figure_aggregates', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('entry', 'term', 'role', 'year')
+
+
+class EventFigureAggregate(FigureAggregateAbstractModel):
+    event = models.ForeignKey('event.Event', verbose_name=_('Event'),
+                              related_name='figure_aggregates', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('event', 'term', 'role', 'year')
+
+
+class CrisisFigureAggregate(FigureAggregateAbstractModel):
+    crisis = models.ForeignKey('crisis.Crisis', verbose_name=_('Crisis'),
+                               related_name='figure_aggregates', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('crisis', 'term', 'role', 'year')
+
+
+class CountryFigureAggregate(FigureAggregateAbstractModel):
+    country = models.ForeignKey('country.Country', verbose_name=_('Country'),
+                                related_name='figure_aggregates', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('country', 'term', 'role', 'year')
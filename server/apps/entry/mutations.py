@@ -1,14 +1,22 @@
+from uuid import uuid4
+
 import graphene
+from django.core.exceptions import PermissionDenied
 from django.utils.translation import gettext
+from graphene.types.generic import GenericScalar
 from graphene_file_upload.scalars import Upload
 
 from apps.entry.enums import QuantifierGrapheneEnum, RoleGrapheneEnum, TypeGrapheneEnum, \
     TermGrapheneEnum, UnitGrapheneEnum
+from apps.contrib.schema import JobType
+from apps.entry.exports import WRITERS
+from apps.entry.imports import FigureImport, InvalidImportFile, get_rows
+from apps.entry.jobs import EXPORTS, export
 from apps.entry.models import Entry, Figure, SourcePreview
 from apps.entry.schema import EntryType, FigureType, SourcePreviewType
 from apps.entry.serializers import EntrySerializer, FigureSerializer, SourcePreviewSerializer
-from utils.error_types import CustomErrorType, mutation_is_not_valid
-from utils.permissions import permission_checker
+from utils.error_types import CustomErrorType, mutation_is_not_valid, serializer_error_to_error_types
+from utils.permissions import PERMISSION_DENIED_MESSAGE, permission_checker
 
 
 class DisaggregatedAgeInputObjectType(graphene.InputObjectType):
@@ -112,9 +120,9 @@ class CreateFigure(graphene.Mutation):
     def mutate(root, info, figure):
         serializer = FigureSerializer(data=figure,
                                       context={'request': info.context})
-        try:
-            entry = Entry.objects.get(id=figure['entry'])
-        except Entry.DoesNotExist:
+        # loaded along with the other relations of the payload, and reused by the validation
+        entry = serializer.get_related('entry')
+        if entry is None:
             return CreateFigure(errors=[
                 CustomErrorType(field='non_field_errors', messages=gettext('Entry does not exist.'))
             ])
@@ -140,7 +148,7 @@ class UpdateFigure(graphene.Mutation):
     @permission_checker(['entry.change_figure'])
     def mutate(root, info, figure):
         try:
-            instance = Figure.objects.get(id=figure['id'])
+            instance = Figure.objects.select_related('entry').get(id=figure['id'])
         except Figure.DoesNotExist:
             return UpdateFigure(errors=[
                 CustomErrorType(field='non_field_errors', messages=gettext('Figure does not exist.'))
@@ -169,7 +177,7 @@ class DeleteFigure(graphene.Mutation):
     @permission_checker(['entry.delete_figure'])
     def mutate(root, info, id):
         try:
-            instance = Figure.objects.get(id=id)
+            instance = Figure.objects.select_related('entry').get(id=id)
         except Figure.DoesNotExist:
             return DeleteFigure(errors=[
                 CustomErrorType(field='non_field_errors', messages=gettext('Figure does not exist.'))
@@ -183,6 +191,65 @@ class DeleteFigure(graphene.Mutation):
         return DeleteFigure(figure=instance, errors=None, ok=True)
 
 
+class ImportFigures(graphene.Mutation):
+    """
+    Creates the figures of a csv or xlsx file, the header has the snake_case fields of the figure
+    (with the entry id), the errors of the rows are keyed by their uuid in the `figures` errors.
+    Pass skipInvalid to keep the valid rows when some are invalid.
+    """
+    class Arguments:
+        file = Upload(required=True)
+        skip_invalid = graphene.Boolean(required=False)
+
+    errors = graphene.List(CustomErrorType)
+    ok = graphene.Boolean()
+    created_count = graphene.Int()
+
+    @staticmethod
+    @permission_checker(['entry.add_figure'])
+    def mutate(root, info, file, skip_invalid=False):
+        figure_import = FigureImport(info.context.user, partial=skip_invalid)
+        try:
+            figure_import.run(get_rows(file, file.name))
+        except InvalidImportFile as e:
+            return ImportFigures(errors=[
+                CustomErrorType(field='non_field_errors', messages=str(e))
+            ], ok=False, created_count=0)
+        if errors := figure_import.get_errors():
+            return ImportFigures(errors=errors, ok=False, created_count=figure_import.created_count)
+        return ImportFigures(errors=None, ok=True, created_count=figure_import.created_count)
+
+
+ExportGrapheneEnum = graphene.Enum('ExportGrapheneEnum', [(name.upper(), name) for name in EXPORTS])
+ExportFormatGrapheneEnum = graphene.Enum('ExportFormatGrapheneEnum', [(name.upper(), name) for name in WRITERS])
+
+
+class CreateExport(graphene.Mutation):
+    """
+    Exports the list in the background, the file url is in the job once completed.
+    The filters are the same as of the list, in snake_case eg. {"article_title__icontains": "nepal"}
+    """
+    class Arguments:
+        name = graphene.NonNull(ExportGrapheneEnum)
+        file_format = graphene.Argument(ExportFormatGrapheneEnum)
+        filters = GenericScalar(required=False)
+
+    errors = graphene.List(CustomErrorType)
+    ok = graphene.Boolean()
+    job = graphene.Field(JobType)
+
+    @staticmethod
+    def mutate(root, info, name, file_format='csv', filters=None):
+        if not info.context.user.is_authenticated:
+            raise PermissionDenied(gettext(PERMISSION_DENIED_MESSAGE))
+        instance = EXPORTS[name](filters or {})
+        if not instance.is_valid():
+            return CreateExport(errors=serializer_error_to_error_types(instance.errors), ok=False)
+        job = export.enqueue(name=name, file_format=file_format, filters=filters or {},
+                             key=str(uuid4()), created_by=info.context.user)
+        return CreateExport(job=job, errors=None, ok=True)
+
+
 # entry
 
 
@@ -340,6 +407,8 @@ class Mutation(object):
     create_figure = CreateFigure.Field()
     update_figure = UpdateFigure.Field()
     delete_figure = DeleteFigure.Field()
+    import_figures = ImportFigures.Field()
+    create_export = CreateExport.Field()
     create_entry = CreateEntry.Field()
     update_entry = UpdateEntry.Field()
     delete_entry = DeleteEntry.Field()
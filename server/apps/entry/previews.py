@@ -0,0 +1,119 @@
+import abc
+import hashlib
+import logging
+import subprocess
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pdfkit
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.module_loading import import_string
+
+from utils.jobs import enqueue
+
+logger = logging.getLogger(__name__)
+
+PDFKIT_OPTIONS = {
+    'quiet': '',
+    'encoding': 'UTF-8',
+}
+# query parameters which do not change the page
+IGNORED_QUERY_PARAMETERS = ('fbclid', 'gclid', 'mc_cid', 'mc_eid')
+IGNORED_QUERY_PARAMETER_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Url of the same page written differently, eg. `HTTPS://Example.com:443/a?b=1&utm_source=x#c`
+    and `https://example.com/a?b=1` are `https://example.com/a?b=1`
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{netloc}:{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in IGNORED_QUERY_PARAMETERS
+        and not key.lower().startswith(IGNORED_QUERY_PARAMETER_PREFIXES)
+    )
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class RenderError(Exception):
+    pass
+
+
+def render_pdf(url: str) -> bytes:
+    """
+    Renders the url with wkhtmltopdf, killed after PREVIEW_RENDER_TIMEOUT seconds
+
+    Run by the job workers, one render at a time for each worker.
+    """
+    try:
+        configuration = pdfkit.configuration(wkhtmltopdf=settings.WKHTMLTOPDF_PATH or '')
+    except IOError as e:
+        raise RenderError(str(e))
+    command = pdfkit.PDFKit(url, 'url', options=PDFKIT_OPTIONS, configuration=configuration).command()
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 timeout=settings.PREVIEW_RENDER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RenderError(f'Rendering timed out after {settings.PREVIEW_RENDER_TIMEOUT} seconds.')
+    # wkhtmltopdf exits with 1 on some failed resources, with the rest of the page rendered
+    if not process.stdout:
+        raise RenderError(process.stderr.decode(errors='replace') or 'Empty pdf.')
+    return process.stdout
+
+
+class BasePreviewBackend(abc.ABC):
+    """
+    Generates the pdf of a saved SourcePreview, from its url
+
+    The backends finish the preview (see SourcePreview.finish) once the pdf is in the storage, at
+    <PREVIEW_FOLDER>/<content_hash>.pdf, or with the reason of the failure.
+    The files are shared by the previews, so they are never deleted with a preview.
+    """
+    @abc.abstractmethod
+    def generate(self, preview):
+        pass
+
+
+class LambdaPreviewBackend(BasePreviewBackend):
+    """
+    Rendered by the lambda of the serverless folder, completed by its webhook (handle_pdf_generation)
+    """
+    def generate(self, preview):
+        enqueue('entry.invoke_preview_lambda', url=preview.url, token=preview.token)
+
+
+class LocalPreviewBackend(BasePreviewBackend):
+    """
+    Rendered with wkhtmltopdf by the job workers, and written through the storage
+    """
+    def generate(self, preview):
+        enqueue('entry.render_preview', priority=10, preview_id=preview.id)
+
+    @staticmethod
+    def render(preview):
+        try:
+            content = render_pdf(preview.url)
+        except RenderError as e:
+            logger.warning(f'Failed to render the preview {preview.url}: {e}')
+            preview.finish(reason=str(e))
+            return
+        # stored by content, the identical pdfs of the previews are kept once
+        content_hash = get_content_hash(content)
+        name = f'{preview.PREVIEW_FOLDER}/{content_hash}.pdf'
+        if not preview.pdf.storage.exists(name):
+            name = preview.pdf.storage.save(name, ContentFile(content))
+        preview.finish(pdf=name, content_hash=content_hash)
+
+
+def get_preview_backend() -> BasePreviewBackend:
+    return import_string(settings.SOURCE_PREVIEW_BACKEND)()
@@ -6,14 +6,18 @@ from django.contrib.postgres.fields import JSONField
 from graphene import ObjectType
 from graphene.types.generic import GenericScalar
 from graphene_django_extras.converter import convert_django_field
-from graphene_django_extras import DjangoObjectType, PageGraphqlPagination, DjangoObjectField
+from graphene_django_extras import DjangoObjectType, DjangoObjectField
 import logging
 
 from apps.entry.enums import QuantifierGrapheneEnum, UnitGrapheneEnum, TermGrapheneEnum, TypeGrapheneEnum, \
     RoleGrapheneEnum
-from apps.entry.filters import EntryFilter
-from apps.entry.models import Figure, Entry, SourcePreview
+from apps.entry.filters import EntryFilter, FigureFilter
+from apps.entry.models import Figure, Entry, SourcePreview, EntryFigureAggregate
+from utils.dataloaders import get_dataloader, load_file_url, load_foreign_key, load_many_to_many, \
+    load_reverse_foreign_key, SumDataLoader
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType, CustomDjangoListField
+from utils.pagination import CursorPageGraphqlPagination, PageGraphqlPagination
+from utils.permissions import resolve_permission
 
 
 logger = logging.getLogger(__name__)
@@ -38,10 +42,21 @@ class DisaggregatedStratumType(ObjectType):
     value = graphene.Int()
 
 
+class FigureAggregateType(ObjectType):
+    term = graphene.Field(TermGrapheneEnum)
+    role = graphene.Field(RoleGrapheneEnum)
+    year = graphene.Int()
+    total_figures = graphene.Int()
+    figures_count = graphene.Int()
+
+
 class FigureType(DjangoObjectType):
     class Meta:
         model = Figure
 
+    # owner of the figure, for the permission flags
+    owner_lookup = 'entry__created_by'
+
     quantifier = graphene.Field(QuantifierGrapheneEnum)
     unit = graphene.Field(UnitGrapheneEnum)
     term = graphene.Field(TermGrapheneEnum)
@@ -49,20 +64,34 @@ class FigureType(DjangoObjectType):
     role = graphene.Field(RoleGrapheneEnum)
     age_json = graphene.List(DisaggregatedAgeType)
     strata_json = graphene.List(DisaggregatedStratumType)
+    can_edit = graphene.Boolean()
+    can_delete = graphene.Boolean()
+
+    def resolve_entry(root, info, **kwargs):
+        return load_foreign_key(info, root, 'entry')
+
+    def resolve_can_edit(root, info, **kwargs):
+        return resolve_permission(root, info, 'canEdit')
+
+    def resolve_can_delete(root, info, **kwargs):
+        return resolve_permission(root, info, 'canDelete')
 
 
 class FigureListType(CustomDjangoListObjectType):
     class Meta:
         model = Figure
-        filter_fields = {
-            'unit': ('exact',),
-            'start_date': ('lte', 'gte'),
-        }
+        filterset_class = FigureFilter
 
 
 class EntryType(DjangoObjectType):
     class Meta:
         model = Entry
+        exclude_fields = ('search_vector',)
+
+    # owner of the entry, for the permission flags
+    owner_lookup = 'created_by'
+    # columns read by the custom resolvers, kept by the optimizer (see utils/optimizer.py)
+    source_fields = {'document_url': ['document']}
 
     created_by = graphene.Field('apps.users.schema.UserType')
     last_modified_by = graphene.Field('apps.users.schema.UserType')
@@ -72,6 +101,40 @@ class EntryType(DjangoObjectType):
                                              ))
     reviewers = CustomDjangoListField('apps.users.schema.UserType')
     total_figures = graphene.Field(graphene.Int)
+    figure_aggregates = graphene.List(FigureAggregateType)
+    document_url = graphene.String()
+    can_edit = graphene.Boolean()
+    can_delete = graphene.Boolean()
+
+    def resolve_can_edit(root, info, **kwargs):
+        return resolve_permission(root, info, 'canEdit')
+
+    def resolve_can_delete(root, info, **kwargs):
+        return resolve_permission(root, info, 'canDelete')
+
+    def resolve_document_url(root, info, **kwargs):
+        return load_file_url(info, root.document)
+
+    def resolve_total_figures(root, info, **kwargs):
+        return get_dataloader(info, SumDataLoader, EntryFigureAggregate, 'entry', 'total_figures').load(root.pk)
+
+    def resolve_figure_aggregates(root, info, **kwargs):
+        return load_reverse_foreign_key(info, root, EntryFigureAggregate, 'entry')
+
+    def resolve_created_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'created_by')
+
+    def resolve_last_modified_by(root, info, **kwargs):
+        return load_foreign_key(info, root, 'last_modified_by')
+
+    def resolve_event(root, info, **kwargs):
+        return load_foreign_key(info, root, 'event')
+
+    def resolve_preview(root, info, **kwargs):
+        return load_foreign_key(info, root, 'preview')
+
+    def resolve_reviewers(root, info, **kwargs):
+        return load_many_to_many(info, root, 'reviewers')
 
 
 class EntryListType(CustomDjangoListObjectType):
@@ -86,18 +149,18 @@ class SourcePreviewType(DjangoObjectType):
         exclude_fields = ('entry', 'token')
 
     def resolve_pdf(root, info, **kwargs):
-        return root.pdf.url
+        return load_file_url(info, root.pdf)
 
 
 class Query:
     figure = DjangoObjectField(FigureType)
     figure_list = DjangoPaginatedListObjectField(FigureListType,
-                                                 pagination=PageGraphqlPagination(
+                                                 pagination=CursorPageGraphqlPagination(
                                                      page_size_query_param='pageSize'
                                                  ))
     source_preview = DjangoObjectField(SourcePreviewType)
     entry = DjangoObjectField(EntryType)
     entry_list = DjangoPaginatedListObjectField(EntryListType,
-                                                pagination=PageGraphqlPagination(
+                                                pagination=CursorPageGraphqlPagination(
                                                     page_size_query_param='pageSize'
                                                 ))
@@ -6,8 +6,10 @@ from django.db import transaction
 from django.utils.translation import gettext, gettext_lazy as _
 from rest_framework import serializers
 
-from apps.contrib.serializers import MetaInformationSerializerMixin
+from apps.contrib.serializers import MetaInformationSerializerMixin, RelatedObjectsSerializerMixin
+from apps.entry.aggregates import update_figure_aggregates
 from apps.entry.models import Entry, Figure, SourcePreview
+from utils.counts import bump_table_version
 
 
 class DisaggregatedAgeSerializer(serializers.Serializer):
@@ -66,7 +68,8 @@ class CommonFigureValidationMixin:
         return attrs
 
 
-class FigureSerializer(MetaInformationSerializerMixin,
+class FigureSerializer(RelatedObjectsSerializerMixin,
+                       MetaInformationSerializerMixin,
                        CommonFigureValidationMixin,
                        serializers.ModelSerializer):
     age_json = DisaggregatedAgeSerializer(many=True, required=False)
@@ -82,7 +85,8 @@ class FigureSerializer(MetaInformationSerializerMixin,
         return Figure.objects.create(**validated_data)
 
 
-class NestedFigureSerializer(MetaInformationSerializerMixin,
+class NestedFigureSerializer(RelatedObjectsSerializerMixin,
+                             MetaInformationSerializerMixin,
                              CommonFigureValidationMixin,
                              serializers.ModelSerializer):
     age_json = DisaggregatedAgeSerializer(many=True, required=False)
@@ -93,7 +97,8 @@ class NestedFigureSerializer(MetaInformationSerializerMixin,
         exclude = ('entry',)
 
 
-class EntrySerializer(MetaInformationSerializerMixin,
+class EntrySerializer(RelatedObjectsSerializerMixin,
+                      MetaInformationSerializerMixin,
                       serializers.ModelSerializer):
     figures = NestedFigureSerializer(many=True, required=False)
 
@@ -120,15 +125,21 @@ class EntrySerializer(MetaInformationSerializerMixin,
         if figures:
             with transaction.atomic():
                 entry = super().create(validated_data)
-                Figure.objects.bulk_create([
-                    Figure(**each, entry=entry) for each in figures
-                ])
+                figures = [Figure(**each, entry=entry) for each in figures]
+                # bulk_create does not call save
+                for figure in figures:
+                    figure.total_figures = figure.calculate_total_figures()
+                Figure.objects.bulk_create(figures)
+                update_figure_aggregates(added=figures)
+                # bulk_create does not send post_save
+                bump_table_version(Figure)
         else:
             entry = super().create(validated_data)
         return entry
 
 
-class SourcePreviewSerializer(MetaInformationSerializerMixin,
+class SourcePreviewSerializer(RelatedObjectsSerializerMixin,
+                              MetaInformationSerializerMixin,
                               serializers.ModelSerializer):
     class Meta:
         model = SourcePreview
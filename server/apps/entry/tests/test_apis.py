@@ -1,13 +1,24 @@
+import csv
 import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from uuid import uuid4
 
+from asgiref.sync import async_to_sync
 from django.core.files.temp import NamedTemporaryFile
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+import openpyxl
 
 from apps.entry.models import Figure
+from apps.entry.schema import Query as EntryQuery
 from apps.users.roles import MONITORING_EXPERT_EDITOR, MONITORING_EXPERT_REVIEWER, ADMIN, GUEST
 from utils.factories import EventFactory, EntryFactory, FigureFactory
 from utils.permissions import PERMISSION_DENIED_MESSAGE
-from utils.tests import HelixGraphQLTestCase, create_user_with_role
+from helix.schema import schema
+from utils.tests import HelixGraphQLTestCase, HelixTestCase, create_user_with_role
 
 
 class TestFigureCreation(HelixGraphQLTestCase):
@@ -644,3 +655,537 @@ class TestEntryDelete(HelixGraphQLTestCase):
         self.assertTrue(content['data']['deleteEntry']['ok'], content)
         self.assertEqual(content['data']['deleteEntry']['entry']['url'],
                          self.entry.url)
+
+
+class TestEntryListQuery(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.creator = create_user_with_role(MONITORING_EXPERT_EDITOR)
+        self.reviewer = create_user_with_role(MONITORING_EXPERT_REVIEWER)
+        self.query_str = '''
+            query EntryList {
+              entryList {
+                results {
+                  id
+                  createdBy {
+                    id
+                  }
+                  reviewers {
+                    id
+                  }
+                  event {
+                    id
+                  }
+                }
+              }
+            }
+        '''
+        self.force_login(self.creator)
+
+    def _create_entries(self, count):
+        for entry in EntryFactory.create_batch(count, created_by=self.creator):
+            entry.reviewers.set([self.reviewer])
+
+    def _count_queries(self, query=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(query or self.query_str)
+        self.assertResponseNoErrors(response)
+        return len(context.captured_queries), json.loads(response.content)
+
+    def test_nested_relations_are_batched(self):
+        self._create_entries(2)
+        initial_count, _ = self._count_queries()
+
+        self._create_entries(5)
+        final_count, content = self._count_queries()
+
+        self.assertEqual(initial_count, final_count)
+        results = content['data']['entryList']['results']
+        self.assertEqual(len(results), 7)
+        for each in results:
+            self.assertEqual(each['createdBy']['id'], str(self.creator.id))
+            self.assertEqual([reviewer['id'] for reviewer in each['reviewers']], [str(self.reviewer.id)])
+
+    def test_nested_paginated_figures_are_batched(self):
+        query = '''
+            query EntryList {
+              entryList {
+                results {
+                  id
+                  figures(perPage: 1) {
+                    totalCount
+                    results {
+                      id
+                    }
+                  }
+                }
+              }
+            }
+        '''
+        for entry in EntryFactory.create_batch(2, created_by=self.creator):
+            FigureFactory.create_batch(2, entry=entry)
+        initial_count, _ = self._count_queries(query)
+
+        for entry in EntryFactory.create_batch(3, created_by=self.creator):
+            FigureFactory.create_batch(2, entry=entry)
+        final_count, content = self._count_queries(query)
+
+        self.assertEqual(initial_count, final_count)
+        for each in content['data']['entryList']['results']:
+            self.assertEqual(each['figures']['totalCount'], 2)
+            self.assertEqual(len(each['figures']['results']), 1)
+
+    def test_ordered_nested_figures_are_paged_for_all_entries_at_once(self):
+        query = '''
+            query EntryList {
+              entryList {
+                results {
+                  id
+                  figures(page: 2, perPage: 2, ordering: "-id") {
+                    totalCount
+                    page
+                    results {
+                      id
+                    }
+                  }
+                }
+              }
+            }
+        '''
+        figures = {}
+        for entry in EntryFactory.create_batch(2, created_by=self.creator):
+            figures[entry.id] = FigureFactory.create_batch(3, entry=entry)
+        initial_count, _ = self._count_queries(query)
+
+        for entry in EntryFactory.create_batch(3, created_by=self.creator):
+            figures[entry.id] = FigureFactory.create_batch(3, entry=entry)
+        final_count, content = self._count_queries(query)
+
+        self.assertEqual(initial_count, final_count)
+        for each in content['data']['entryList']['results']:
+            self.assertEqual(each['figures']['totalCount'], 3)
+            self.assertEqual(each['figures']['page'], 2)
+            # the third of the figures ordered by -id
+            self.assertEqual([int(figure['id']) for figure in each['figures']['results']],
+                             [figures[int(each['id'])][0].id])
+
+    def test_permission_flags_are_annotated(self):
+        query = '''
+            query EntryList {
+              entryList {
+                results {
+                  id
+                  canEdit
+                  canDelete
+                  figures {
+                    results {
+                      canEdit
+                    }
+                  }
+                }
+              }
+            }
+        '''
+        own = EntryFactory.create(created_by=self.creator)
+        other = EntryFactory.create(created_by=self.reviewer)
+        FigureFactory.create(entry=own)
+        FigureFactory.create(entry=other)
+        initial_count, _ = self._count_queries(query)
+
+        for entry in EntryFactory.create_batch(3, created_by=self.reviewer):
+            FigureFactory.create(entry=entry)
+        final_count, content = self._count_queries(query)
+
+        self.assertEqual(initial_count, final_count)
+        for each in content['data']['entryList']['results']:
+            expected = each['id'] == str(own.id)
+            self.assertEqual(each['canEdit'], expected)
+            self.assertEqual(each['canDelete'], expected)
+            self.assertEqual([figure['canEdit'] for figure in each['figures']['results']], [expected])
+
+        # without the permission
+        self.force_login(self.reviewer)
+        content = json.loads(self.query(query).content)
+        self.assertFalse(any(each['canEdit'] for each in content['data']['entryList']['results']))
+
+    def test_document_url_is_loaded_with_the_entries(self):
+        query = '''
+            query EntryList {
+              entryList {
+                results {
+                  id
+                  documentUrl
+                }
+              }
+            }
+        '''
+        self._create_entries(2)
+        initial_count, _ = self._count_queries(query)
+
+        self._create_entries(5)
+        final_count, content = self._count_queries(query)
+
+        self.assertEqual(initial_count, final_count)
+        self.assertEqual(len(content['data']['entryList']['results']), 7)
+
+    def test_total_count_is_skipped_if_not_selected(self):
+        self._create_entries(2)
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(self.query_str)
+        self.assertResponseNoErrors(response)
+        self.assertFalse(any('COUNT(' in each['sql'] for each in context.captured_queries))
+
+    @override_settings(LIST_COUNT_STRATEGY='cached')
+    def test_cached_total_count_is_invalidated_on_write(self):
+        query = '''
+            query EntryList {
+              entryList {
+                totalCount
+                isExactCount
+              }
+            }
+        '''
+        self._create_entries(2)
+        content = json.loads(self.query(query).content)
+        self.assertEqual(content['data']['entryList']['totalCount'], 2)
+        self.assertTrue(content['data']['entryList']['isExactCount'])
+
+        with CaptureQueriesContext(connection) as context:
+            content = json.loads(self.query(query).content)
+        self.assertEqual(content['data']['entryList']['totalCount'], 2)
+        self.assertFalse(any('COUNT(' in each['sql'] for each in context.captured_queries))
+
+        self._create_entries(1)
+        content = json.loads(self.query(query).content)
+        self.assertEqual(content['data']['entryList']['totalCount'], 3)
+
+
+class TestEntrySearch(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.title_match = EntryFactory.create(article_title='Floods displace thousands in Bangladesh')
+        self.excerpt_match = EntryFactory.create(article_title='Monsoon update',
+                                                 source_excerpt='Flooding in the northern districts')
+        EntryFactory.create(article_title='Earthquake in Nepal')
+        self.search_query = '''
+            query EntrySearch($search: String) {
+              entryList(search: $search) {
+                results {
+                  id
+                }
+              }
+            }
+        '''
+        self.force_login(create_user_with_role(MONITORING_EXPERT_EDITOR))
+
+    def test_search_is_ranked(self):
+        response = self.query(self.search_query, variables={'search': 'flood'})
+
+        content = json.loads(response.content)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(
+            [int(each['id']) for each in content['data']['entryList']['results']],
+            [self.title_match.id, self.excerpt_match.id],
+        )
+
+    def test_search_vector_follows_updates(self):
+        self.title_match.article_title = 'Drought in the Horn of Africa'
+        self.title_match.save()
+        response = self.query(self.search_query, variables={'search': 'drought afr'})
+
+        content = json.loads(response.content)
+        self.assertResponseNoErrors(response)
+        self.assertEqual(
+            [int(each['id']) for each in content['data']['entryList']['results']],
+            [self.title_match.id],
+        )
+
+
+class TestConcurrentEntryList(HelixTestCase):
+    def setUp(self) -> None:
+        self.user = create_user_with_role(GUEST)
+        self.entries = EntryFactory.create_batch(12)
+        self.query = '''
+            query EntryList($ordering: String) {
+              entryList(ordering: $ordering, pageSize: 50) {
+                results {
+                  id
+                }
+              }
+            }
+        '''
+
+    def execute(self, ordering):
+        request = RequestFactory().post('/graphql')
+        request.user = self.user
+        return schema.execute(self.query, context_value=request, variables={'ordering': ordering})
+
+    def test_orderings_do_not_leak_between_requests(self):
+        expected = {
+            'id': sorted(self.entries, key=lambda entry: entry.id),
+            '-id': sorted(self.entries, key=lambda entry: -entry.id),
+            'articleTitle': sorted(self.entries, key=lambda entry: entry.article_title),
+            '-articleTitle': sorted(self.entries, key=lambda entry: entry.article_title, reverse=True),
+        }
+        # the threads share the connection, so they see the data of the test transaction
+        shared_connection = connections['default']
+        shared_connection.inc_thread_sharing()
+
+        def run(ordering):
+            connections['default'] = shared_connection
+            return ordering, self.execute(ordering)
+
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(run, list(expected) * 25))
+        finally:
+            shared_connection.dec_thread_sharing()
+
+        for ordering, result in results:
+            self.assertIsNone(result.errors)
+            self.assertEqual(
+                [int(each['id']) for each in result.data['entryList']['results']],
+                [entry.id for entry in expected[ordering]],
+                ordering,
+            )
+        # the default ordering of the shared field is untouched
+        self.assertEqual(EntryQuery.entry_list.pagination.ordering, '')
+
+
+class TestFigureImport(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.creator = create_user_with_role(MONITORING_EXPERT_EDITOR)
+        self.entry = EntryFactory.create(created_by=self.creator)
+        self.other_entry = EntryFactory.create()
+        self.mutation = '''
+            mutation ImportFigures($file: Upload!, $skipInvalid: Boolean) {
+                importFigures(file: $file, skipInvalid: $skipInvalid) {
+                    ok
+                    createdCount
+                    errors {
+                        field
+                        messages
+                        arrayErrors {
+                            key
+                            objectErrors {
+                                field
+                                messages
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+        self.header = 'uuid,entry,district,town,quantifier,reported,unit,household_size,term,type,role,' \
+                      'start_date,include_idu,excerpt_idu,age_json'
+        self.force_login(self.creator)
+
+    def get_row(self, entry, uuid=None, **kwargs):
+        values = dict(
+            uuid=uuid or str(uuid4()), entry=entry.id, district='district', town='town',
+            quantifier='MORE_THAN', reported=10, unit='HOUSEHOLD', household_size=2, term='DISPLACED',
+            type='IDP_STOCK', role='RECOMMENDED', start_date='2020-09-09', include_idu='false',
+            excerpt_idu='',
+            age_json='"[{""age_from"": 1, ""age_to"": 3, ""value"": 3}]"',
+        )
+        values.update(kwargs)
+        return ','.join(str(values[column]) for column in self.header.split(','))
+
+    def import_figures(self, rows, skip_invalid=False, name='figures.csv'):
+        with NamedTemporaryFile(suffix=name) as t_file:
+            t_file.write('\n'.join([self.header, *rows]).encode())
+            t_file.seek(0)
+            response = self._client.post(
+                '/graphql',
+                data={
+                    'operations': json.dumps({
+                        'query': self.mutation,
+                        'variables': {'file': None, 'skipInvalid': skip_invalid}
+                    }),
+                    't_file': t_file,
+                    'map': json.dumps({
+                        't_file': ['variables.file']
+                    })
+                }
+            )
+        self.assertResponseNoErrors(response)
+        return json.loads(response.content)['data']['importFigures']
+
+    def test_valid_import_figures(self):
+        uuid = str(uuid4())
+        content = self.import_figures([self.get_row(self.entry, uuid=uuid), self.get_row(self.entry)])
+
+        self.assertTrue(content['ok'], content)
+        self.assertEqual(content['createdCount'], 2)
+        figure = Figure.objects.get(uuid=uuid)
+        self.assertEqual(figure.entry, self.entry)
+        self.assertEqual(figure.total_figures, 20)
+        self.assertEqual(figure.created_by, self.creator)
+        self.assertEqual(figure.age_json[0]['age_from'], 1)
+        self.assertEqual(self.entry.figure_aggregates.get().total_figures, 40)
+
+    def test_invalid_rows_are_keyed_by_uuid(self):
+        invalid_uuid, duplicate_uuid = str(uuid4()), str(uuid4())
+        content = self.import_figures([
+            self.get_row(self.entry),
+            self.get_row(self.entry, uuid=invalid_uuid, include_idu='true'),
+            self.get_row(self.other_entry),
+            self.get_row(self.entry, uuid=duplicate_uuid),
+            self.get_row(self.entry, uuid=duplicate_uuid),
+        ])
+
+        self.assertFalse(content['ok'], content)
+        self.assertEqual(content['createdCount'], 0)
+        self.assertFalse(Figure.objects.exists())
+        array_errors = {each['key']: each['objectErrors'] for each in content['errors'][0]['arrayErrors']}
+        self.assertEqual(content['errors'][0]['field'], 'figures')
+        self.assertEqual(len(array_errors), 3)
+        self.assertIn('excerptIdu', json.dumps(array_errors[invalid_uuid]))
+        self.assertIn('uuid', json.dumps(array_errors[duplicate_uuid]))
+
+    def test_skip_invalid_keeps_valid_rows(self):
+        content = self.import_figures([
+            self.get_row(self.entry),
+            self.get_row(self.entry, reported=-1),
+        ], skip_invalid=True)
+
+        self.assertFalse(content['ok'], content)
+        self.assertEqual(content['createdCount'], 1)
+        self.assertEqual(Figure.objects.count(), 1)
+
+    def test_invalid_file_type(self):
+        content = self.import_figures([self.get_row(self.entry)], name='figures.txt')
+
+        self.assertFalse(content['ok'], content)
+        self.assertEqual(content['errors'][0]['field'], 'non_field_errors')
+
+
+class TestExport(HelixTestCase):
+    def setUp(self) -> None:
+        self.entry = EntryFactory.create(article_title='Floods in Nepal')
+        self.other_entry = EntryFactory.create(article_title='Drought')
+        FigureFactory.create(entry=self.entry, unit=Figure.UNIT.PERSON, age_json=[
+            {'uuid': str(uuid4()), 'age_from': 1, 'age_to': 3, 'value': 3},
+            {'uuid': str(uuid4()), 'age_from': 4, 'age_to': 6, 'value': 5},
+        ])
+        FigureFactory.create(entry=self.other_entry, unit=Figure.UNIT.HOUSEHOLD)
+        self.client.force_login(create_user_with_role(GUEST))
+
+    def get_rows(self, response):
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_export_is_streamed_by_the_asgi_application(self):
+        from helix.asgi import application
+
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/export/entries',
+            'query_string': b'article_title__icontains=nepal',
+            'headers': [(b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode())],
+        }
+        # as the test client, the connection of the test transaction is kept open
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            async_to_sync(application)(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        self.assertEqual(messages[0]['status'], 200)
+        content = b''.join(message.get('body', b'') for message in messages[1:])
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.entry.id)])
+
+    def test_export_requires_login(self):
+        self.client.logout()
+        response = self.client.get('/export/entries')
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_filtered_entries(self):
+        response = self.client.get('/export/entries', {'article_title__icontains': 'nepal'})
+
+        self.assertEqual(response.status_code, 200)
+        rows = self.get_rows(response)
+        self.assertEqual(rows[0][:3], ['id', 'url', 'article_title'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.entry.id)])
+
+    def test_export_figures_flattens_disaggregation(self):
+        response = self.client.get('/export/figures', {'unit': Figure.UNIT.PERSON})
+
+        rows = self.get_rows(response)
+        header = rows[0]
+        self.assertEqual(header[-6:], ['age_1_from', 'age_1_to', 'age_1_value',
+                                       'age_2_from', 'age_2_to', 'age_2_value'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][header.index('unit')], 'PERSON')
+        self.assertEqual(rows[1][-6:], ['1', '3', '3', '4', '6', '5'])
+
+    def test_export_xlsx(self):
+        response = self.client.get('/export/figures', {'format': 'xlsx'})
+
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(list(workbook.active.rows)), 3)
+
+
+class TestCreateExport(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        FigureFactory.create_batch(3)
+        self.mutation = '''
+            mutation CreateExport($filters: GenericScalar) {
+                createExport(name: FIGURES, fileFormat: CSV, filters: $filters) {
+                    ok
+                    errors {
+                        field
+                        messages
+                    }
+                    job {
+                        id
+                        status
+                        fileUrl
+                    }
+                }
+            }
+        '''
+        self.job_query = '''
+            query Job($id: ID!) {
+                job(id: $id) {
+                    id
+                    status
+                }
+            }
+        '''
+        self.user = create_user_with_role(GUEST)
+        self.force_login(self.user)
+
+    def test_export_job(self):
+        response = self.query(self.mutation, variables={'filters': {'unit': Figure.UNIT.PERSON}})
+
+        content = json.loads(response.content)
+        self.assertResponseNoErrors(response)
+        self.assertTrue(content['data']['createExport']['ok'], content)
+        job = content['data']['createExport']['job']
+        self.assertEqual(job['status'], 'COMPLETED')
+        self.assertIn('figures.csv', job['fileUrl'])
+
+        response = self.query(self.job_query, variables={'id': job['id']})
+        self.assertEqual(json.loads(response.content)['data']['job']['id'], job['id'])
+        # not visible to the other users
+        self.force_login(create_user_with_role(GUEST))
+        response = self.query(self.job_query, variables={'id': job['id']})
+        self.assertIsNone(json.loads(response.content)['data']['job'])
+
+    def test_invalid_export_filters(self):
+        response = self.query(self.mutation, variables={'filters': {'start_date__gte': 'not a date'}})
+
+        content = json.loads(response.content)
+        self.assertFalse(content['data']['createExport']['ok'], content)
+        self.assertEqual(content['data']['createExport']['errors'][0]['field'], 'startDate_Gte')
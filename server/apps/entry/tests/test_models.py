@@ -1,10 +1,28 @@
-import os
+from datetime import timedelta
+from unittest.mock import patch
 
+from django.conf import settings
+from django.core import management
 from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.utils import timezone
 
-from apps.entry.models import Figure, SourcePreview
+from apps.contrib.models import Job
+from apps.entry.aggregates import get_owners
+from apps.entry.jobs import render_preview
+from apps.entry.models import (
+    Figure,
+    SourcePreview,
+    EntryFigureAggregate,
+    EventFigureAggregate,
+    CrisisFigureAggregate,
+    CountryFigureAggregate,
+)
+from apps.entry.previews import LocalPreviewBackend, RenderError
+from apps.entry.serializers import EntrySerializer
 from apps.users.roles import MONITORING_EXPERT_EDITOR, ADMIN, MONITORING_EXPERT_REVIEWER
-from utils.factories import EntryFactory, FigureFactory
+from utils.factories import CountryFactory, EntryFactory, EventFactory, FigureFactory
+from utils.jobs import claim_job
 from utils.tests import HelixTestCase, create_user_with_role
 
 
@@ -67,17 +85,213 @@ class TestEntryModel(HelixTestCase):
         admin = create_user_with_role(ADMIN)
         self.assertTrue(self.entry.can_be_updated_by(admin))
 
+    def test_groups_are_loaded_once(self):
+        admin = create_user_with_role(ADMIN)
+        entries = EntryFactory.create_batch(3, created_by=self.editor)
+        with self.assertNumQueries(1):
+            for entry in entries:
+                self.assertTrue(entry.can_be_updated_by(admin))
+                self.assertTrue(Figure(entry_id=entry.id).can_be_updated_by(admin))
+
+
+class TestFigureAggregates(HelixTestCase):
+    def setUp(self) -> None:
+        self.country = CountryFactory.create()
+        self.event = EventFactory.create()
+        self.event.countries.set([self.country])
+        self.entry = EntryFactory.create(event=self.event)
+
+    def get_totals(self):
+        def totals(model, **kwargs):
+            return {
+                (each.term, each.role, each.year): (each.total_figures, each.figures_count)
+                for each in model.objects.filter(**kwargs)
+            }
+        return [
+            totals(EntryFigureAggregate, entry=self.entry),
+            totals(EventFigureAggregate, event=self.event),
+            totals(CrisisFigureAggregate, crisis=self.event.crisis),
+            totals(CountryFigureAggregate, country=self.country),
+        ]
+
+    def assertTotals(self, expected):
+        for totals in self.get_totals():
+            self.assertEqual(totals, expected)
+
+    def test_figure_save_and_delete(self):
+        figure = FigureFactory.create(entry=self.entry, term=Figure.TERM.DISPLACED,
+                                      role=Figure.ROLE.RECOMMENDED, reported=10,
+                                      unit=Figure.UNIT.PERSON)
+        year = figure.start_date.year
+        key = (Figure.TERM.DISPLACED, Figure.ROLE.RECOMMENDED, year)
+        self.assertTotals({key: (10, 1)})
+        self.assertEqual(self.entry.total_figures, 10)
+
+        figure.reported = 15
+        figure.save()
+        self.assertTotals({key: (15, 1)})
+
+        figure.term = Figure.TERM.EVACUATED
+        figure.save()
+        self.assertTotals({(Figure.TERM.EVACUATED, Figure.ROLE.RECOMMENDED, year): (15, 1)})
+
+        figure.delete()
+        self.assertTotals({})
+
+    def test_entry_serializer_bulk_create(self):
+        figure = FigureFactory.build(term=Figure.TERM.DISPLACED, role=Figure.ROLE.RECOMMENDED,
+                                     reported=10, unit=Figure.UNIT.HOUSEHOLD, household_size=2)
+        data = {
+            field: getattr(figure, field)
+            for field in ['district', 'town', 'quantifier', 'reported', 'unit', 'household_size',
+                          'term', 'type', 'role', 'start_date', 'include_idu', 'uuid']
+        }
+        serializer = EntrySerializer()
+        self.entry = serializer.create(dict(
+            article_title='title',
+            source='source',
+            publisher='publisher',
+            publish_date=figure.start_date,
+            event=self.event,
+            figures=[data, dict(data, uuid='2a1d7d4e-3e3b-4f30-9a38-3b5d8b7e5f10')],
+        ))
+        self.assertEqual(set(self.entry.figures.values_list('total_figures', flat=True)), {20})
+        key = (Figure.TERM.DISPLACED, Figure.ROLE.RECOMMENDED, figure.start_date.year)
+        self.assertTotals({key: (40, 2)})
+
+    def test_event_countries_change(self):
+        FigureFactory.create(entry=self.entry, reported=10, unit=Figure.UNIT.PERSON)
+        country = CountryFactory.create()
+        self.event.countries.add(country)
+        self.assertEqual(CountryFigureAggregate.objects.get(country=country).total_figures, 10)
+        self.event.countries.clear()
+        self.assertFalse(CountryFigureAggregate.objects.exists())
+
+    def test_entry_event_change(self):
+        FigureFactory.create(entry=self.entry, reported=10, unit=Figure.UNIT.PERSON)
+        event = EventFactory.create()
+        self.entry.event = event
+        with patch('apps.entry.aggregates.enqueue') as enqueue:
+            self.entry.save()
+        # in the transaction of the save, instead of a rebuild in the background
+        enqueue.assert_not_called()
+        self.assertFalse(EventFigureAggregate.objects.filter(event=self.event).exists())
+        self.assertEqual(EventFigureAggregate.objects.get(event=event).total_figures, 10)
+        self.assertEqual(CrisisFigureAggregate.objects.get(crisis=event.crisis).total_figures, 10)
+
+    def test_entry_delete(self):
+        FigureFactory.create_batch(3, entry=self.entry, term=Figure.TERM.DISPLACED, role=Figure.ROLE.RECOMMENDED,
+                                   reported=10, unit=Figure.UNIT.PERSON)
+        figure = FigureFactory.create(entry=EntryFactory.create(event=self.event), term=Figure.TERM.DISPLACED,
+                                      role=Figure.ROLE.RECOMMENDED, reported=5, unit=Figure.UNIT.PERSON)
+        with patch('apps.entry.aggregates.get_owners', wraps=get_owners) as owners:
+            self.entry.delete()
+        # the figures of the entry are subtracted at once
+        owners.assert_called_once()
+        key = (Figure.TERM.DISPLACED, Figure.ROLE.RECOMMENDED, figure.start_date.year)
+        self.assertEqual(EventFigureAggregate.objects.get(event=self.event, year=key[2]).total_figures, 5)
+        self.assertEqual(CountryFigureAggregate.objects.get(country=self.country, year=key[2]).total_figures, 5)
+
+        figure.delete()
+        self.assertFalse(EventFigureAggregate.objects.filter(event=self.event).exists())
+
+    def test_rebuild_figure_aggregates(self):
+        FigureFactory.create_batch(5, entry=self.entry)
+        totals = self.get_totals()
+        EventFigureAggregate.objects.all().update(total_figures=0)
+        CountryFigureAggregate.objects.all().delete()
+        management.call_command('rebuild_figure_aggregates')
+        self.assertEqual(self.get_totals(), totals)
+
 
 class TestSourcePreviewModel(HelixTestCase):
-    def test_get_pdf(self):
-        if os.environ.get('GITHUB_WORKFLOW'):
-            print('Skipping because wkhtmltopdf requires display...')
-            return
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend')
+    @patch('apps.entry.previews.render_pdf', return_value=b'%PDF-1.4 preview')
+    def test_get_pdf(self, render):
         url = 'https://github.com/JazzCore/python-pdfkit/'
         preview = SourcePreview.get_pdf(url)
+        # rendered by the job
+        preview.refresh_from_db()
+        self.assertTrue(preview.completed)
         self.assertIn('.pdf', preview.pdf.name)
         self.assertTrue(default_storage.exists(preview.pdf.name))
+        first_name = preview.pdf.name
         # again
+        render.return_value = b'%PDF-1.4 updated'
         preview2 = SourcePreview.get_pdf(url, preview)
-        self.assertTrue(os.path.exists(preview2.pdf.name))
-        self.assertFalse(default_storage.exists(preview.pdf.name))
+        preview2.refresh_from_db()
+        self.assertNotEqual(preview2.pdf.name, first_name)
+        with default_storage.open(preview2.pdf.name) as file:
+            self.assertEqual(file.read(), b'%PDF-1.4 updated')
+
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend')
+    @patch('apps.entry.previews.render_pdf', return_value=b'%PDF-1.4 preview')
+    def test_recent_render_is_reused(self, render):
+        preview = SourcePreview.get_pdf('https://example.com/news?id=1')
+        preview.refresh_from_db()
+        reused = SourcePreview.get_pdf('HTTPS://EXAMPLE.com/news?id=1&utm_source=feed#top')
+        self.assertNotEqual(reused.id, preview.id)
+        self.assertTrue(reused.completed)
+        self.assertEqual(reused.pdf.name, preview.pdf.name)
+        # of the reused pdf
+        self.assertEqual(reused.rendered_at, preview.rendered_at)
+        self.assertEqual(render.call_count, 1)
+        # stale, even if reused since
+        SourcePreview.objects.filter(id__in=[preview.id, reused.id]).update(
+            rendered_at=timezone.now() - timedelta(seconds=settings.PREVIEW_REUSE_WINDOW + 1)
+        )
+        SourcePreview.get_pdf('https://example.com/news?id=1')
+        self.assertEqual(render.call_count, 2)
+
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend')
+    @patch('apps.entry.previews.render_pdf', return_value=b'%PDF-1.4 preview')
+    def test_identical_pdfs_are_stored_once(self, render):
+        preview = SourcePreview.get_pdf('https://example.com/a')
+        other = SourcePreview.get_pdf('https://example.com/b')
+        preview.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(other.pdf.name, preview.pdf.name)
+        self.assertEqual(render.call_count, 2)
+
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend')
+    @patch('apps.entry.previews.render_pdf', side_effect=RenderError('Rendering timed out.'))
+    def test_get_pdf_failure(self, render):
+        preview = SourcePreview.get_pdf('https://example.com')
+        preview.refresh_from_db()
+        self.assertFalse(preview.completed)
+        self.assertEqual(preview.reason, 'Rendering timed out.')
+
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend')
+    @patch('apps.entry.previews.render_pdf', return_value=b'%PDF-1.4 preview')
+    def test_in_flight_render_is_shared(self, render):
+        with patch.object(LocalPreviewBackend, 'generate') as generate:
+            preview = SourcePreview.get_pdf('https://example.com/news?id=1')
+            waiting = SourcePreview.get_pdf('https://example.com/news?id=1&utm_source=feed')
+        # enqueued once
+        generate.assert_called_once_with(preview)
+        self.assertFalse(waiting.completed)
+
+        LocalPreviewBackend.render(preview)
+        waiting.refresh_from_db()
+        self.assertTrue(waiting.completed)
+        self.assertEqual(waiting.pdf.name, preview.pdf.name)
+        self.assertEqual(waiting.rendered_at, preview.rendered_at)
+        self.assertEqual(render.call_count, 1)
+
+    @override_settings(SOURCE_PREVIEW_BACKEND='apps.entry.previews.LocalPreviewBackend', JOBS_EAGER=False)
+    def test_timed_out_render_fails_the_waiting_previews(self):
+        preview = SourcePreview.get_pdf('https://example.com/news?id=1')
+        waiting = SourcePreview.get_pdf('https://example.com/news?id=1&utm_source=feed')
+        instance = Job.objects.get(name=render_preview.job_name)
+        # left running by a killed worker, out of attempts
+        Job.objects.filter(id=instance.id).update(
+            status=Job.STATUS.RUNNING,
+            attempts=instance.max_attempts,
+            started_at=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT + 1),
+        )
+        self.assertIsNone(claim_job())
+        self.assertEqual(Job.objects.get(id=instance.id).status, Job.STATUS.FAILED)
+        for each in (preview, waiting):
+            each.refresh_from_db()
+            self.assertFalse(each.completed)
+            self.assertEqual(each.reason, 'Rendering failed: Timed out')
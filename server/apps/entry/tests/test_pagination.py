@@ -0,0 +1,104 @@
+import datetime
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.entry.models import Entry
+from apps.users.roles import GUEST
+from utils.factories import EntryFactory
+from utils.pagination import KeysetGraphqlPagination
+from utils.tests import HelixGraphQLTestCase, HelixTestCase, create_user_with_role
+
+
+class TestKeysetPagination(HelixTestCase):
+    def setUp(self) -> None:
+        self.entries = EntryFactory.create_batch(7)
+        self.pagination = KeysetGraphqlPagination(page_size=3)
+
+    def _walk(self, ordering, **kwargs):
+        ids = []
+        cursor = None
+        while True:
+            page = self.pagination.paginate_queryset(
+                Entry.objects.all(), ordering=ordering, after=cursor, **kwargs
+            )
+            ids.extend(each.id for each in page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return ids
+
+    def test_walk_forward(self):
+        self.assertEqual(self._walk('id'), sorted(each.id for each in self.entries))
+        self.assertEqual(self._walk('-id'), sorted((each.id for each in self.entries), reverse=True))
+
+    def test_walk_by_indexed_foreign_key(self):
+        expected = list(Entry.objects.order_by('-event', 'id').values_list('id', flat=True))
+        self.assertEqual(self._walk('-event'), expected)
+
+    def test_walk_backward(self):
+        first = self.pagination.paginate_queryset(Entry.objects.all(), ordering='id')
+        second = self.pagination.paginate_queryset(Entry.objects.all(), ordering='id', after=first.next_cursor)
+        self.assertIsNotNone(second.previous_cursor)
+        previous = self.pagination.paginate_queryset(Entry.objects.all(), ordering='id',
+                                                     before=second.previous_cursor)
+        self.assertEqual([each.id for each in previous], [each.id for each in first])
+        self.assertIsNone(previous.previous_cursor)
+
+    def test_ordering_must_be_index_backed(self):
+        with self.assertRaises(ValueError):
+            self.pagination.paginate_queryset(Entry.objects.all(), ordering='article_title')
+        with self.assertRaises(ValueError):
+            self.pagination.paginate_queryset(Entry.objects.all(), ordering='unknown')
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.pagination.paginate_queryset(Entry.objects.all(), after='not-a-cursor')
+
+    def test_cursor_of_another_ordering(self):
+        first = self.pagination.paginate_queryset(Entry.objects.all(), ordering='-event')
+        with self.assertRaises(ValueError):
+            self.pagination.paginate_queryset(Entry.objects.all(), ordering='id', after=first.next_cursor)
+
+    def test_cursor_keeps_the_microseconds(self):
+        value = datetime.datetime(2020, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc)
+        cursor = KeysetGraphqlPagination.encode_cursor([value, 1])
+        self.assertEqual(KeysetGraphqlPagination.decode_cursor(cursor, ['created_at', 'id']),
+                         [value.isoformat(), 1])
+
+
+class TestEntryListCursors(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.entries = EntryFactory.create_batch(7)
+        self.query_str = '''
+            query EntryList($after: String) {
+              entryList(ordering: "id", pageSize: 3, after: $after) {
+                totalCount
+                nextCursor
+                results {
+                  id
+                }
+              }
+            }
+        '''
+        self.force_login(create_user_with_role(GUEST))
+
+    def _query(self, after=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(self.query_str, variables={'after': after})
+        self.assertResponseNoErrors(response)
+        return json.loads(response.content)['data']['entryList'], context.captured_queries
+
+    def test_walk_with_the_cursors(self):
+        ids = []
+        page, _ = self._query()
+        self.assertEqual(page['totalCount'], 7)
+        ids.extend(int(each['id']) for each in page['results'])
+        while page['nextCursor']:
+            page, queries = self._query(page['nextCursor'])
+            # the pages after a cursor are not counted
+            self.assertIsNone(page['totalCount'])
+            self.assertFalse(any('COUNT(' in each['sql'] for each in queries))
+            self.assertFalse(any('OFFSET' in each['sql'] for each in queries))
+            ids.extend(int(each['id']) for each in page['results'])
+        self.assertEqual(ids, sorted(each.id for each in self.entries))
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 
 from apps.entry.serializers import EntrySerializer
 from apps.users.roles import MONITORING_EXPERT_EDITOR
@@ -77,3 +79,23 @@ class TestEntrySerializer(HelixTestCase):
         self.assertEqual(instance.last_modified_by, self.user)
         self.assertIsNotNone(instance.created_at)
         self.assertIsNotNone(instance.modified_at)
+
+    def test_relations_are_resolved_with_one_query_per_model(self):
+        reviewers = [create_user_with_role(MONITORING_EXPERT_EDITOR) for _ in range(10)]
+        self.data['reviewers'] = [str(each.id) for each in reviewers]
+        serializer = EntrySerializer(data=self.data, context={'request': self.request})
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        queries = [each['sql'] for each in context.captured_queries]
+        self.assertEqual(len([each for each in queries if 'FROM "users_user"' in each]), 1)
+        self.assertEqual(len([each for each in queries if 'FROM "event_event"' in each]), 1)
+        self.assertEqual(serializer.validated_data['reviewers'], reviewers)
+        self.assertEqual(serializer.validated_data['event'], self.event)
+
+    def test_missing_relations_are_invalid(self):
+        self.data['reviewers'] = [self.user.id, 0]
+        self.data['event'] = 0
+        serializer = EntrySerializer(data=self.data, context={'request': self.request})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('reviewers', serializer.errors)
+        self.assertIn('event', serializer.errors)
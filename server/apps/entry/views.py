@@ -1,8 +1,10 @@
 import json
 
-from django.http import JsonResponse
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 
+from apps.entry.exports import WRITERS, EntryExport, FigureExport
 from apps.entry.models import SourcePreview
 
 
@@ -20,12 +22,39 @@ def handle_pdf_generation(request):
         return JsonResponse({'message': 'Cannot find the preview'})
 
     if 'body' in response:
-        preview.completed = True
         # https://stackoverflow.com/a/50804853/3218199
-        s3_object_key = SourcePreview.PREVIEW_FOLDER + '/' + preview.token + '.pdf'
-        preview.pdf = s3_object_key
+        # stored by its content hash by the lambda (see serverless/lambda_function.py)
+        s3_object_key = response.get('key') or SourcePreview.PREVIEW_FOLDER + '/' + preview.token + '.pdf'
+        preview.finish(pdf=s3_object_key, content_hash=response.get('content_hash'))
     else:
-        preview.completed = False
-        preview.reason = response['errorMessage']
-    preview.save()
+        preview.finish(reason=response['errorMessage'])
     return JsonResponse({'message': 'OK'})
+
+
+def _export(request, export_class):
+    """
+    Streams the filtered list as csv (default) or xlsx (?format=xlsx), the filters are the
+    same as of the list queries eg. ?search=flood&article_title__icontains=nepal
+    """
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in WRITERS:
+        return JsonResponse({'format': [f'Choose one of {", ".join(WRITERS)}.']}, status=400)
+    export = export_class(request.GET, request=request)
+    if not export.is_valid():
+        return JsonResponse(export.errors, status=400)
+    stream, content_type = WRITERS[file_format]
+    response = StreamingHttpResponse(stream(export.get_rows()), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export.name}.{file_format}"'
+    return response
+
+
+@require_GET
+def export_entries(request):
+    return _export(request, EntryExport)
+
+
+@require_GET
+def export_figures(request):
+    return _export(request, FigureExport)
@@ -1,9 +1,11 @@
 import django_filters
 
 from apps.event.models import Event
+from utils.filters import SearchFilter
 
 
 class EventFilter(django_filters.FilterSet):
+    search = SearchFilter()
     name_contains = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
 
     class Meta:
@@ -1,5 +1,7 @@
 from collections import OrderedDict
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _, gettext
 from django_enumfield import enum
@@ -132,6 +134,11 @@ class Event(MetaInformationAbstractModel, models.Model):
                                 blank=True, null=True)
     event_narrative = models.TextField(verbose_name=_('Event Narrative'),
                                        null=True, blank=True)
+    # updated by a database trigger (see utils/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'])]
 
     @staticmethod
     def clean_dates(values: dict, instance=None) -> OrderedDict:
@@ -1,8 +1,9 @@
 import graphene
-from graphene_django_extras import DjangoObjectType, PageGraphqlPagination, DjangoObjectField, DjangoFilterListField
+from graphene_django_extras import DjangoObjectType, DjangoObjectField, DjangoFilterListField
 
 from apps.country.schema import CountryType
 from apps.crisis.enums import CrisisTypeGrapheneEnum
+from apps.entry.models import EventFigureAggregate
 from apps.event.models import (
     Event, 
     Trigger, 
@@ -16,7 +17,11 @@ from apps.event.models import (
     DisasterType
 )
 from apps.event.filters import EventFilter
-from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType, CustomDjangoListField
+from utils.dataloaders import get_dataloader, load_foreign_key, load_many_to_many, load_reverse_foreign_key, \
+    SumDataLoader
+from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType, CustomDjangoListField, \
+    CustomDjangoFilterListField
+from utils.pagination import PageGraphqlPagination
 
 
 class TriggerSubObjectType(DjangoObjectType):
@@ -56,6 +61,9 @@ class ViolenceType(DjangoObjectType):
 
     sub_types = CustomDjangoListField(ViolenceSubObjectType)
 
+    def resolve_sub_types(root, info, **kwargs):
+        return load_reverse_foreign_key(info, root, ViolenceSubType, 'violence')
+
 
 class ActorType(DjangoObjectType):
     class Meta:
@@ -112,7 +120,7 @@ class DisasterCategoryType(DjangoObjectType):
 class EventType(DjangoObjectType):
     class Meta:
         model = Event
-        exclude_fields = ('entries',)
+        exclude_fields = ('entries', 'search_vector')
 
     event_type = graphene.Field(CrisisTypeGrapheneEnum)
     trigger = graphene.Field(TriggerType)
@@ -120,7 +128,48 @@ class EventType(DjangoObjectType):
     violence = graphene.Field(ViolenceType)
     violence_sub_type = graphene.Field(ViolenceSubObjectType)
     actor = graphene.Field(ActorType)
-    countries = DjangoFilterListField(CountryType)
+    countries = CustomDjangoFilterListField(CountryType)
+    total_figures = graphene.Field(graphene.Int)
+    figure_aggregates = graphene.List('apps.entry.schema.FigureAggregateType')
+
+    def resolve_total_figures(root, info, **kwargs):
+        return get_dataloader(info, SumDataLoader, EventFigureAggregate, 'event', 'total_figures').load(root.pk)
+
+    def resolve_figure_aggregates(root, info, **kwargs):
+        return load_reverse_foreign_key(info, root, EventFigureAggregate, 'event')
+
+    def resolve_crisis(root, info, **kwargs):
+        return load_foreign_key(info, root, 'crisis')
+
+    def resolve_trigger(root, info, **kwargs):
+        return load_foreign_key(info, root, 'trigger')
+
+    def resolve_trigger_sub_type(root, info, **kwargs):
+        return load_foreign_key(info, root, 'trigger_sub_type')
+
+    def resolve_violence(root, info, **kwargs):
+        return load_foreign_key(info, root, 'violence')
+
+    def resolve_violence_sub_type(root, info, **kwargs):
+        return load_foreign_key(info, root, 'violence_sub_type')
+
+    def resolve_actor(root, info, **kwargs):
+        return load_foreign_key(info, root, 'actor')
+
+    def resolve_disaster_category(root, info, **kwargs):
+        return load_foreign_key(info, root, 'disaster_category')
+
+    def resolve_disaster_sub_category(root, info, **kwargs):
+        return load_foreign_key(info, root, 'disaster_sub_category')
+
+    def resolve_disaster_type(root, info, **kwargs):
+        return load_foreign_key(info, root, 'disaster_type')
+
+    def resolve_disaster_sub_type(root, info, **kwargs):
+        return load_foreign_key(info, root, 'disaster_sub_type')
+
+    def resolve_countries(root, info, **kwargs):
+        return load_many_to_many(info, root, 'countries')
 
 
 class EventListType(CustomDjangoListObjectType):
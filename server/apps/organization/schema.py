@@ -1,8 +1,10 @@
-from graphene_django_extras import DjangoObjectType, PageGraphqlPagination, DjangoObjectField
+from graphene_django_extras import DjangoObjectType, DjangoObjectField
 
 from apps.contact.schema import ContactListType
 from apps.organization.models import Organization, OrganizationKind
+from utils.dataloaders import load_foreign_key
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 
 
 class OrganizationType(DjangoObjectType):
@@ -12,6 +14,12 @@ class OrganizationType(DjangoObjectType):
     contacts = DjangoPaginatedListObjectField(ContactListType,
                                               pagination=PageGraphqlPagination(page_size_query_param='pageSize'))
 
+    def resolve_organization_kind(root, info, **kwargs):
+        return load_foreign_key(info, root, 'organization_kind')
+
+    def resolve_parent(root, info, **kwargs):
+        return load_foreign_key(info, root, 'parent')
+
 
 class OrganizationListType(CustomDjangoListObjectType):
     class Meta:
@@ -5,6 +5,7 @@ from django.utils.translation import gettext_lazy as _, gettext
 from apps.contact.models import Contact
 from apps.contact.serializers import ContactWithoutOrganizationSerializer
 from apps.organization.models import Organization, OrganizationKind
+from utils.counts import bump_table_version
 
 
 class OrganizationKindSerializer(serializers.ModelSerializer):
@@ -34,6 +35,8 @@ class OrganizationSerializer(serializers.ModelSerializer):
                 Contact.objects.bulk_create([
                     Contact(**each, organization=organization) for each in contacts
                 ])
+                # bulk_create does not send post_save
+                bump_table_version(Contact)
         else:
             organization = Organization.objects.create(**validated_data)
         return organization
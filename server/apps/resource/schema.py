@@ -1,8 +1,9 @@
-from graphene_django_extras import DjangoObjectType, PageGraphqlPagination, DjangoObjectField
+from graphene_django_extras import DjangoObjectType, DjangoObjectField
 
 from apps.resource.models import Resource, ResourceGroup
 from apps.resource.filters import ResourceFilter, ResourceGroupFilter
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 
 
 
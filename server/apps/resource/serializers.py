@@ -3,21 +3,23 @@ from rest_framework import serializers
 
 from apps.resource.models import Resource, ResourceGroup
 
-from apps.contrib.serializers import MetaInformationSerializerMixin
+from apps.contrib.serializers import MetaInformationSerializerMixin, RelatedObjectsSerializerMixin
 
 
-class ResourceSerializer(MetaInformationSerializerMixin, serializers.ModelSerializer):
+class ResourceSerializer(RelatedObjectsSerializerMixin, MetaInformationSerializerMixin,
+                         serializers.ModelSerializer):
     class Meta:
         model = Resource
         fields = '__all__'
 
     def validate_group(self, group):
-        if group and group.created_by != self.context['request'].user:
+        if group and group.created_by_id != self.context['request'].user.id:
             raise serializers.ValidationError(gettext('Group does not exist.'))
         return group
 
 
-class ResourceGroupSerializer(MetaInformationSerializerMixin, serializers.ModelSerializer):
+class ResourceGroupSerializer(RelatedObjectsSerializerMixin, MetaInformationSerializerMixin,
+                              serializers.ModelSerializer):
     class Meta:
         model = ResourceGroup
         fields = '__all__'
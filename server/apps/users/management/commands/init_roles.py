@@ -2,6 +2,7 @@ from django.contrib.auth.models import Permission, Group
 from django.core.management.base import BaseCommand
 
 from apps.users.roles import ROLES, PERMISSIONS
+from utils.permissions import bump_permissions_version
 
 
 class Command(BaseCommand):
@@ -18,3 +19,5 @@ class Command(BaseCommand):
             group.permissions.set(permissions)
             self.stdout.write(self.style.SUCCESS(f'{"Created" if created else "Updated"} '
                                                  f'{role} with {len(permissions)} permissions.'))
+        # the cached roles and permissions of the users
+        bump_permissions_version()
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 
+from utils.permissions import get_user_permissions
+
 
 class User(AbstractUser):
     email = models.EmailField(verbose_name=_('Email Address'), unique=True)
@@ -16,9 +18,8 @@ class User(AbstractUser):
 
     @property
     def role(self):
-        if group := self.groups.first():
-            return group.name
-        return None
+        # cached, see utils/permissions.py
+        return get_user_permissions(self).role
 
     def get_full_name(self):
         return f'{self.first_name}, {self.last_name}'
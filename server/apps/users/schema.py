@@ -3,9 +3,11 @@ import graphene
 from graphene import Field
 from graphene.types.utils import get_type
 # from graphene_django import DjangoObjectType
-from graphene_django_extras import PageGraphqlPagination, DjangoObjectType
+from graphene_django_extras import DjangoObjectType
 
+from utils.dataloaders import get_dataloader, RoleDataLoader
 from utils.fields import DjangoPaginatedListObjectField, CustomDjangoListObjectType
+from utils.pagination import PageGraphqlPagination
 from apps.users.filters import UserFilter
 
 User = get_user_model()
@@ -28,6 +30,9 @@ class UserType(DjangoObjectType):
                                                    ), accessor='created_entry')
     role = Field(graphene.String)
 
+    def resolve_role(root, info, **kwargs):
+        return get_dataloader(info, RoleDataLoader).load(root.pk)
+
 
 class UserListType(CustomDjangoListObjectType):
     class Meta:
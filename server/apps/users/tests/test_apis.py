@@ -1,10 +1,17 @@
 import json
+from io import StringIO
 
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.contrib.auth.tokens import default_token_generator
+from django.core import management
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from djoser.utils import encode_uid
 
 from apps.users.roles import MONITORING_EXPERT_EDITOR, ADMIN, IT_HEAD, MONITORING_EXPERT_REVIEWER
 from utils.factories import EntryFactory
+from utils.permissions import get_permissions_version, get_user_permissions
 from utils.tests import HelixGraphQLTestCase, create_user_with_role
 
 
@@ -345,3 +352,101 @@ class TestUserListSchema(HelixGraphQLTestCase):
         self.assertEqual(sorted([int(each['id']) for each in content['data']['users']['results']]),
                          sorted([ur.id, ue.id]))
 
+    def test_prefetched_review_entries_are_annotated_and_paged(self):
+        query = '''
+            query Users {
+              users {
+                results {
+                  id
+                  reviewEntries(page: -1, pageSize: 10) {
+                    results {
+                      id
+                      canEdit
+                    }
+                  }
+                }
+              }
+            }
+        '''
+        editor = create_user_with_role(MONITORING_EXPERT_EDITOR)
+        other = create_user_with_role(MONITORING_EXPERT_EDITOR)
+        own = EntryFactory.create(created_by=editor)
+        EntryFactory.create(created_by=other).reviewers.set([editor])
+        own.reviewers.set([editor])
+        self.force_login(editor)
+
+        def execute():
+            with CaptureQueriesContext(connection) as context:
+                response = self.query(query)
+            self.assertResponseNoErrors(response)
+            return len(context.captured_queries), response.json()
+
+        initial_count, _ = execute()
+        for entry in EntryFactory.create_batch(3, created_by=other):
+            entry.reviewers.set([editor, other])
+        final_count, content = execute()
+
+        self.assertEqual(initial_count, final_count)
+        results = {int(each['id']): each['reviewEntries']['results'] for each in content['data']['users']['results']}
+        self.assertEqual(len(results[editor.id]), 5)
+        self.assertEqual(len(results[other.id]), 3)
+        for each in results[editor.id]:
+            self.assertEqual(each['canEdit'], each['id'] == str(own.id))
+
+
+class TestPermissionsCache(HelixGraphQLTestCase):
+    def setUp(self) -> None:
+        self.editor = create_user_with_role(MONITORING_EXPERT_EDITOR)
+        self.users_q = '''
+            query Users {
+              users {
+                results {
+                  id
+                  role
+                }
+              }
+            }
+        '''
+
+    def get_user(self):
+        # a new instance, as on each request
+        return get_user_model().objects.get(pk=self.editor.pk)
+
+    def test_permission_checks_are_cached_across_requests(self):
+        self.assertTrue(get_user_permissions(self.get_user()).has_perms(['entry.change_entry']))
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(get_user_permissions(user).has_perms(['entry.change_entry']))
+            self.assertTrue(user.has_perm('entry.change_entry'))
+            self.assertEqual(user.role, MONITORING_EXPERT_EDITOR)
+
+    def test_roles_are_invalidated(self):
+        self.assertEqual(self.get_user().role, MONITORING_EXPERT_EDITOR)
+        self.editor.groups.set([Group.objects.get(name=MONITORING_EXPERT_REVIEWER)])
+        user = self.get_user()
+        self.assertEqual(user.role, MONITORING_EXPERT_REVIEWER)
+        self.assertFalse(get_user_permissions(user).has_perms(['entry.change_entry']))
+
+        version = get_permissions_version()
+        management.call_command('init_roles', stdout=StringIO())
+        self.assertNotEqual(get_permissions_version(), version)
+
+    def test_superuser_and_active_flags_are_not_cached(self):
+        perms = get_user_permissions(self.get_user()).perms
+        self.assertIn('entry.change_entry', perms)
+        self.assertNotIn('auth.delete_group', perms)
+        get_user_model().objects.filter(pk=self.editor.pk).update(is_superuser=True)
+        self.assertIn('auth.delete_group', get_user_permissions(self.get_user()).perms)
+        get_user_model().objects.filter(pk=self.editor.pk).update(is_superuser=False, is_active=False)
+        self.assertEqual(get_user_permissions(self.get_user()).perms, set())
+
+    def test_roles_of_the_lists_are_batched(self):
+        create_user_with_role(ADMIN)
+        self.force_login(self.editor)
+        response = self.query(self.users_q)
+        self.assertResponseNoErrors(response)
+        with CaptureQueriesContext(connection) as context:
+            content = self.query(self.users_q).json()
+        self.assertFalse(any('auth_group' in each['sql'] for each in context.captured_queries))
+        roles = {int(each['id']): each['role'] for each in content['data']['users']['results']}
+        self.assertEqual(roles[self.editor.id], MONITORING_EXPERT_EDITOR)
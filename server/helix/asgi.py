@@ -3,14 +3,78 @@ ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+eg. uvicorn helix.asgi:application --host 0.0.0.0 --port 9000
+
+The connections and the request bodies (including the multipart uploads, spooled to disk past
+FILE_UPLOAD_MAX_MEMORY_SIZE) are handled by the event loop, the views run on a pool of
+ASGI_THREADS threads and the graphql resolvers on the pool of utils/executors.py.
+Each of these threads can hold a database connection, see CONN_MAX_AGE and DB_POOL_ENABLED in
+helix/settings.py for the connections of the workers.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
-
+# read by asgiref when imported, the requests handled at once by each process
+os.environ.setdefault('ASGI_THREADS', '16')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'helix.settings')
 
-application = get_asgi_application()
+import django  # noqa: E402
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+
+STREAM_END = object()
+
+
+class HelixASGIHandler(ASGIHandler):
+    """
+    Iterates the streamed responses on the thread of the views, eg. the exports reading their rows
+    from the database while they are sent (Django 3.0 iterates them in the event loop, where the
+    database can not be used)
+    """
+    async def send_response(self, response, send):
+        # as django.core.handlers.asgi.ASGIHandler.send_response
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', c.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+        if response.streaming:
+            parts = iter(response)
+            while True:
+                part = await sync_to_async(next, thread_sensitive=True)(parts, STREAM_END)
+                if part is STREAM_END:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        else:
+            for chunk, last in self.chunk_bytes(response.content):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': not last,
+                })
+        # sends request_finished, which uses the database connections too
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+django.setup(set_prefix=False)
+application = HelixASGIHandler()
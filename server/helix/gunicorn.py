@@ -0,0 +1,99 @@
+"""
+Gunicorn config, with the uvicorn workers serving helix.asgi
+
+eg. gunicorn -c python:helix.gunicorn helix.asgi:application
+
+The profile is chosen by HELIX_ENVIRONMENT, the GUNICORN_* variables override it.
+The production profile preloads the application (and the graphql schema) in the master so the
+workers share its memory, and recycles the workers after a number of requests.
+https://docs.gunicorn.org/en/stable/settings.html
+"""
+import gc
+import multiprocessing
+import os
+import tempfile
+
+HELIX_ENVIRONMENT = os.environ.get('HELIX_ENVIRONMENT', 'development').lower()
+CPU_COUNT = multiprocessing.cpu_count()
+
+PROFILES = {
+    'development': dict(
+        workers=1,
+        reload=True,
+        preload_app=False,
+        max_requests=0,
+        timeout=0,
+        db_pool=False,
+        metrics_dir='',
+    ),
+    'production': dict(
+        # the workers are asynchronous, the blocking calls are on their thread pools sharing the
+        # pooled database connections of the worker (see DB_POOL_ENABLED in helix/settings.py)
+        workers=CPU_COUNT * 2 + 1,
+        reload=False,
+        preload_app=True,
+        max_requests=5000,
+        timeout=60,
+        db_pool=True,
+        # the metrics of all the workers are returned by /metrics (see METRICS_DIR in helix/settings.py)
+        metrics_dir=os.path.join(tempfile.gettempdir(), 'helix-metrics'),
+    ),
+}
+PROFILES['testing'] = PROFILES['nightly'] = PROFILES['production']
+profile = PROFILES.get(HELIX_ENVIRONMENT, PROFILES['production'])
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:9000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('GUNICORN_WORKERS', profile['workers']))
+# read by helix/settings.py, which divides DB_CONNECTION_BUDGET between the workers
+os.environ['GUNICORN_WORKERS'] = str(workers)
+os.environ.setdefault('DB_POOL_ENABLED', str(profile['db_pool']))
+metrics_dir = os.environ.setdefault('METRICS_DIR', profile['metrics_dir'])
+reload = profile['reload']
+preload_app = os.environ.get('GUNICORN_PRELOAD', str(profile['preload_app'])) == 'True'
+# the workers are replaced after max_requests (with a jitter so they do not restart at once),
+# finishing their current requests within graceful_timeout
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', profile['max_requests']))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', profile['timeout']))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    if metrics_dir:
+        from utils.instrumentation import reset_metrics_dir
+
+        reset_metrics_dir(metrics_dir)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from django.urls import get_resolver
+
+    # the views and the graphql schema, imported lazily by the first request otherwise
+    get_resolver().url_patterns
+    # the preloaded objects are never collected, so their pages are not copied by the workers
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    # the connections opened by the master are not shared with the workers
+    if preload_app:
+        from django.db import connections
+
+        from utils.db import close_pools
+
+        connections.close_all()
+        close_pools()
+
+
+def child_exit(server, worker):
+    # the counters of the exited worker stay in the totals
+    if metrics_dir:
+        from utils.instrumentation import archive_metrics
+
+        archive_metrics(metrics_dir, worker.pid)
@@ -1,6 +1,7 @@
 import graphene
 from graphene_django.debug import DjangoDebug
 
+from apps.contrib import schema as contrib_schema
 from apps.users import schema as user_schema, mutations as user_mutations
 from apps.contact import schema as contact_schema, mutations as contact_mutations
 from apps.organization import schema as organization_schema, mutations as organization_mutations
@@ -11,7 +12,8 @@ from apps.entry import schema as entry_schema, mutations as entry_mutations
 from apps.resource import schema as resource_schema, mutations as resource_mutations
 
 
-class Query(user_schema.Query,
+class Query(contrib_schema.Query,
+            user_schema.Query,
             contact_schema.Query,
             organization_schema.Query,
             country_schema.Query,
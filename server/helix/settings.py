@@ -73,6 +73,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.middleware.ConnectionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -133,6 +134,54 @@ else:
         }
     }
 
+# connections shared by the threads of each process (see utils/pooled_postgresql), at most
+# DB_POOL_MAX_SIZE per process, a checkout waits up to DB_POOL_TIMEOUT seconds for one
+# (enabled by the production profile of helix/gunicorn.py)
+DB_POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', 'False') == 'True'
+# connections of all the gunicorn workers (GUNICORN_WORKERS, exported by helix/gunicorn.py) to a
+# database, below the max_connections of postgres (100) with room for the jobs and the migrations
+DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', 80))
+DB_POOL_MAX_SIZE = int(os.environ.get(
+    'DB_POOL_MAX_SIZE',
+    max(DB_CONNECTION_BUDGET // int(os.environ.get('GUNICORN_WORKERS', 1)), 1),
+))
+DB_POOL_MIN_SIZE = min(int(os.environ.get('DB_POOL_MIN_SIZE', 2)), DB_POOL_MAX_SIZE)
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# seconds after which the idle (beyond DB_POOL_MIN_SIZE) and the old connections are closed
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', 5*60))
+DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME', 60*60))
+if DB_POOL_ENABLED:
+    DATABASES['default']['ENGINE'] = 'utils.pooled_postgresql'
+# seconds the connections are kept open for the next requests, 0 to close them after each request
+# (returned to the pool with DB_POOL_ENABLED)
+# Without the pool every thread of a process (ASGI_THREADS and GRAPHQL_EXECUTOR_THREADS, see
+# helix/asgi.py) can hold a connection, eg. (16 + 8) for each of the gunicorn workers, which is
+# above the max_connections of postgres (100) from 4 workers if they are kept open: the pool
+# bounds them to DB_POOL_MAX_SIZE per process instead, DB_CONNECTION_BUDGET for all the workers.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', 0))
+
+# read replicas of the default database for the graphql queries (see utils/replicas.py),
+# comma separated <host>[:<port>] with the credentials of the default database
+READ_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICAS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    READ_REPLICAS.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['utils.replicas.ReplicaRouter']
+# seconds of replication delay after which the replica is not used, checked every interval
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+REPLICA_LAG_CHECK_INTERVAL = int(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+# seconds during which a session reads from the primary after it wrote
+READ_YOUR_WRITES_WINDOW = int(os.environ.get('READ_YOUR_WRITES_WINDOW', 10))
+
+# persistent and pooled connections idle for longer are checked before they are used (see utils/db.py)
+DB_HEALTH_CHECK_IDLE = int(os.environ.get('DB_HEALTH_CHECK_IDLE', 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -180,6 +229,8 @@ GRAPHENE = {
     'SCHEMA_INDENT': 2,  # Defaults to None (displays all data on a single line)
     'MIDDLEWARE': (
         # 'utils.middlewares.AuthorizationMiddleware',
+        'utils.middleware.ReplicaMiddleware',
+        'utils.middleware.TimingMiddleware',
     ),
 }
 
@@ -187,12 +238,61 @@ GRAPHENE_DJANGO_EXTRAS = {
     'DEFAULT_PAGINATION_CLASS': 'graphene_django_extras.paginations.PageGraphqlPagination',
     'DEFAULT_PAGE_SIZE': 20,
     'MAX_PAGE_SIZE': 50,
-    # 'CACHE_ACTIVE': True,
-    # 'CACHE_TIMEOUT': 300    # seconds
+    # the responses are cached by the view instead, see GRAPHQL_RESPONSE_CACHE_TIMEOUT
 }
+# totalCount of the paginated lists: exact, cached or estimated (see utils/counts.py)
+LIST_COUNT_STRATEGY = os.environ.get('LIST_COUNT_STRATEGY', 'exact')
+LIST_COUNT_CACHE_TIMEOUT = int(os.environ.get('LIST_COUNT_CACHE_TIMEOUT', 5*60))
+LIST_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get('LIST_COUNT_ESTIMATE_THRESHOLD', 100000))
+# roles and permissions of the users, invalidated by their changes (see utils/permissions.py)
+PERMISSIONS_CACHE_TIMEOUT = int(os.environ.get('PERMISSIONS_CACHE_TIMEOUT', 60*60))
+
+# number of parsed and validated graphql documents kept in memory (see utils/backends.py)
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get('GRAPHQL_DOCUMENT_CACHE_SIZE', 500))
+# estimated number of resolved objects and nesting allowed per query (see utils/validation.py)
+GRAPHQL_MAX_QUERY_COST = int(os.environ.get('GRAPHQL_MAX_QUERY_COST', 50000))
+GRAPHQL_MAX_QUERY_DEPTH = int(os.environ.get('GRAPHQL_MAX_QUERY_DEPTH', 12))
+# responses of the queries selecting only these root fields, cached per role and invalidated by the
+# writes to the selected models (see utils/response_cache.py), 0 to disable
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('GRAPHQL_RESPONSE_CACHE_TIMEOUT', 5*60))
+GRAPHQL_CACHED_FIELDS = set(os.environ.get(
+    'GRAPHQL_CACHED_FIELDS',
+    'triggerList,subTypeTriggerList,violenceList,actorList,disasterCategoryList,disasterSubCategoryList,'
+    'disasterTypeList,disasterSubTypeList,countryList,organizationKindList'
+).split(','))
+
+# threads of each process running the root fields of the queries and the dataloader batches
+# concurrently (see utils/executors.py), 0 to run them on the request thread
+GRAPHQL_EXECUTOR_THREADS = int(os.environ.get('GRAPHQL_EXECUTOR_THREADS', 8))
+
+# share of the graphql requests with the resolver and SQL timings (see utils/instrumentation.py)
+GRAPHQL_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('GRAPHQL_INSTRUMENTATION_SAMPLE_RATE', 0.1))
+GRAPHQL_METRICS_MAX_SERIES = int(os.environ.get('GRAPHQL_METRICS_MAX_SERIES', 2000))
+# bearer token required by the /metrics endpoint, it is disabled without it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# directory shared by the gunicorn workers, where each of them writes its metrics so that /metrics
+# returns the totals of all the workers (set by the production profile of helix/gunicorn.py)
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+
+# rows of the imported figure files validated and written at once (see apps/entry/imports.py)
+FIGURE_IMPORT_CHUNK_SIZE = int(os.environ.get('FIGURE_IMPORT_CHUNK_SIZE', 500))
+# rows fetched at once by the server side cursor of the exports (see apps/entry/exports.py)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# background jobs (see utils/jobs.py), the delays are in seconds
+JOBS_EAGER = os.environ.get('JOBS_EAGER', 'False') == 'True'
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+JOB_RETRY_MAX_DELAY = int(os.environ.get('JOB_RETRY_MAX_DELAY', 60*60))
+# running jobs are claimed again after the timeout, eg. when their worker was killed
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 30*60))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+
 if DEBUG:
     GRAPHENE['MIDDLEWARE'] = (
         'graphene_django.debug.DjangoDebugMiddleware',
+        'utils.middleware.ReplicaMiddleware',
+        'utils.middleware.TimingMiddleware',
     )
 
 AUTHENTICATION_BACKEND = [
@@ -248,6 +348,11 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
 AWS_STORAGE_BUCKET_NAME = S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', 'togglecorp-helix')
 AWS_S3_REGION_NAME = os.environ.get('AWS_REGION', 'us-east-1')
 AWS_QUERYSTRING_EXPIRE = int(os.environ.get('AWS_QUERYSTRING_EXPIRE', 12*60*60))
+# signed urls of the files, in the shared cache then in memory of each process (see utils/file_urls.py)
+# the urls are cached for half of their validity so that they are never handed out about to expire
+FILE_URL_CACHE_TIMEOUT = int(os.environ.get('FILE_URL_CACHE_TIMEOUT', AWS_QUERYSTRING_EXPIRE // 2))
+FILE_URL_LOCAL_CACHE_TIMEOUT = int(os.environ.get('FILE_URL_LOCAL_CACHE_TIMEOUT', 10*60))
+FILE_URL_LOCAL_CACHE_SIZE = int(os.environ.get('FILE_URL_LOCAL_CACHE_SIZE', 10000))
 
 SLS_SERVICE_NAME = os.environ.get('SLS_SERVICE_NAME', 'helix-serverless')
 PDF_GENERATOR = os.environ.get('PDF_GENERATOR', 'generatePdf')
@@ -259,3 +364,12 @@ SLS_STAGES = {
 }
 sls_stage = SLS_STAGES[HELIX_ENVIRONMENT.lower()]
 LAMBDA_HTML_TO_PDF = os.environ.get('LAMBDA_HTML_TO_PDF', f'{SLS_SERVICE_NAME}-{sls_stage}-{PDF_GENERATOR}')
+
+# source previews rendered by the lambda or locally by the job workers (see apps/entry/previews.py)
+SOURCE_PREVIEW_BACKEND = os.environ.get('SOURCE_PREVIEW_BACKEND', 'apps.entry.previews.LambdaPreviewBackend')
+# found in the PATH if not set
+WKHTMLTOPDF_PATH = os.environ.get('WKHTMLTOPDF_PATH')
+# one render at a time for each job worker, killed after the timeout (seconds)
+PREVIEW_RENDER_TIMEOUT = int(os.environ.get('PREVIEW_RENDER_TIMEOUT', 60))
+# seconds during which a completed preview of the same url is reused, 0 to always render
+PREVIEW_REUSE_WINDOW = int(os.environ.get('PREVIEW_REUSE_WINDOW', 24*60*60))
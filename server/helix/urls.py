@@ -18,16 +18,18 @@ from django.contrib import admin
 from django.conf import settings
 from django.urls import path, include
 from django.views.decorators.csrf import csrf_exempt
-# from graphene_django.views import GraphQLView
 # from django.contrib.auth.mixins import LoginRequiredMixin
-from graphene_file_upload.django import FileUploadGraphQLView
 
-FileUploadGraphQLView.graphiql_template = "graphene_graphiql_explorer/graphiql.html"
+from apps.entry.views import export_entries, export_figures
+from helix.views import CustomGraphQLView, metrics
 
 urlpatterns = [
     path('admin', admin.site.urls),
-    path('graphiql', csrf_exempt(FileUploadGraphQLView.as_view(graphiql=True))),
-    path('graphql', csrf_exempt(FileUploadGraphQLView.as_view())),
+    path('graphiql', csrf_exempt(CustomGraphQLView.as_view(graphiql=True))),
+    path('graphql', csrf_exempt(CustomGraphQLView.as_view())),
+    path('metrics', metrics),
+    path('export/entries', export_entries),
+    path('export/figures', export_figures),
     path('webhooks', include('helix.webhooks'))
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) \
     + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.crypto import constant_time_compare
+from graphene_django.views import HttpError
+from graphene_file_upload.django import FileUploadGraphQLView
+from graphql import GraphQLError
+
+from apps.contrib.models import PersistedQuery
+from utils.backends import document_backend
+from utils.db import render_pool_metrics
+from utils.executors import ConcurrentExecutor
+from utils.instrumentation import instrument_request, metrics_registry
+from utils.replicas import pin_to_primary, routing_scope
+from utils.response_cache import get_response_cache_key, set_cached_response
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+class CustomGraphQLView(FileUploadGraphQLView):
+    """
+    GraphQL view with the cached document backend, the concurrent executor, the read replicas,
+    the response cache and the persisted queries
+
+    A persisted query is requested (GET or POST) without the `query` but with its hash, in the
+    same format as the apollo client:
+    `{"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "<hash>"}}}`
+
+    The GET responses have an ETag, so the clients can revalidate them with If-None-Match.
+    """
+    graphiql_template = "graphene_graphiql_explorer/graphiql.html"
+
+    def __init__(self, *args, backend=None, **kwargs):
+        # GraphQLView ignores the backend class attribute
+        super().__init__(*args, backend=backend or document_backend, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        with instrument_request(request), routing_scope(request) as routing:
+            # stateful, so one per request
+            self.executor = request.graphql_executor = ConcurrentExecutor(request)
+            response = super().dispatch(request, *args, **kwargs)
+        if routing.wrote:
+            pin_to_primary(response)
+        response = self.get_conditional_response(request, response)
+        if request.timings is not None:
+            response['Server-Timing'] = request.timings.get_server_timing()
+        return response
+
+    @staticmethod
+    def get_conditional_response(request, response):
+        if request.method != 'GET' or response.status_code != 200 or \
+                not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        etag = quote_etag(hashlib.sha256(response.content).hexdigest())
+        response['ETag'] = etag
+        # the responses depend on the session
+        patch_vary_headers(response, ('Cookie',))
+        return get_conditional_response(request, etag=etag, response=response)
+
+    @staticmethod
+    def get_persisted_query_hash(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if not extensions:
+            return None
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        persisted_query = extensions.get('persistedQuery') or {}
+        return persisted_query.get('sha256Hash')
+
+    @staticmethod
+    def get_graphql_params(request, data):
+        query, variables, operation_name, id = FileUploadGraphQLView.get_graphql_params(request, data)
+        if not query:
+            query_hash = CustomGraphQLView.get_persisted_query_hash(request, data)
+            if query_hash:
+                query = PersistedQuery.get_query(query_hash)
+                if query is None:
+                    raise HttpError(HttpResponseBadRequest(PERSISTED_QUERY_NOT_FOUND))
+        return query, variables, operation_name, id
+
+    def get_cache_key(self, request, query, variables, operation_name):
+        if not query or self.batch or not settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT:
+            return None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except GraphQLError:
+            # reported by execute_graphql_request
+            return None
+        return get_response_cache_key(self.schema, document, operation_name, variables, request)
+
+    def get_response(self, request, data, show_graphiql=False):
+        # same as GraphQLView.get_response, with the extensions (eg. the query cost) and the cache
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        cache_key = None if show_graphiql else self.get_cache_key(request, query, variables, operation_name)
+        if cache_key is not None:
+            cached_response = cache.get(cache_key[0])
+            if cached_response is not None:
+                return cached_response
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                response['errors'] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.invalid:
+                status_code = 400
+            else:
+                response['data'] = execution_result.data
+
+            if execution_result.extensions:
+                response['extensions'] = execution_result.extensions
+
+            if self.batch:
+                response['id'] = id
+                response['status'] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        if cache_key is not None and status_code == 200 and not execution_result.errors:
+            set_cached_response(*cache_key, (result, status_code))
+        return result, status_code
+
+
+def metrics(request):
+    """
+    Resolver and SQL timings of the sampled graphql requests (of all the gunicorn workers with METRICS_DIR)
+    and the database pools of the worker serving the scrape, for prometheus
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_registry.render() + render_pool_metrics(), content_type='text/plain; version=0.0.4')
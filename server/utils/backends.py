@@ -0,0 +1,117 @@
+import hashlib
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import execute, ExecutionResult
+from graphql.language import ast
+from graphql.language.printer import print_ast
+from graphql.validation.rules import specified_rules
+from promise import Promise
+
+from utils.validation import QueryDepthRule, get_query_cost
+
+
+def get_query_hash(query: str) -> str:
+    """
+    SHA-256 of the query text, also used as the persisted query hash
+    """
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def _invalid_document_execute(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+def _execute(schema, document_ast, *args, **kwargs):
+    """
+    Executes the document if the cost of the operation, with the given variables, is within
+    GRAPHQL_MAX_QUERY_COST, the cost is added to the extensions of the result
+    """
+    cost = get_query_cost(schema, document_ast, kwargs.get('variable_values'), kwargs.get('operation_name'))
+    extensions = dict(cost=dict(requestedQueryCost=cost, maximumAvailable=settings.GRAPHQL_MAX_QUERY_COST))
+    if cost > settings.GRAPHQL_MAX_QUERY_COST:
+        return ExecutionResult(
+            errors=[GraphQLError(
+                f'Query cost {cost} exceeds the maximum allowed cost {settings.GRAPHQL_MAX_QUERY_COST}, '
+                'reduce the page sizes or the nesting.'
+            )],
+            invalid=True,
+            extensions=extensions,
+        )
+
+    def add_extensions(result):
+        result.extensions.update(extensions)
+        return result
+
+    result = execute(schema, document_ast, *args, **kwargs)
+    if isinstance(result, Promise):
+        return result.then(add_extensions)
+    return add_extensions(result)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """
+    Parses and validates each query only once.
+
+    Valid documents are kept in a process-wide LRU keyed by the hash of the query text, so the
+    repeated (and persisted) queries skip both the parsing and the validation.
+    The query cost depends on the variables, so it is checked on each execution instead.
+    """
+    def __init__(self, max_size=None, executor=None):
+        super().__init__(executor=executor)
+        self.max_size = max_size or settings.GRAPHQL_DOCUMENT_CACHE_SIZE
+        self.documents = OrderedDict()
+        self.lock = Lock()
+
+    def get_validation_rules(self, schema) -> list:
+        return specified_rules + [QueryDepthRule]
+
+    def get_cached_document(self, key):
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+            return document
+
+    def cache_document(self, key, document):
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+
+    def document_from_string(self, schema, document_string):
+        if isinstance(document_string, ast.Document):
+            document_string = print_ast(document_string)
+        assert isinstance(document_string, str), 'The query must be a string'
+
+        key = get_query_hash(document_string)
+        if document := self.get_cached_document(key):
+            return document
+
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast, self.get_validation_rules(schema))
+        if errors:
+            # invalid documents are not cached
+            return GraphQLDocument(
+                schema=schema,
+                document_string=document_string,
+                document_ast=document_ast,
+                execute=partial(_invalid_document_execute, errors),
+            )
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(_execute, schema, document_ast),
+        )
+        self.cache_document(key, document)
+        return document
+
+
+document_backend = CachedDocumentBackend()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.db.models.lookups import Lookup
+from django.db.models.sql import Query
+
+from utils.replicas import may_miss_writes
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATED = 'estimated'
+COUNT_STRATEGIES = (EXACT, CACHED, ESTIMATED)
+
+TABLE_VERSION_KEY = 'table_version_{}'
+COUNT_CACHE_KEY = 'list_count_{}'
+# written without the signals, their versions are bumped by their writers (see apps/entry/aggregates.py)
+UNSIGNALED_MODELS = {
+    'entry.entryfigureaggregate',
+    'entry.eventfigureaggregate',
+    'entry.crisisfigureaggregate',
+    'entry.countryfigureaggregate',
+}
+
+
+def get_table_versions(models) -> dict:
+    """
+    Tokens which change whenever a row of the models is created, updated or deleted, read with
+    a single round trip to the cache
+    """
+    keys = {TABLE_VERSION_KEY.format(model._meta.label_lower): model for model in models}
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def _set_table_versions(models):
+    cache.set_many({TABLE_VERSION_KEY.format(model._meta.label_lower): time.time_ns() for model in models}, None)
+
+
+class PendingTableVersions:
+    """
+    Models written by the transaction, their versions are bumped again once it is committed
+    """
+    def __init__(self):
+        self.models = set()
+
+    def __call__(self):
+        _set_table_versions(self.models)
+
+
+def bump_table_version(sender, **kwargs):
+    """
+    Receiver of post_save, post_delete and m2m_changed signals
+
+    In a transaction the versions of each model are bumped once when it is first written, and
+    again once committed (the rows read until then were cached with the new version), with a
+    single on_commit callback for all the models.
+    """
+    models = {sender}
+    if instance := kwargs.get('instance'):
+        models.add(type(instance))
+    if related_model := kwargs.get('model'):
+        # m2m_changed
+        models.add(related_model)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _set_table_versions(models)
+        return
+    pending = next(
+        (func for _, func in connection.run_on_commit if isinstance(func, PendingTableVersions)), None
+    )
+    if pending is None:
+        pending = PendingTableVersions()
+        transaction.on_commit(pending)
+    models -= pending.models
+    if models:
+        _set_table_versions(models)
+        pending.models.update(models)
+
+
+def get_dependent_models(model) -> set:
+    """
+    The model with the models it is related to, a change in any of them can change the filtered count
+    """
+    models = {model}
+    for field in model._meta.get_fields():
+        if field.is_relation and field.related_model:
+            models.add(field.related_model)
+            if field.many_to_many:
+                through = getattr(getattr(field, 'remote_field', None), 'through', None) or \
+                    getattr(field, 'through', None)
+                if through:
+                    models.add(through)
+    return models
+
+
+@lru_cache(maxsize=None)
+def get_table_models() -> dict:
+    # with the auto-created through models of the many to many fields
+    return {model._meta.db_table: model for model in apps.get_models(include_auto_created=True)}
+
+
+def _get_subqueries(node):
+    if isinstance(node, QuerySet):
+        node = node.query
+    if isinstance(node, Query):
+        yield node
+        return
+    if isinstance(node, Lookup):
+        children = [node.lhs, node.rhs]
+    elif hasattr(node, 'get_source_expressions'):
+        children = node.get_source_expressions()
+    else:
+        # where nodes
+        children = getattr(node, 'children', None) or []
+    for child in children:
+        yield from _get_subqueries(child)
+
+
+def get_query_models(query: Query) -> set:
+    """
+    Models of the tables read by the query: its joins, which follow the lookups of the filters
+    (eg. the events, their countries and the through table of `entry__event__countries`), and
+    its subqueries
+    """
+    tables = get_table_models()
+    models = {tables[join.table_name] for join in query.alias_map.values() if join.table_name in tables}
+    for node in (query.where, *query.annotations.values()):
+        for subquery in _get_subqueries(node):
+            models |= get_query_models(subquery)
+    return models
+
+
+def get_versioned_models() -> set:
+    """
+    Models whose versions are read: the models of the apps with the models they relate to (the lists
+    with cached counts and the cached responses) and the permission models (see utils/permissions.py)
+
+    The signals are connected only for them, the deletes of the other models can then skip the
+    signals of the deleted rows (fast deletes).
+    """
+    from utils.permissions import get_permission_models
+
+    models = set(get_permission_models())
+    for model in apps.get_models():
+        if model._meta.app_config.name.startswith('apps.') and model._meta.app_label != 'contrib':
+            models.update(get_dependent_models(model))
+    return {model for model in models if model._meta.label_lower not in UNSIGNALED_MODELS}
+
+
+def get_count_cache_key(qs: QuerySet, *parts) -> Tuple[str, int]:
+    """
+    Cache key of the count with the newest version of its tables
+    """
+    versions = get_table_versions(get_dependent_models(qs.model) | get_query_models(qs.query))
+    key = json.dumps([
+        qs.model._meta.label_lower,
+        sorted((each._meta.label_lower, version) for each, version in versions.items()),
+        *parts,
+    ], sort_keys=True, cls=DjangoJSONEncoder)
+    return COUNT_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest()), max(versions.values(), default=0)
+
+
+def estimate_count(qs: QuerySet) -> int:
+    """
+    Row estimate of the PostgreSQL planner for the queryset
+    """
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(qs: QuerySet, strategy: str = None, cache_key_parts: tuple = ()) -> Tuple[int, bool]:
+    """
+    Returns the count of the queryset and whether it is exact
+
+    - exact: COUNT(*)
+    - cached: COUNT(*) cached by the normalized filters (cache_key_parts) and the versions of the tables
+    - estimated: the planner estimate if it is above LIST_COUNT_ESTIMATE_THRESHOLD, COUNT(*) otherwise
+    """
+    strategy = strategy or settings.LIST_COUNT_STRATEGY
+    assert strategy in COUNT_STRATEGIES, f'Unknown count strategy {strategy}'
+    if strategy == CACHED:
+        key, newest_version = get_count_cache_key(qs, *cache_key_parts)
+        count = cache.get(key)
+        if count is None:
+            count = qs.count()
+            if not may_miss_writes(newest_version):
+                cache.set(key, count, settings.LIST_COUNT_CACHE_TIMEOUT)
+        return count, True
+    if strategy == ESTIMATED:
+        estimate = estimate_count(qs)
+        if estimate > settings.LIST_COUNT_ESTIMATE_THRESHOLD:
+            return estimate, False
+    return qs.count(), True
@@ -0,0 +1,243 @@
+from collections import defaultdict
+from typing import Type
+
+from django.db import models
+from django.db.models import Count, Sum
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from utils.file_urls import get_file_urls
+from utils.permissions import get_users_groups
+from utils.pagination import paginate_partitions
+
+
+def get_dataloader(info, loader_class: Type[DataLoader], *args) -> DataLoader:
+    """
+    Returns the dataloader stored in the request (info.context)
+
+    Loaders are created once per request for each (loader_class, *args) and are shared
+    across all the resolvers of the request, so that the keys can be batched together.
+    """
+    dataloaders = getattr(info.context, 'dataloaders', None)
+    if dataloaders is None:
+        dataloaders = info.context.dataloaders = dict()
+    key = (loader_class, *args)
+    if key not in dataloaders:
+        loader = dataloaders[key] = loader_class(*args)
+        executor = getattr(info.context, 'graphql_executor', None)
+        if executor is not None:
+            # the batches of the different loaders are run concurrently (see utils/executors.py)
+            loader.batch_load_fn = executor.wrap_batch_load_fn(loader.batch_load_fn)
+    return dataloaders[key]
+
+
+class ModelDataLoader(DataLoader):
+    """
+    Loads the model instances by their primary keys
+    eg. Entry.created_by, Event.trigger
+    """
+    def __init__(self, model: Type[models.Model], *args, **kwargs):
+        self.model = model
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        objects = self.model._default_manager.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class ManyToManyDataLoader(DataLoader):
+    """
+    Loads the list of related instances of a ManyToManyField by the primary keys of the source
+    eg. Entry.reviewers, Event.countries
+    """
+    def __init__(self, model: Type[models.Model], field_name: str, *args, **kwargs):
+        self.model = model
+        self.field_name = field_name
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        field = self.model._meta.get_field(self.field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        qs = through.objects.filter(
+            **{f'{source}__in': keys}
+        ).select_related(target).order_by(f'{target}_id')
+        related = defaultdict(list)
+        for each in qs:
+            related[getattr(each, f'{source}_id')].append(getattr(each, target))
+        return Promise.resolve([related[key] for key in keys])
+
+
+class ReverseForeignKeyDataLoader(DataLoader):
+    """
+    Loads the list of instances of a model pointing to the given keys through the foreign key
+    eg. Violence.sub_types
+    """
+    def __init__(self, model: Type[models.Model], field_name: str, *args, **kwargs):
+        self.model = model
+        self.field_name = field_name
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        attname = self.model._meta.get_field(self.field_name).attname
+        qs = self.model._default_manager.filter(
+            **{f'{self.field_name}__in': keys}
+        ).order_by(attname, 'pk')
+        related = defaultdict(list)
+        for each in qs:
+            related[getattr(each, attname)].append(each)
+        return Promise.resolve([related[key] for key in keys])
+
+
+class LatestReverseForeignKeyDataLoader(ReverseForeignKeyDataLoader):
+    """
+    Loads the latest (by primary key) instance pointing to the given keys through the foreign key
+    eg. Country.last_summary
+    """
+    def batch_load_fn(self, keys):
+        attname = self.model._meta.get_field(self.field_name).attname
+        # DISTINCT ON with the ordering returns the row with the highest pk for each key
+        qs = self.model._default_manager.filter(
+            **{f'{self.field_name}__in': keys}
+        ).order_by(attname, '-pk').distinct(attname)
+        related = {getattr(each, attname): each for each in qs}
+        return Promise.resolve([related.get(key) for key in keys])
+
+
+class SumDataLoader(ReverseForeignKeyDataLoader):
+    """
+    Loads the sum of a field of the instances pointing to the given keys through the foreign key
+    eg. Entry.total_figures
+    """
+    def __init__(self, model: Type[models.Model], field_name: str, sum_field: str, *args, **kwargs):
+        self.sum_field = sum_field
+        super().__init__(model, field_name, *args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        attname = self.model._meta.get_field(self.field_name).attname
+        totals = dict(
+            self.model._default_manager.filter(
+                **{f'{self.field_name}__in': keys}
+            ).order_by().values(attname).annotate(
+                total=Sum(self.sum_field)
+            ).values_list(attname, 'total')
+        )
+        return Promise.resolve([totals.get(key) for key in keys])
+
+
+class PaginatedListDataLoader(DataLoader):
+    """
+    Loads a page of the instances pointing to the given keys through the foreign key, along with
+    their count, for all the keys at once
+    eg. Entry.figures, Crisis.events, Organization.contacts
+
+    The queryset (filtered and optimized for the selection) is the same for all the keys, see
+    load_paginated_list.
+    """
+    def __init__(self, queryset_key, field_name: str, ordering: tuple, offset: int, limit: int,
+                 with_count: bool, *args, **kwargs):
+        self.queryset = None
+        self.field_name = field_name
+        self.ordering = ordering
+        self.offset = offset
+        self.limit = limit
+        self.with_count = with_count
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        attname = self.queryset.model._meta.get_field(self.field_name).attname
+        pages = defaultdict(list)
+        for each in paginate_partitions(self.queryset, self.field_name, keys, self.ordering, self.offset, self.limit):
+            pages[getattr(each, attname)].append(each)
+        counts = {}
+        if self.with_count:
+            counts = dict(
+                self.queryset.filter(
+                    **{f'{self.field_name}__in': keys}
+                ).order_by().values(attname).annotate(
+                    count=Count('pk')
+                ).values_list(attname, 'count')
+            )
+        return Promise.resolve([
+            (pages[key], counts.get(key, 0) if self.with_count else None)
+            for key in keys
+        ])
+
+
+class RoleDataLoader(DataLoader):
+    """
+    Loads the role (the first group) of the users by their primary keys, from the cache of
+    utils/permissions.py
+    eg. User.role
+    """
+    def batch_load_fn(self, keys):
+        groups = get_users_groups(keys)
+        return Promise.resolve([groups[key][0] if groups[key] else None for key in keys])
+
+
+class FileUrlDataLoader(DataLoader):
+    """
+    Loads the urls of the files of the default storage by their names, so that the urls of
+    the whole response are looked up and signed at once
+    eg. SourcePreview.pdf, Entry.document_url
+    """
+    def batch_load_fn(self, keys):
+        urls = get_file_urls(keys)
+        return Promise.resolve([urls.get(key) for key in keys])
+
+
+def load_foreign_key(info, root: models.Model, field_name: str):
+    """
+    Helper for resolvers of a forward ForeignKey/OneToOneField
+    """
+    field = root._meta.get_field(field_name)
+    if field.is_cached(root):
+        # already fetched with select_related
+        return getattr(root, field_name)
+    pk = getattr(root, field.attname)
+    if pk is None:
+        return None
+    return get_dataloader(info, ModelDataLoader, field.related_model).load(pk)
+
+
+def load_reverse_foreign_key(info, root: models.Model, model: Type[models.Model], field_name: str):
+    """
+    Helper for resolvers of a reverse ForeignKey (related manager)
+    """
+    accessor = model._meta.get_field(field_name).remote_field.get_accessor_name()
+    if accessor in getattr(root, '_prefetched_objects_cache', {}):
+        return list(getattr(root, accessor).all())
+    return get_dataloader(info, ReverseForeignKeyDataLoader, model, field_name).load(root.pk)
+
+
+def load_many_to_many(info, root: models.Model, field_name: str):
+    """
+    Helper for resolvers of a ManyToManyField
+    """
+    if field_name in getattr(root, '_prefetched_objects_cache', {}):
+        return list(getattr(root, field_name).all())
+    return get_dataloader(info, ManyToManyDataLoader, type(root), field_name).load(root.pk)
+
+
+def load_paginated_list(info, root: models.Model, queryset, queryset_key, field_name: str,
+                        ordering: list, offset: int, limit: int, with_count: bool):
+    """
+    Helper for the nested paginated lists of a reverse ForeignKey, the page and the count
+    of the root are fetched along with the ones of the other roots with the same `queryset_key`
+    """
+    loader = get_dataloader(
+        info, PaginatedListDataLoader, queryset_key, field_name, tuple(ordering), offset, limit, with_count
+    )
+    if loader.queryset is None:
+        loader.queryset = queryset
+    return loader.load(root.pk)
+
+
+def load_file_url(info, file):
+    """
+    Helper for resolvers of the url of a FileField
+    """
+    if not file:
+        return None
+    return get_dataloader(info, FileUrlDataLoader).load(file.name)
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import time
+from threading import Condition, Lock
+from typing import Callable
+
+from django.conf import settings
+from django.db import connections
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+def check_connections(**kwargs):
+    """
+    Closes the persistent connections which are idle for more than DB_HEALTH_CHECK_IDLE seconds
+    and no longer usable (eg. dropped by the server or a proxy), they are reopened when needed
+    instead of failing the next query
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle_since = getattr(connection, 'idle_since', None)
+        if idle_since is not None and now - idle_since > settings.DB_HEALTH_CHECK_IDLE:
+            if not connection.is_usable():
+                connection.close()
+        connection.idle_since = None
+
+
+def close_old_connections(**kwargs):
+    """
+    Same as django.db.close_old_connections, except for the connections in a transaction
+    (eg. of the tests)
+    """
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+def lock_name(name: str, using: str = 'default'):
+    """
+    Transaction level postgres advisory lock of the name, the other transactions locking it wait
+    until the current one ends
+    """
+    key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Database connections of a process, shared by its threads
+
+    At most `max_size` connections are open, a checkout waits up to `timeout` seconds for one
+    to be returned when they are all in use. The idle connections beyond `min_size` are closed
+    after `max_idle` seconds, and all of them once older than `max_lifetime` seconds.
+    The connections idle for more than `check_idle` seconds are checked before being reused.
+    """
+    def __init__(self, min_size: int, max_size: int, timeout: float, max_idle: float,
+                 max_lifetime: float, check_idle: float):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.condition = Condition()
+        # (connection, returned at), the last returned connection is reused first
+        self.idle = []
+        self.created_at = {}
+        # open connections, including the ones being opened
+        self.size = 0
+        self.waiting = 0
+        self.counters = dict(created=0, discarded=0, checkouts=0, timeouts=0, wait_seconds=0.0)
+
+    def _checkout(self, deadline: float) -> tuple:
+        # returns (None, None) when a new connection should be opened
+        with self.condition:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available within {self.timeout} seconds.')
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+    def is_alive(self, connection, returned_at: float) -> bool:
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def get(self, connect: Callable):
+        start = time.monotonic()
+        while True:
+            connection, returned_at = self._checkout(start + self.timeout)
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                    raise
+                with self.condition:
+                    self.created_at[connection] = time.monotonic()
+                    self.counters['created'] += 1
+                break
+            if self.is_alive(connection, returned_at):
+                break
+            self.discard(connection)
+        with self.condition:
+            self.counters['checkouts'] += 1
+            self.counters['wait_seconds'] += time.monotonic() - start
+        return connection
+
+    def put(self, connection):
+        now = time.monotonic()
+        keep = not connection.closed and now - self.created_at.get(connection, now) < self.max_lifetime
+        if keep and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # eg. closed in a transaction
+            try:
+                connection.rollback()
+            except Exception:
+                keep = False
+        if not keep:
+            self.discard(connection)
+            return
+        expired = []
+        with self.condition:
+            self.idle.append((connection, now))
+            # the oldest idle connections are first
+            while len(self.idle) > 1 and self.size - len(expired) > self.min_size \
+                    and now - self.idle[0][1] > self.max_idle:
+                expired.append(self.idle.pop(0)[0])
+            self.condition.notify()
+        for each in expired:
+            self.discard(each)
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.size -= 1
+            self.created_at.pop(connection, None)
+            self.counters['discarded'] += 1
+            self.condition.notify()
+
+    def close(self):
+        """
+        Closes the idle connections, the connections in use are closed when returned
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.max_lifetime = 0
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return dict(
+                self.counters,
+                size=self.size,
+                idle=len(self.idle),
+                in_use=self.size - len(self.idle),
+                waiting=self.waiting,
+            )
+
+
+# (alias, database, connection parameters): pool, of the current process only
+pools = {}
+pools_lock = Lock()
+pools_pid = None
+
+
+def get_pool(alias: str, conn_params: dict) -> ConnectionPool:
+    global pools_pid
+    key = (alias, conn_params.get('database'), repr(sorted(conn_params.items())))
+    with pools_lock:
+        if pools_pid != os.getpid():
+            # the connections inherited from the parent process are not used, nor closed
+            pools.clear()
+            pools_pid = os.getpid()
+        if key not in pools:
+            pools[key] = ConnectionPool(
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+                timeout=settings.DB_POOL_TIMEOUT,
+                max_idle=settings.DB_POOL_MAX_IDLE,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                check_idle=settings.DB_HEALTH_CHECK_IDLE,
+            )
+        return pools[key]
+
+
+def close_pools():
+    with pools_lock:
+        current = list(pools.values()) if pools_pid == os.getpid() else []
+        pools.clear()
+    for pool in current:
+        pool.close()
+
+
+# (name, help, type, key of ConnectionPool.get_stats)
+POOL_METRICS = (
+    ('helix_db_pool_connections', 'Open connections', 'gauge', 'size'),
+    ('helix_db_pool_idle_connections', 'Idle connections', 'gauge', 'idle'),
+    ('helix_db_pool_in_use_connections', 'Connections in use', 'gauge', 'in_use'),
+    ('helix_db_pool_waiting_checkouts', 'Checkouts waiting for a connection', 'gauge', 'waiting'),
+    ('helix_db_pool_created_total', 'Opened connections', 'counter', 'created'),
+    ('helix_db_pool_discarded_total', 'Closed connections', 'counter', 'discarded'),
+    ('helix_db_pool_checkouts_total', 'Checkouts', 'counter', 'checkouts'),
+    ('helix_db_pool_timeouts_total', 'Checkouts timed out', 'counter', 'timeouts'),
+    ('helix_db_pool_wait_seconds_total', 'Time spent in the checkouts', 'counter', 'wait_seconds'),
+)
+
+
+def render_pool_metrics() -> str:
+    """
+    Prometheus text exposition format
+    """
+    with pools_lock:
+        stats = {key[:2]: pool.get_stats() for key, pool in pools.items()} if pools_pid == os.getpid() else {}
+    lines = []
+    for name, help_text, metric_type, key in POOL_METRICS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (alias, database), values in stats.items():
+            lines.append(f'{name}{{alias="{alias}",database="{database}"}} {values[key]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,119 @@
+import sys
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+from promise import Promise
+
+from utils.db import check_connections, close_old_connections, mark_connections_idle
+
+
+@lru_cache(maxsize=None)
+def get_pool() -> ThreadPoolExecutor:
+    # shared by the requests of the process, so the database connections are bounded too
+    return ThreadPoolExecutor(max_workers=settings.GRAPHQL_EXECUTOR_THREADS, thread_name_prefix='graphql')
+
+
+def _evaluate(value):
+    # querysets are lazy, they are fetched in the pool instead of on the request thread
+    if isinstance(value, QuerySet):
+        value._fetch_all()
+    elif isinstance(getattr(value, 'results', None), QuerySet):
+        # the paginated lists
+        value.results._fetch_all()
+    return value
+
+
+class ConcurrentExecutor:
+    """
+    Graphql executor running the root fields of the queries and the dataloader batches
+    concurrently, on a process-wide pool of GRAPHQL_EXECUTOR_THREADS threads
+
+    The resolvers of the pool use the database connections of their thread, their values are
+    then completed (nested fields, promises) on the request thread like with the SyncExecutor.
+    The mutations are still resolved in order on the request thread.
+    Without threads (eg. in the tests, as the other connections do not see the test transaction)
+    everything is run inline.
+    """
+    def __init__(self, request=None):
+        self.concurrent = settings.GRAPHQL_EXECUTOR_THREADS > 0
+        self.timings = getattr(request, 'timings', None)
+        # future: promise resolved with its value on the request thread
+        self.pending = {}
+        if self.concurrent and hasattr(request, 'user'):
+            # the lazy user is loaded once, before it is shared by the threads
+            request.user.pk
+
+    def _run(self, fn: Callable, args, kwargs):
+        # same as the request signals, for the connections of the thread
+        close_old_connections()
+        check_connections()
+        try:
+            with ExitStack() as stack:
+                if self.timings is not None:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(self.timings))
+                value = _evaluate(fn(*args, **kwargs))
+                if isinstance(value, Promise) and not value.is_pending:
+                    # eg. the batches of the dataloaders
+                    value = value.get()
+                return value
+        finally:
+            close_old_connections()
+            mark_connections_idle()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Promise:
+        promise = Promise()
+        # eg. the database routing of the request (see utils/replicas.py) and the field path of
+        # its timings, each task then sets its own (see utils/instrumentation.py)
+        context = copy_context()
+        self.pending[get_pool().submit(context.run, self._run, fn, args, kwargs)] = promise
+        return promise
+
+    def wrap_batch_load_fn(self, batch_load_fn: Callable) -> Callable:
+        if not self.concurrent:
+            return batch_load_fn
+
+        def wrapped(keys):
+            return self.submit(batch_load_fn, keys)
+        return wrapped
+
+    def _settle(self, futures):
+        for future in futures:
+            promise = self.pending.pop(future)
+            try:
+                value = future.result()
+            except Exception as e:
+                promise.do_reject(e, traceback=sys.exc_info()[2])
+            else:
+                promise.do_resolve(value)
+
+    def wait_until_finished(self):
+        # resolving the promises submits the next work, eg. the dataloaders of the nested fields
+        while self.pending:
+            wait(self.pending)
+            # settled in a single tick of the promises, so that the next loads are batched together
+            Promise.resolve(list(self.pending)).then(self._settle).get()
+
+    def clean(self):
+        self.pending = {}
+
+    @staticmethod
+    def is_concurrent_root_field(info) -> bool:
+        # a single root field is resolved inline, there is nothing to run alongside it
+        return (
+            info.operation.operation == 'query'
+            and not info.path[1:]
+            and len(info.operation.selection_set.selections) > 1
+        )
+
+    def execute(self, fn: Callable, *args, **kwargs) -> Optional[object]:
+        # args are (root, info)
+        if self.concurrent and self.is_concurrent_root_field(args[1]):
+            return self.submit(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
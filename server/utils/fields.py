@@ -1,10 +1,11 @@
+import json
 from collections import OrderedDict
 
 from django.conf import settings
-from django.core.cache import cache
-from django.db.models import QuerySet, FileField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, QuerySet, FileField
 from django.db.models.fields.files import FieldFile
-from graphene import Field, Int
+from graphene import Boolean, Field, Int, String
 from graphene.utils.str_converters import to_snake_case
 from graphene_django.filter.utils import get_filtering_args_from_filterset
 from graphene_django.utils import is_valid_django_model, maybe_queryset, DJANGO_FILTER_INSTALLED
@@ -19,25 +20,37 @@ from graphene_django_extras.settings import graphql_api_settings
 from graphene_django_extras.types import DjangoObjectOptions
 from graphene_django_extras.utils import get_extra_filters
 
-from utils.pagination import OrderingOnlyArgumentPagination
+from utils.counts import get_count
+from utils.dataloaders import load_paginated_list
+from utils.file_urls import get_file_url
+from utils.optimizer import get_sub_selections, optimize_list_queryset
+from utils.pagination import OrderingOnlyArgumentPagination, PageGraphqlPagination, \
+    get_ordering
 
 
 # Graphene related fields
 
 class CustomDjangoListObjectBase(DjangoListObjectBase):
-    def __init__(self, results, count, page, pageSize, results_field_name="results"):
+    def __init__(self, results, count, page, pageSize, results_field_name="results",
+                 nextCursor=None, previousCursor=None, isExactCount=True):
         self.results = results
         self.count = count
+        self.isExactCount = isExactCount
         self.results_field_name = results_field_name
         self.page = page
         self.pageSize = pageSize
+        self.nextCursor = nextCursor
+        self.previousCursor = previousCursor
 
     def to_dict(self):
         return {
             self.results_field_name: [e.to_dict() for e in self.results],
             "count": self.count,
+            "isExactCount": self.isExactCount,
             "page": self.page,
-            "pageSize": self.pageSize
+            "pageSize": self.pageSize,
+            "nextCursor": self.nextCursor,
+            "previousCursor": self.previousCursor,
         }
 
 
@@ -60,6 +73,21 @@ class CustomDjangoListField(DjangoListField):
         return queryset
 
 
+class CustomDjangoFilterListField(DjangoFilterListField):
+    """
+    Uses the resolver defined in the parent type (eg. `resolve_countries` backed by a dataloader)
+    when no filters are passed, otherwise falls back to the `DjangoFilterListField` behaviour.
+    """
+    def get_resolver(self, parent_resolver):
+        filter_resolver = super().get_resolver(parent_resolver)
+
+        def resolver(root, info, **kwargs):
+            if any(kwargs.get(arg) is not None for arg in self.filtering_args):
+                return filter_resolver(root, info, **kwargs)
+            return parent_resolver(root, info, **kwargs)
+        return resolver
+
+
 class CustomDjangoListObjectType(DjangoListObjectType):
     """
     Updates `DjangoListObjectType` to add page related fields into type definition
@@ -154,6 +182,14 @@ class CustomDjangoListObjectType(DjangoListObjectType):
                         description="Total count of matches elements",
                     ),
                 ),
+                (
+                    "isExactCount",
+                    Field(
+                        Boolean,
+                        name="isExactCount",
+                        description="False if the totalCount is an estimate",
+                    ),
+                ),
                 (
                     "page",
                     Field(
@@ -169,7 +205,23 @@ class CustomDjangoListObjectType(DjangoListObjectType):
                         name="pageSize",
                         description="Page Size",
                     ),
-                )
+                ),
+                (
+                    "nextCursor",
+                    Field(
+                        String,
+                        name="nextCursor",
+                        description="Cursor of the next page (keyset pagination only)",
+                    ),
+                ),
+                (
+                    "previousCursor",
+                    Field(
+                        String,
+                        name="previousCursor",
+                        description="Cursor of the previous page (keyset pagination only)",
+                    ),
+                ),
             ]
         )
 
@@ -242,16 +294,154 @@ class DjangoPaginatedListObjectField(DjangoFilterPaginateListField):
 
         # accessor will be used with m2m or reverse_fk fields
         self.accessor = kwargs.pop('accessor', None)
+        # exact, cached or estimated (defaults to settings.LIST_COUNT_STRATEGY), see utils.counts
+        self.count_strategy = kwargs.pop('count_strategy', None)
         super(DjangoFilterPaginateListField, self).__init__(
             _type, *args, **kwargs
         )
 
+    def get_queryset(self, manager, info, **kwargs):
+        # select_related/prefetch_related are planned in `list_resolver` by the optimizer
+        return manager.get_queryset()
+
+    @staticmethod
+    def get_accessor_name(field):
+        return field.get_accessor_name() if field.auto_created else field.name
+
+    def get_relation(self, model):
+        """
+        Relation from the parent model to the listed model
+        """
+        relations = [
+            field for field in model._meta.get_fields()
+            if (field.one_to_many or field.many_to_many) and (
+                self.get_accessor_name(field) == self.accessor if self.accessor
+                else field.related_model == self.type._meta.model
+            )
+        ]
+        return relations[0] if len(relations) == 1 else None
+
+    def get_relation_name(self, model):
+        """
+        Name of the relation from the parent model to the listed model
+        """
+        if self.accessor:
+            return self.accessor
+        relation = self.get_relation(model)
+        return relation and self.get_accessor_name(relation)
+
+    def get_prefetched_results(self, root, filter_kwargs, **kwargs):
+        """
+        Returns the prefetched children of the root if the list is neither filtered nor ordered
+        """
+        if root is None or not isinstance(root, Model):
+            return None
+        if any(value is not None for value in filter_kwargs.values()):
+            return None
+        pagination = getattr(self, 'pagination', None)
+        if self.is_keyset_page(**kwargs):
+            return None
+        if pagination and (kwargs.get(pagination.ordering_param) or pagination.ordering):
+            return None
+        name = self.get_relation_name(type(root))
+        if name is None or name not in getattr(root, '_prefetched_objects_cache', {}):
+            return None
+        return list(getattr(root, name).all())
+
+    def is_keyset_page(self, **kwargs) -> bool:
+        """
+        Whether the page is located by a cursor (see KeysetGraphqlPagination), which is never counted
+        """
+        is_keyset = getattr(getattr(self, 'pagination', None), 'is_keyset', None)
+        return bool(is_keyset and is_keyset(**kwargs))
+
+    def get_count(self, qs, root, info, filter_kwargs, prefetched=False):
+        """
+        Returns the count and whether it is exact, the count is skipped if `totalCount` is not selected
+        """
+        if 'totalCount' not in get_sub_selections(info.field_asts, info.fragments or {}):
+            return None, None
+        if prefetched:
+            return len(qs), True
+        cache_key_parts = (
+            filter_kwargs,
+            self.accessor,
+            root._meta.label_lower if isinstance(root, Model) else None,
+            root.pk if isinstance(root, Model) else None,
+            info.context.user.pk,
+        )
+        return get_count(qs, self.count_strategy, cache_key_parts)
+
+    def get_request_ordering(self, **kwargs) -> str:
+        """
+        Ordering requested (in snake case), or the default ordering of the pagination
+        """
+        ordering = kwargs.get(self.pagination.ordering_param) or self.pagination.ordering
+        return ','.join(to_snake_case(each) for each in get_ordering(ordering))
+
+    def get_batched_page(self, manager, filterset_class, root, info, filter_kwargs, **kwargs):
+        """
+        Returns a promise of the page and the count of the root, fetched along with the ones of the
+        other roots of the parent list (see PaginatedListDataLoader), or None if the list is not a
+        page of a reverse ForeignKey
+        """
+        pagination = getattr(self, 'pagination', None)
+        if not isinstance(root, Model) or not isinstance(pagination, PageGraphqlPagination) or \
+                self.is_keyset_page(**kwargs):
+            return None
+        page = kwargs.get(pagination.page_query_param, 1)
+        page_size = pagination.get_page_size(**kwargs)
+        if page is None or page < 1 or page_size is None:
+            return None
+        relation = self.get_relation(type(root))
+        if relation is None or not (relation.auto_created and relation.one_to_many):
+            return None
+        qs = self.get_queryset(manager, info, **kwargs)
+        qs = filterset_class(data=filter_kwargs, queryset=qs, request=info.context).qs
+        qs = optimize_list_queryset(qs, info, self.type._meta.results_field_name)
+        ordering = get_ordering(self.get_request_ordering(**kwargs))
+        # same filters and same selections
+        queryset_key = (
+            self,
+            json.dumps(filter_kwargs, sort_keys=True, cls=DjangoJSONEncoder),
+            tuple(id(node) for node in info.field_asts),
+        )
+        with_count = 'totalCount' in get_sub_selections(info.field_asts, info.fragments or {})
+        return load_paginated_list(
+            info, root, qs, queryset_key, relation.field.name,
+            ordering, page_size * (page - 1), page_size, with_count,
+        )
+
+    def get_list_object(self, results, count, is_exact_count, **kwargs):
+        return CustomDjangoListObjectBase(
+            count=count,
+            isExactCount=is_exact_count,
+            results=results,
+            results_field_name=self.type._meta.results_field_name,
+            page=kwargs.get('page', 1) if hasattr(self.pagination, 'page') else None,
+            pageSize=kwargs.get('pageSize', graphql_api_settings.DEFAULT_PAGE_SIZE) if hasattr(self.pagination, 'page') else None,
+            nextCursor=getattr(results, 'next_cursor', None),
+            previousCursor=getattr(results, 'previous_cursor', None),
+        )
+
     def list_resolver(
             self, manager, filterset_class, filtering_args, root, info, **kwargs
     ):
 
         filter_kwargs = {k: v for k, v in kwargs.items() if k in filtering_args}
-        if self.accessor:
+        prefetched = self.get_prefetched_results(root, filter_kwargs, **kwargs)
+        if prefetched is None:
+            batched_page = self.get_batched_page(manager, filterset_class, root, info, filter_kwargs, **kwargs)
+            if batched_page is not None:
+                def get_list_object(page):
+                    results, count = page
+                    # the counts of the pages are exact
+                    return self.get_list_object(results, count, None if count is None else True, **kwargs)
+                return batched_page.then(get_list_object)
+        if prefetched is not None:
+            # already fetched along with the parent list, see utils.optimizer
+            qs = prefetched
+        elif self.accessor:
             qs = getattr(root, self.accessor).all()
             qs = filterset_class(data=filter_kwargs, queryset=qs, request=info.context).qs
         else:
@@ -260,40 +450,32 @@ class DjangoPaginatedListObjectField(DjangoFilterPaginateListField):
             if root and is_valid_django_model(root._meta.model):
                 extra_filters = get_extra_filters(root, manager.model)
                 qs = qs.filter(**extra_filters)
-        count = qs.count()
+        if prefetched is None:
+            qs = optimize_list_queryset(qs, info, self.type._meta.results_field_name)
+        if self.is_keyset_page(**kwargs):
+            count, is_exact_count = None, None
+        else:
+            count, is_exact_count = self.get_count(qs, root, info, filter_kwargs, prefetched=prefetched is not None)
 
         if getattr(self, "pagination", None):
-            ordering = kwargs.pop(self.pagination.ordering_param, None) or self.pagination.ordering
-            ordering = ','.join([to_snake_case(each) for each in ordering.strip(',').replace(' ', '').split(',')])
-            self.pagination.ordering = ordering
+            # passed along, the pagination is shared by the concurrent requests
+            kwargs[self.pagination.ordering_param] = self.get_request_ordering(**kwargs)
             qs = self.pagination.paginate_queryset(qs, **kwargs)
 
-        return CustomDjangoListObjectBase(
-            count=count,
-            results=maybe_queryset(qs),
-            results_field_name=self.type._meta.results_field_name,
-            page=kwargs.get('page', 1) if hasattr(self.pagination, 'page') else None,
-            pageSize=kwargs.get('pageSize', graphql_api_settings.DEFAULT_PAGE_SIZE) if hasattr(self.pagination, 'page') else None
-        )
+        return self.get_list_object(maybe_queryset(qs), count, is_exact_count, **kwargs)
 
 
 # Django model fields
 
 
 class CachedFieldFile(FieldFile):
-    CACHE_KEY = 'url_cache_{}'
-
+    """
+    The url is cached, see utils/file_urls.py
+    """
     @property
     def url(self):
-        if settings.DEFAULT_FILE_STORAGE != 'storages.backends.s3boto3.S3Boto3Storage':
-            return super().url
-        key = self.CACHE_KEY.format(hash(self.name))
-        url = cache.get(key)
-        if url:
-            return url
-        url = super().url
-        cache.set(key, url, settings.AWS_QUERYSTRING_EXPIRE)
-        return url
+        self._require_file()
+        return get_file_url(self.name, self.storage)
 
 
 class CachedFileField(FileField):
@@ -0,0 +1,102 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import Storage, default_storage
+
+
+class LocalTTLCache:
+    """
+    Process-wide LRU of at most `max_size` values, each kept for `timeout` seconds
+    """
+    def __init__(self, max_size: int, timeout: int):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.values = OrderedDict()
+        self.lock = Lock()
+
+    def get_many(self, keys: Iterable[str]) -> dict:
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                value, expires_at = self.values.get(key, (None, 0))
+                if expires_at <= now:
+                    self.values.pop(key, None)
+                    continue
+                self.values.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values: dict):
+        expires_at = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = (value, expires_at)
+                self.values.move_to_end(key)
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+@lru_cache(maxsize=None)
+def get_local_cache() -> LocalTTLCache:
+    return LocalTTLCache(settings.FILE_URL_LOCAL_CACHE_SIZE, settings.FILE_URL_LOCAL_CACHE_TIMEOUT)
+
+
+def is_signed(storage: Storage) -> bool:
+    # the urls of the other storages are plain paths, cheaper to build than to cache
+    return bool(getattr(storage, 'querystring_auth', False))
+
+
+def get_cache_key(storage: Storage, name: str) -> str:
+    """
+    Same key for the file in every process, unlike hash() which is salted by PYTHONHASHSEED
+    """
+    location = getattr(storage, 'bucket_name', None) or getattr(storage, 'location', '')
+    value = f'{type(storage).__module__}.{type(storage).__name__}:{location}:{name}'
+    return 'file_url_' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def get_file_urls(names: Iterable[str], storage: Storage = None) -> Dict[str, str]:
+    """
+    Urls of the files by their names, looked up in the local cache, then in the shared cache
+    with a single round trip, the remaining urls are signed (without network calls) at once
+
+    The shared cache keeps the urls for FILE_URL_CACHE_TIMEOUT, less than AWS_QUERYSTRING_EXPIRE,
+    so that the returned urls are valid for a while.
+    """
+    storage = storage or default_storage
+    names = {name for name in names if name}
+    if not is_signed(storage):
+        return {name: storage.url(name) for name in names}
+
+    keys = {get_cache_key(storage, name): name for name in names}
+    local_cache = get_local_cache()
+    urls = local_cache.get_many(keys)
+    missing = [key for key in keys if key not in urls]
+    if missing:
+        shared = cache.get_many(missing)
+        local_cache.set_many(shared)
+        urls.update(shared)
+        signed = {
+            key: storage.url(keys[key])
+            for key in missing if key not in shared
+        }
+        if signed:
+            cache.set_many(signed, settings.FILE_URL_CACHE_TIMEOUT)
+            local_cache.set_many(signed)
+            urls.update(signed)
+    return {keys[key]: url for key, url in urls.items()}
+
+
+def get_file_url(name: str, storage: Storage = None) -> str:
+    return get_file_urls([name], storage).get(name)
@@ -1,8 +1,12 @@
 import django
 import django_filters
 import graphene
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F
 from graphene_django.forms.converter import convert_form_field
 
+from utils.search import get_search_query
+
 
 def _generate_list_filter_class(inner_type):
     """
@@ -42,3 +46,18 @@ def _generate_list_filter_class(inner_type):
 
 
 StringListFilter = _generate_list_filter_class(graphene.String)
+
+
+class SearchFilter(django_filters.CharFilter):
+    """
+    Full-text search on the `search_vector` of the model, ordered by the rank
+    """
+    def filter(self, qs, value):
+        if not value or not value.strip():
+            return qs
+        query = get_search_query(value)
+        return qs.filter(
+            search_vector=query
+        ).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pk')
@@ -0,0 +1,353 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS_OPERATION = 'anonymous'
+# number of slowest fields in the Server-Timing header
+SERVER_TIMING_FIELDS = 5
+
+# path of the field resolved last by the thread, the executor copies it into the tasks it submits
+current_path = ContextVar('current_path', default=None)
+
+
+class FieldTiming:
+    __slots__ = ('calls', 'duration', 'sql_count', 'sql_duration')
+
+    def __init__(self):
+        self.calls = 0
+        self.duration = 0.0
+        self.sql_count = 0
+        self.sql_duration = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(
+            calls=self.calls,
+            duration_ms=round(self.duration * 1000, 3),
+            sql_count=self.sql_count,
+            sql_duration_ms=round(self.sql_duration * 1000, 3),
+        )
+
+
+class RequestTimings:
+    """
+    Resolver and SQL timings of a sampled graphql request (request.timings)
+
+    The SQL queries are attributed to the field resolved last in their context (current_path),
+    which also covers the querysets evaluated by the executor after their resolver returned.
+    The executor threads record into the same timings, under the lock.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = None
+        self.operation_name = None
+        self.lock = Lock()
+        self.sql_count = 0
+        self.sql_duration = 0.0
+        self.fields = defaultdict(FieldTiming)
+
+    def __call__(self, execute, sql, params, many, context):
+        # django execute wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            path = current_path.get()
+            with self.lock:
+                self.sql_count += 1
+                self.sql_duration += duration
+                if path is not None:
+                    field = self.fields[path]
+                    field.sql_count += 1
+                    field.sql_duration += duration
+
+    def record_field(self, path: str, duration: float):
+        with self.lock:
+            field = self.fields[path]
+            field.calls += 1
+            field.duration += duration
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def get_server_timing(self) -> str:
+        metrics = [
+            f'total;dur={self.duration * 1000:.1f}',
+            f'sql;desc="{self.sql_count} queries";dur={self.sql_duration * 1000:.1f}',
+        ]
+        slowest = sorted(self.fields.items(), key=lambda item: item[1].duration, reverse=True)
+        for index, (path, field) in enumerate(slowest[:SERVER_TIMING_FIELDS]):
+            metrics.append(f'field{index};desc="{path}";dur={field.duration * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self) -> dict:
+        return dict(
+            operation=self.operation_name or ANONYMOUS_OPERATION,
+            duration_ms=round(self.duration * 1000, 3),
+            sql_count=self.sql_count,
+            sql_duration_ms=round(self.sql_duration * 1000, 3),
+            fields={path: field.as_dict() for path, field in self.fields.items()},
+        )
+
+
+# (name, help, attribute of FieldTiming)
+OPERATION_METRICS = (
+    ('helix_graphql_requests_total', 'Sampled graphql requests', 'calls'),
+    ('helix_graphql_request_duration_seconds_total', 'Wall time of the requests', 'duration'),
+    ('helix_graphql_request_sql_queries_total', 'SQL queries of the requests', 'sql_count'),
+    ('helix_graphql_request_sql_duration_seconds_total', 'SQL time of the requests', 'sql_duration'),
+)
+FIELD_METRICS = (
+    ('helix_graphql_resolver_calls_total', 'Resolver calls', 'calls'),
+    ('helix_graphql_resolver_duration_seconds_total', 'Wall time of the resolvers', 'duration'),
+    ('helix_graphql_resolver_sql_queries_total', 'SQL queries of the resolvers', 'sql_count'),
+    ('helix_graphql_resolver_sql_duration_seconds_total', 'SQL time of the resolvers', 'sql_duration'),
+)
+
+
+# seconds between the writes of the metrics of a worker into METRICS_DIR
+METRICS_DUMP_INTERVAL = 1
+# metrics of the exited workers, in METRICS_DIR
+METRICS_ARCHIVE = 'archive.json'
+METRICS_LOCK = '.lock'
+TIMING_ATTRIBUTES = FieldTiming.__slots__
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _load_key(key: list):
+    # [operation] or [operation, path]
+    return tuple(key) if len(key) > 1 else key[0]
+
+
+def _read_state(path: str) -> dict:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(directory: str, name: str, state: dict):
+    # replaced at once, so the readers never see a partial file
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as file:
+        json.dump(state, file)
+    os.replace(file.name, os.path.join(directory, name))
+
+
+def _merge_states(*states: dict) -> dict:
+    totals = {}
+    for state in states:
+        for kind, series in state.items():
+            merged = totals.setdefault(kind, {})
+            for key, *values in series:
+                previous = merged.get(tuple(key), [0] * len(values))
+                merged[tuple(key)] = [a + b for a, b in zip(previous, values)]
+    return {kind: [[list(key), *values] for key, values in series.items()] for kind, series in totals.items()}
+
+
+@contextmanager
+def metrics_dir_lock(directory: str):
+    """
+    Serializes the reads of the metrics of all the workers and the archiving of the exited ones
+    """
+    with open(os.path.join(directory, METRICS_LOCK), 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def reset_metrics_dir(directory: str):
+    """
+    Creates METRICS_DIR, without the metrics of a previous run (called by the gunicorn master)
+    """
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def archive_metrics(directory: str, pid: int):
+    """
+    Adds the metrics of the exited worker to the archive, so the totals of the counters never go down
+    and the number of files stays bounded (called by the gunicorn master)
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    with metrics_dir_lock(directory):
+        if not os.path.exists(path):
+            return
+        archive = _read_state(os.path.join(directory, METRICS_ARCHIVE))
+        _write_state(directory, METRICS_ARCHIVE, _merge_states(archive, _read_state(path)))
+        os.remove(path)
+
+
+class MetricsRegistry:
+    """
+    Process wide totals of the sampled requests, per operation and per operation and field path
+
+    The operation names and the paths come from the clients, so the number of series is bounded
+    by GRAPHQL_METRICS_MAX_SERIES, the new ones are dropped after that.
+
+    With METRICS_DIR, each gunicorn worker also writes its totals into <METRICS_DIR>/<pid>.json, and
+    the totals of all the workers are rendered whichever of them serves the scrape.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.operations = {}
+        self.fields = {}
+        self.dumped_at = None
+
+    def _get_series(self, series: dict, key):
+        if key not in series:
+            if len(self.operations) + len(self.fields) >= settings.GRAPHQL_METRICS_MAX_SERIES:
+                return None
+            series[key] = FieldTiming()
+        return series[key]
+
+    def record(self, timings: RequestTimings):
+        operation_name = timings.operation_name or ANONYMOUS_OPERATION
+        with self.lock:
+            operation = self._get_series(self.operations, operation_name)
+            if operation is not None:
+                operation.calls += 1
+                operation.duration += timings.duration
+                operation.sql_count += timings.sql_count
+                operation.sql_duration += timings.sql_duration
+            for path, field in timings.fields.items():
+                total = self._get_series(self.fields, (operation_name, path))
+                if total is None:
+                    continue
+                total.calls += field.calls
+                total.duration += field.duration
+                total.sql_count += field.sql_count
+                total.sql_duration += field.sql_duration
+        if settings.METRICS_DIR:
+            self.dump(settings.METRICS_DIR)
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return {
+                name: [
+                    [
+                        list(key) if isinstance(key, tuple) else [key],
+                        *(getattr(timing, attribute) for attribute in TIMING_ATTRIBUTES),
+                    ]
+                    for key, timing in series.items()
+                ]
+                for name, series in (('operations', self.operations), ('fields', self.fields))
+            }
+
+    def add_state(self, state: dict):
+        with self.lock:
+            for name, series in (('operations', self.operations), ('fields', self.fields)):
+                for key, *values in state.get(name, []):
+                    timing = self._get_series(series, _load_key(key))
+                    if timing is None:
+                        continue
+                    for attribute, value in zip(TIMING_ATTRIBUTES, values):
+                        setattr(timing, attribute, getattr(timing, attribute) + value)
+
+    def dump(self, directory: str, force: bool = False):
+        """
+        Writes the totals of the process into the directory, at most every METRICS_DUMP_INTERVAL seconds
+        """
+        now = time.monotonic()
+        if self.dumped_at is None:
+            # the last ones, when the worker exits
+            atexit.register(self.dump, directory, force=True)
+        elif not force and now - self.dumped_at < METRICS_DUMP_INTERVAL:
+            return
+        self.dumped_at = now
+        try:
+            _write_state(directory, f'{os.getpid()}.json', self.get_state())
+        except OSError:
+            logger.warning(f'Failed to write the metrics into {directory}', exc_info=True)
+
+    def clear(self):
+        with self.lock:
+            self.operations.clear()
+            self.fields.clear()
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format, with the totals of all the workers with METRICS_DIR
+        """
+        directory = settings.METRICS_DIR
+        if not directory:
+            return self.render_process()
+        totals = MetricsRegistry()
+        totals.add_state(self.get_state())
+        own = os.path.join(directory, f'{os.getpid()}.json')
+        with metrics_dir_lock(directory):
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                if path != own:
+                    totals.add_state(_read_state(path))
+        return totals.render_process()
+
+    def render_process(self) -> str:
+        lines = []
+        with self.lock:
+            for series, label_names, metrics in (
+                (self.operations, ('operation',), OPERATION_METRICS),
+                (self.fields, ('operation', 'path'), FIELD_METRICS),
+            ):
+                for name, help_text, attribute in metrics:
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} counter')
+                    for key, timing in series.items():
+                        values = key if isinstance(key, tuple) else (key,)
+                        labels = ','.join(
+                            f'{label}="{_escape(value)}"' for label, value in zip(label_names, values)
+                        )
+                        lines.append(f'{name}{{{labels}}} {getattr(timing, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def is_sampled() -> bool:
+    return random.random() < settings.GRAPHQL_INSTRUMENTATION_SAMPLE_RATE
+
+
+@contextmanager
+def instrument_request(request):
+    """
+    Samples the graphql request, its timings (with the SQL queries of all the database connections)
+    are recorded in request.timings, then logged and added to the metrics registry
+    """
+    if not is_sampled():
+        request.timings = None
+        yield
+        return
+    timings = request.timings = RequestTimings()
+    # not the path of a previous request of the thread
+    token = current_path.set(None)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            yield
+    finally:
+        current_path.reset(token)
+    timings.finish()
+    metrics_registry.record(timings)
+    logger.info(json.dumps(timings.as_dict()))
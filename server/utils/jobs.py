@@ -0,0 +1,165 @@
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# name: function, filled by the @job decorator in the <app>/jobs.py modules
+JOBS = {}
+# name: function called with the Job once it has failed for good (out of attempts or timed out)
+FAILURE_HANDLERS = {}
+
+
+def job(name: str, priority: int = 0, max_attempts: int = None, on_failure: Callable = None) -> Callable:
+    """
+    Registers the function as a job, run by the workers with the keyword arguments of `enqueue`
+
+    eg.
+    @job('entry.rebuild_figure_aggregates')
+    def rebuild(field, owner_ids):
+        ...
+
+    rebuild.enqueue(field='country', owner_ids=[1, 2])
+    """
+    def wrapped(func):
+        JOBS[name] = func
+        if on_failure is not None:
+            FAILURE_HANDLERS[name] = on_failure
+        func.job_name = name
+
+        def enqueue_job(**kwargs):
+            kwargs.setdefault('priority', priority)
+            kwargs.setdefault('max_attempts', max_attempts)
+            return enqueue(name, **kwargs)
+        func.enqueue = enqueue_job
+        return func
+    return wrapped
+
+
+def enqueue(job_name: str, priority: int = 0, run_at=None, max_attempts: int = None, created_by=None, **kwargs):
+    """
+    Adds the job to the queue, the workers see it once the current transaction is committed
+
+    The keyword arguments of the job should be json serializable, with JOBS_EAGER the job is
+    run immediately (eg. in the tests).
+    """
+    from apps.contrib.models import Job
+
+    if job_name not in JOBS:
+        raise ValueError(f'Unknown job {job_name}')
+    instance = Job.objects.create(
+        name=job_name,
+        kwargs=json.loads(json.dumps(kwargs, cls=DjangoJSONEncoder)),
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        created_by=created_by if created_by and created_by.is_authenticated else None,
+    )
+    if settings.JOBS_EAGER:
+        instance.status = Job.STATUS.RUNNING
+        instance.attempts += 1
+        instance.started_at = timezone.now()
+        run_job(instance)
+    return instance
+
+
+def get_retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff with jitter, capped to JOB_RETRY_MAX_DELAY seconds
+    """
+    delay = min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def handle_failure(instance):
+    """
+    Calls the failure handler of the failed job, its errors are logged so the job stays failed
+    """
+    on_failure = FAILURE_HANDLERS.get(instance.name)
+    if on_failure is None:
+        return
+    try:
+        with transaction.atomic():
+            on_failure(instance)
+    except Exception:
+        logger.exception(f'Failure handler of the job {instance.name} {instance.id} failed')
+
+
+def claim_job():
+    """
+    Locks and marks as running the next pending job, the locked rows are skipped so that
+    the workers do not wait for each other
+
+    The jobs left running longer than JOB_TIMEOUT (eg. by a killed worker) are claimed again, or
+    failed once out of attempts.
+    """
+    from apps.contrib.models import Job
+
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            instance = Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.STATUS.PENDING, run_at__lte=now) |
+                Q(status=Job.STATUS.RUNNING, started_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+            ).order_by('-priority', 'run_at', 'id').first()
+            if instance is None:
+                return None
+            if instance.status == Job.STATUS.RUNNING and instance.attempts >= instance.max_attempts:
+                instance.status = Job.STATUS.FAILED
+                instance.error = 'Timed out'
+                instance.finished_at = now
+                instance.save(update_fields=['status', 'error', 'finished_at'])
+                handle_failure(instance)
+                continue
+            instance.status = Job.STATUS.RUNNING
+            instance.attempts += 1
+            instance.started_at = now
+            instance.save(update_fields=['status', 'attempts', 'started_at'])
+        return instance
+
+
+def run_job(instance):
+    """
+    Runs the claimed job in a transaction, failed jobs are retried with a backoff until their max_attempts
+    """
+    from apps.contrib.models import Job
+
+    func = JOBS.get(instance.name)
+    try:
+        if func is None:
+            raise ValueError(f'Unknown job {instance.name}')
+        with transaction.atomic():
+            result = func(**instance.kwargs)
+    except Exception:
+        logger.exception(f'Job {instance.name} {instance.id} failed (attempt {instance.attempts})')
+        instance.error = traceback.format_exc()
+        if func is not None and instance.attempts < instance.max_attempts:
+            instance.status = Job.STATUS.PENDING
+            instance.run_at = timezone.now() + get_retry_delay(instance.attempts)
+        else:
+            instance.status = Job.STATUS.FAILED
+            instance.finished_at = timezone.now()
+            handle_failure(instance)
+    else:
+        instance.status = Job.STATUS.COMPLETED
+        instance.result = json.loads(json.dumps(result, cls=DjangoJSONEncoder))
+        instance.error = None
+        instance.finished_at = timezone.now()
+    instance.save()
+    return instance
+
+
+def run_next_job() -> Optional[object]:
+    instance = claim_job()
+    if instance is not None:
+        run_job(instance)
+    return instance
@@ -1,4 +1,5 @@
 import json
+import time
 
 from django.conf import settings
 from debug_toolbar.middleware import DebugToolbarMiddleware as BaseMiddleware
@@ -7,10 +8,16 @@ from debug_toolbar.toolbar import DebugToolbar
 from django.template.loader import render_to_string
 from graphiql_debug_toolbar.middleware import get_payload, set_content_length
 from graphiql_debug_toolbar.serializers import CallableJSONEncoder
+from graphql.type.definition import GraphQLEnumType, GraphQLScalarType, get_named_type
+from promise import Promise
+
+from utils.db import check_connections, close_old_connections, mark_connections_idle
+from utils.instrumentation import current_path
+from utils.replicas import choose_replica, is_replica_operation, routing_state
 
 APP_TO_CHECK_AGAINST = ['contact']
 
-__all__ = ['DebugToolbarMiddleware']
+__all__ = ['ConnectionsMiddleware', 'DebugToolbarMiddleware', 'ReplicaMiddleware', 'TimingMiddleware']
 
 _HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
 
@@ -32,6 +39,76 @@ class AuthorizationMiddleware(object):
         return next(root, info, **args)
 
 
+class TimingMiddleware(object):
+    """
+    Records the wall time of the resolvers of the sampled requests (see utils/instrumentation.py)
+
+    Fields are grouped by their path without the list indices, eg. entryList.results.figures,
+    the scalar fields are not timed.
+    """
+    def resolve(self, next, root, info, **args):
+        timings = getattr(info.context, 'timings', None)
+        if timings is None or isinstance(get_named_type(info.return_type), (GraphQLScalarType, GraphQLEnumType)):
+            return next(root, info, **args)
+        if timings.operation_name is None and info.operation.name:
+            timings.operation_name = info.operation.name.value
+        path = '.'.join(str(key) for key in info.path if not isinstance(key, int))
+        current_path.set(path)
+        start = time.perf_counter()
+        result = next(root, info, **args)
+        if isinstance(result, Promise):
+            # eg. dataloaders, timed until the batch is resolved
+            def record(value):
+                timings.record_field(path, time.perf_counter() - start)
+                return value
+            return result.then(record)
+        timings.record_field(path, time.perf_counter() - start)
+        return result
+
+
+class ReplicaMiddleware(object):
+    """
+    Routes the reads of the query operations to a read replica (see utils/replicas.py)
+
+    Decided once per request, by its first resolved field: the mutations, the queries of the
+    PRIMARY_FIELDS, the sessions which wrote recently and the requests without a replica within
+    REPLICA_MAX_LAG read from the primary.
+    """
+    def resolve(self, next, root, info, **args):
+        state = routing_state.get()
+        if state is not None and not state.decided:
+            # the root fields can be resolved concurrently
+            with state.lock:
+                if not state.decided:
+                    if not state.pinned and is_replica_operation(info.operation):
+                        state.read_alias = choose_replica()
+                    state.decided = True
+        return next(root, info, **args)
+
+
+class ConnectionsMiddleware(object):
+    """
+    Closes the obsolete database connections of the thread of the view (CONN_MAX_AGE, returned to
+    the pool with DB_POOL_ENABLED), before and after the request
+
+    Under ASGI the request_started and request_finished signals are sent from other threads than
+    the view, so the connections of the view threads would otherwise stay open.
+    The streamed responses (eg. the exports) still read from the connection, it is then closed by
+    the next request of the thread.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        close_old_connections()
+        check_connections()
+        response = self.get_response(request)
+        if not response.streaming:
+            close_old_connections()
+            mark_connections_idle()
+        return response
+
+
 class DebugToolbarMiddleware(BaseMiddleware):
     # https://github.com/flavors/django-graphiql-debug-toolbar/issues/9
     # https://gist.github.com/ulgens/e166ad31ec71e6b1f0777a8d81ce48ae
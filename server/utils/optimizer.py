@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from typing import Dict, List
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model, Prefetch, QuerySet
+from graphene import Dynamic
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import Field as FieldNode, FragmentSpread, InlineFragment
+from graphene_django_extras.registry import get_global_registry
+
+from utils.pagination import PageGraphqlPagination
+from utils.permissions import PERMISSION_FIELDS, get_user_permissions
+
+# arguments of the nested paginated lists which can still be served from a prefetch
+PAGINATION_ARGUMENTS = {'page', 'pageSize', 'perPage'}
+
+
+def get_selections(selection_sets: list, fragments: dict) -> Dict[str, List[FieldNode]]:
+    """
+    Flattens the fragments of the selection sets and groups the selected field nodes by their name
+    """
+    selections = OrderedDict()
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpread):
+                fragment = fragments.get(selection.name.value)
+                nested = get_selections([fragment.selection_set], fragments) if fragment else {}
+            elif isinstance(selection, InlineFragment):
+                nested = get_selections([selection.selection_set], fragments)
+            else:
+                nested = {selection.name.value: [selection]}
+            for name, nodes in nested.items():
+                selections.setdefault(name, []).extend(nodes)
+    return selections
+
+
+def get_sub_selections(nodes: List[FieldNode], fragments: dict) -> Dict[str, List[FieldNode]]:
+    return get_selections([node.selection_set for node in nodes], fragments)
+
+
+def _get_source_fields(model) -> Dict[str, List[str]]:
+    # model fields read by the custom resolvers of a type, eg. EntryType.document_url
+    return getattr(get_global_registry().get_type_for_model(model), 'source_fields', None) or {}
+
+
+def _get_graphene_field(model, name):
+    _type = get_global_registry().get_type_for_model(model)
+    if _type is None:
+        return None
+    field = _type._meta.fields.get(name)
+    if isinstance(field, Dynamic):
+        field = field.get_type()
+    return field
+
+
+class QuerySetPlan:
+    """
+    Collects the select_related, prefetch_related and only paths for a queryset
+    """
+    def __init__(self):
+        self.only = set()
+        self.select_related = []
+        self.prefetch_related = []
+
+    def apply(self, qs: QuerySet) -> QuerySet:
+        if self.select_related:
+            qs = qs.select_related(*self.select_related)
+        if self.prefetch_related:
+            qs = qs.prefetch_related(*self.prefetch_related)
+        if self.only:
+            qs = qs.only(*self.only)
+        return qs
+
+
+def _plan(model: Model, selections: Dict[str, List[FieldNode]], fragments: dict,
+          plan: QuerySetPlan, prefix: str = '', info=None):
+    # primary key and foreign keys are always loaded, they are cheap and used by the resolvers
+    plan.only.add(f'{prefix}{model._meta.pk.attname}')
+    plan.only.update(
+        f'{prefix}{field.attname}' for field in model._meta.concrete_fields if field.is_relation
+    )
+    source_fields = _get_source_fields(model)
+    for name, nodes in selections.items():
+        field_name = to_snake_case(name)
+        if field_name in source_fields:
+            plan.only.update(
+                f'{prefix}{model._meta.get_field(source).attname}' for source in source_fields[field_name]
+            )
+            continue
+        try:
+            field = model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            # properties or custom resolvers
+            continue
+        if not field.is_relation:
+            if field.concrete:
+                plan.only.add(f'{prefix}{field.attname}')
+            continue
+        if field.many_to_one or field.one_to_one:
+            plan.select_related.append(f'{prefix}{field_name}')
+            _plan(field.related_model, get_sub_selections(nodes, fragments), fragments,
+                  plan, prefix=f'{prefix}{field_name}__', info=info)
+            continue
+        # one_to_many or many_to_many
+        if any(argument.name.value not in PAGINATION_ARGUMENTS
+               for node in nodes for argument in node.arguments or []):
+            # filtered or ordered lists are resolved by their own field
+            continue
+        sub_selections = get_sub_selections(nodes, fragments)
+        graphene_field = _get_graphene_field(model, field_name)
+        results_field_name = getattr(
+            getattr(getattr(graphene_field, 'type', None), '_meta', None), 'results_field_name', None
+        )
+        if results_field_name and field.auto_created and field.one_to_many and \
+                isinstance(getattr(graphene_field, 'pagination', None), PageGraphqlPagination):
+            # the pages of all the parents are fetched at once by the list field itself, see
+            # PaginatedListDataLoader
+            continue
+        if results_field_name:
+            # paginated list, eg. CountryType.crises
+            sub_selections = get_sub_selections(sub_selections.get(results_field_name, []), fragments)
+        accessor = field.get_accessor_name() if field.auto_created else field.name
+        queryset = optimize_queryset(field.related_model._default_manager.all(), sub_selections, fragments, info)
+        if info is not None:
+            queryset = annotate_permissions(queryset, info, sub_selections)
+        plan.prefetch_related.append(Prefetch(f'{prefix}{accessor}', queryset=queryset))
+
+
+def optimize_queryset(qs: QuerySet, selections: Dict[str, List[FieldNode]], fragments: dict,
+                      info=None) -> QuerySet:
+    """
+    Applies select_related, prefetch_related and only() to the queryset from the selected fields,
+    the prefetched lists are annotated with the permission flags of the user of the info
+    """
+    if not selections:
+        return qs
+    plan = QuerySetPlan()
+    _plan(qs.model, selections, fragments, plan, info=info)
+    return plan.apply(qs)
+
+
+def optimize_list_queryset(qs: QuerySet, info, results_field_name: str = 'results') -> QuerySet:
+    """
+    Optimizes the queryset of a paginated list field (eg. entryList) based on the fields
+    selected inside its `results`
+    """
+    fragments = info.fragments or {}
+    selections = get_sub_selections(info.field_asts, fragments)
+    results_selections = get_sub_selections(selections.get(results_field_name, []), fragments)
+    qs = optimize_queryset(qs, results_selections, fragments, info)
+    return annotate_permissions(qs, info, results_selections)
+
+
+def annotate_permissions(qs: QuerySet, info, selections: Dict[str, List[FieldNode]]) -> QuerySet:
+    """
+    Annotates the permission flags (eg. canEdit) selected on the types with an `owner_lookup`
+    """
+    fields = [name for name in selections if name in PERMISSION_FIELDS]
+    owner_lookup = getattr(get_global_registry().get_type_for_model(qs.model), 'owner_lookup', None)
+    if not fields or owner_lookup is None:
+        return qs
+    return get_user_permissions(info.context.user).annotate(qs, owner_lookup, fields)
@@ -1,5 +1,20 @@
-from graphene import String
-from graphene_django_extras.paginations.pagination import BaseDjangoGraphqlPagination
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils.translation import gettext
+from graphene import Int, String
+from graphene_django_extras.paginations.pagination import (
+    BaseDjangoGraphqlPagination,
+    PageGraphqlPagination as BasePageGraphqlPagination,
+)
+from graphene_django_extras.paginations.utils import _nonzero_int
+from graphene_django_extras.settings import graphql_api_settings
 
 
 class OrderingOnlyArgumentPagination(BaseDjangoGraphqlPagination):
@@ -48,3 +63,330 @@ class OrderingOnlyArgumentPagination(BaseDjangoGraphqlPagination):
                 qs = qs.order_by(order)
 
         return qs
+
+
+def get_ordering(order: str) -> list:
+    return [each for each in (order or '').strip(",").replace(" ", "").split(",") if each]
+
+
+def paginate_partitions(qs, field_name: str, keys: list, ordering: list, offset: int, limit: int):
+    """
+    Rows offset + 1 to offset + limit of each of the keys, in one query
+
+    The rows are numbered within each key with ROW_NUMBER() OVER (PARTITION BY <foreign key>),
+    and ordered by the key then the ordering.
+    """
+    attname = qs.model._meta.get_field(field_name).attname
+    ordering = list(ordering or qs.query.order_by or qs.model._meta.ordering)
+    if not any(isinstance(each, str) and each.lstrip('-') in ('id', 'pk') for each in ordering):
+        # tie breaker, so the pages do not overlap
+        ordering.append('pk')
+    qs = qs.filter(**{f'{field_name}__in': keys})
+    numbered = qs.annotate(
+        _row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F(attname)],
+            order_by=[
+                each if not isinstance(each, str) else F(each[1:]).desc() if each.startswith('-') else F(each).asc()
+                for each in ordering
+            ],
+        )
+    ).order_by().values('pk', '_row_number')
+    sql, params = numbered.query.sql_with_params()
+    # window functions can not be filtered in the same query
+    page = RawSQL(
+        f'SELECT "page"."{qs.model._meta.pk.column}" FROM ({sql}) AS "page" '
+        'WHERE "page"."_row_number" > %s AND "page"."_row_number" <= %s',
+        (*params, offset, offset + limit),
+    )
+    return qs.filter(pk__in=page).order_by(attname, *ordering)
+
+
+class PageGraphqlPagination(BasePageGraphqlPagination):
+    """
+    Same as the PageGraphqlPagination of graphene_django_extras, but the queryset is only counted when the
+    page is negative (counted from the end). The total count is handled by the list field itself.
+
+    The prefetched lists (see utils/optimizer.py) are paginated as they are, without ordering.
+    """
+    def get_page_size(self, **kwargs):
+        if self.page_size_query_param:
+            return _nonzero_int(
+                kwargs.get(self.page_size_query_param, self.page_size),
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        return self.page_size
+
+    def paginate_queryset(self, qs, **kwargs):
+        page = kwargs.get(self.page_query_param, 1)
+        assert page != 0, ValueError(
+            "Page value for PageGraphqlPagination must be a non-zero value"
+        )
+        page_size = self.get_page_size(**kwargs)
+        if page_size is None:
+            return None
+
+        order = get_ordering(kwargs.pop(self.ordering_param, None) or self.ordering)
+        if order and not isinstance(qs, list):
+            qs = qs.order_by(*order)
+
+        if page is not None and page < 0:
+            count = len(qs) if isinstance(qs, list) else qs.count()
+            offset = max(0, count + page_size * page)
+        else:
+            offset = page_size * (page - 1)
+        return qs[offset:offset + page_size]
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds of the datetimes and times, which DjangoJSONEncoder truncates to milliseconds
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage(list):
+    """
+    Page of results returned by the KeysetGraphqlPagination along with its cursors
+    """
+    def __init__(self, results, next_cursor=None, previous_cursor=None):
+        super().__init__(results)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+
+class KeysetGraphqlPagination(BaseDjangoGraphqlPagination):
+    """
+    Keyset (cursor) pagination, an opt-in alternative to PageGraphqlPagination.
+
+    Rows are located with `WHERE (ordering columns, id) > (cursor values)` instead of OFFSET,
+    so the deep pages cost the same as the first one. The ordering columns have to be
+    index-backed and not nullable.
+    """
+    __name__ = "KeysetPaginator"
+
+    def __init__(
+        self,
+        page_size=graphql_api_settings.DEFAULT_PAGE_SIZE,
+        page_size_query_param='pageSize',
+        max_page_size=graphql_api_settings.MAX_PAGE_SIZE,
+        ordering="",
+        ordering_param="ordering",
+        after_query_param="after",
+        before_query_param="before",
+    ):
+        self.page_size = page_size
+        self.page_size_query_param = page_size_query_param
+        self.max_page_size = max_page_size
+        self.ordering = ordering
+        self.ordering_param = ordering_param
+        self.after_query_param = after_query_param
+        self.before_query_param = before_query_param
+
+    def to_dict(self):
+        return {
+            "page_size_query_param": self.page_size_query_param,
+            "page_size": self.page_size,
+            "max_page_size": self.max_page_size,
+            "ordering_param": self.ordering_param,
+            "ordering": self.ordering,
+            "after_query_param": self.after_query_param,
+            "before_query_param": self.before_query_param,
+        }
+
+    def to_graphql_fields(self):
+        return {
+            self.page_size_query_param: Int(
+                description="Number of results to return per page. Default 'page_size': {}".format(self.page_size)
+            ),
+            self.after_query_param: String(description="Cursor after which the results are returned."),
+            self.before_query_param: String(description="Cursor before which the results are returned."),
+            self.ordering_param: String(
+                description="A string or comma delimited string values that indicate the "
+                "default ordering when obtaining lists of objects. Only indexed fields are allowed."
+            ),
+        }
+
+    @staticmethod
+    def encode_cursor(values: list) -> str:
+        return base64.urlsafe_b64encode(json.dumps(values, cls=CursorJSONEncoder).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str, ordering: list) -> list:
+        """
+        Values of the ordering columns in the cursor, which must have been built for the same ordering
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise ValueError(gettext('Invalid cursor.'))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError(gettext('Invalid cursor.'))
+        return values
+
+    @staticmethod
+    def get_indexed_fields(model) -> set:
+        fields = set()
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.unique or field.db_index:
+                fields.add(field.name)
+        for index in model._meta.indexes:
+            fields.add(index.fields[0].lstrip('-'))
+        for together in model._meta.unique_together:
+            fields.add(together[0])
+        return fields
+
+    def get_ordering(self, model, order: str) -> list:
+        """
+        Returns the validated ordering with `id` appended as the tie breaker
+        """
+        ordering = [each for each in order.strip(",").replace(" ", "").split(",") if each]
+        indexed_fields = self.get_indexed_fields(model)
+        for each in ordering:
+            name = each.lstrip('-')
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(gettext('Cannot order by %(field)s.') % {'field': name})
+            if name not in indexed_fields or not field.concrete or field.null:
+                raise ValueError(gettext('Ordering by %(field)s is not supported, '
+                                         'use an indexed and non nullable field.') % {'field': name})
+        if not any(each.lstrip('-') in ('id', 'pk') for each in ordering):
+            ordering.append('id')
+        return ordering
+
+    @staticmethod
+    def get_keyset_filter(ordering: list, values: list, reverse: bool = False) -> Q:
+        """
+        (a, b) > (x, y) is expanded into (a > x) OR (a = x AND b > y), honouring the direction of each column
+        """
+        keyset_filter = Q()
+        equals = Q()
+        for order, value in zip(ordering, values):
+            name = order.lstrip('-')
+            descending = order.startswith('-') != reverse
+            keyset_filter |= equals & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equals &= Q(**{name: value})
+        return keyset_filter
+
+    @staticmethod
+    def get_cursor(instance, ordering: list) -> str:
+        return KeysetGraphqlPagination.encode_cursor([
+            getattr(instance, instance._meta.get_field(each.lstrip('-')).attname) for each in ordering
+        ])
+
+    def is_keyset(self, **kwargs) -> bool:
+        return True
+
+    def paginate_queryset(self, qs, **kwargs):
+        page_size = _nonzero_int(
+            kwargs.get(self.page_size_query_param, self.page_size),
+            strict=True,
+            cutoff=self.max_page_size,
+        )
+        order = kwargs.pop(self.ordering_param, None) or self.ordering
+        ordering = self.get_ordering(qs.model, order)
+        after = kwargs.get(self.after_query_param)
+        before = kwargs.get(self.before_query_param)
+        if after and before:
+            raise ValueError(gettext('Pass either after or before, not both.'))
+
+        if before:
+            reversed_ordering = [each[1:] if each.startswith('-') else f'-{each}' for each in ordering]
+            qs = qs.filter(
+                self.get_keyset_filter(ordering, self.decode_cursor(before, ordering), reverse=True)
+            ).order_by(*reversed_ordering)
+        else:
+            qs = qs.order_by(*ordering)
+            if after:
+                qs = qs.filter(self.get_keyset_filter(ordering, self.decode_cursor(after, ordering)))
+
+        # fetch an extra row to know if there are more results
+        results = list(qs[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if before:
+            results.reverse()
+            next_cursor = self.get_cursor(results[-1], ordering) if results else None
+            previous_cursor = self.get_cursor(results[0], ordering) if has_more else None
+        else:
+            next_cursor = self.get_cursor(results[-1], ordering) if has_more else None
+            previous_cursor = self.get_cursor(results[0], ordering) if after and results else None
+        return KeysetPage(results, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+class CursorPageGraphqlPagination(PageGraphqlPagination):
+    """
+    PageGraphqlPagination which also accepts the `after`/`before` cursors of the KeysetGraphqlPagination,
+    eg. entryList.
+
+    The pages return their cursors when the ordering is index-backed, the pages after (or before) a
+    cursor are then located without OFFSET and without counting (the page argument is ignored).
+    """
+    def __init__(self, *args, after_query_param="after", before_query_param="before", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keyset = KeysetGraphqlPagination(
+            page_size=self.page_size,
+            page_size_query_param=self.page_size_query_param,
+            max_page_size=self.max_page_size,
+            ordering=self.ordering,
+            ordering_param=self.ordering_param,
+            after_query_param=after_query_param,
+            before_query_param=before_query_param,
+        )
+
+    def to_dict(self):
+        return {
+            **super().to_dict(),
+            "after_query_param": self.keyset.after_query_param,
+            "before_query_param": self.keyset.before_query_param,
+        }
+
+    def to_graphql_fields(self):
+        keyset_fields = self.keyset.to_graphql_fields()
+        return {
+            **super().to_graphql_fields(),
+            self.keyset.after_query_param: keyset_fields[self.keyset.after_query_param],
+            self.keyset.before_query_param: keyset_fields[self.keyset.before_query_param],
+        }
+
+    def is_keyset(self, **kwargs) -> bool:
+        return bool(kwargs.get(self.keyset.after_query_param) or kwargs.get(self.keyset.before_query_param))
+
+    def get_keyset_ordering(self, qs, order: str):
+        """
+        Ordering of the cursors, or None if the ordering is not index-backed
+        """
+        if not order:
+            default_ordering = qs.query.order_by or qs.model._meta.ordering
+            if not all(isinstance(each, str) for each in default_ordering):
+                return None
+            order = ','.join(default_ordering)
+        try:
+            return self.keyset.get_ordering(qs.model, order)
+        except ValueError:
+            return None
+
+    def paginate_queryset(self, qs, **kwargs):
+        if self.is_keyset(**kwargs):
+            return self.keyset.paginate_queryset(qs, **kwargs)
+        page = kwargs.get(self.page_query_param, 1)
+        page_size = self.get_page_size(**kwargs)
+        ordering = self.get_keyset_ordering(qs, kwargs.get(self.ordering_param) or self.ordering)
+        if page is None or page < 1 or page_size is None or ordering is None:
+            return super().paginate_queryset(qs, **kwargs)
+
+        offset = page_size * (page - 1)
+        # fetch an extra row to know if there are more results
+        results = list(qs.order_by(*ordering)[offset:offset + page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        return KeysetPage(
+            results,
+            next_cursor=self.keyset.get_cursor(results[-1], ordering) if has_more else None,
+            previous_cursor=self.keyset.get_cursor(results[0], ordering) if page > 1 and results else None,
+        )
@@ -1,15 +1,215 @@
-from typing import List, Callable
+import hashlib
+import json
+from typing import Dict, Iterable, List, Callable, Optional
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import BooleanField, Case, Q, Value, When
 from django.utils.translation import gettext
 
+from apps.users.roles import ADMIN
+from utils.counts import bump_table_version, get_table_versions
+
 PERMISSION_DENIED_MESSAGE = 'You do not have permission to perform this action.'
 
+USER_GROUPS_KEY = 'user_groups_{}_{}'
+USER_PERMISSIONS_KEY = 'user_permissions_{}_{}_{}'
+
+# flags of the types with an owner (see UserPermissions.annotate), by action
+PERMISSION_FIELDS = {
+    'canEdit': 'change',
+    'canDelete': 'delete',
+}
+
+
+def get_permission_models() -> set:
+    User = get_user_model()
+    return {Group, Permission, User.groups.through, User.user_permissions.through, Group.permissions.through}
+
+
+def get_permissions_version() -> str:
+    """
+    Changes whenever a role, a permission or the roles and permissions of a user change, with the
+    table versions of utils/counts.py (bumped by the post_save, post_delete and m2m_changed signals)
+    """
+    versions = get_table_versions(get_permission_models())
+    key = json.dumps(sorted((model._meta.label_lower, version) for model, version in versions.items()))
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def bump_permissions_version():
+    # eg. the permissions created by the migrations, without the signals
+    for model in get_permission_models():
+        bump_table_version(model)
+
+
+def get_users_groups(user_ids: Iterable[int], version: Optional[str] = None) -> Dict[int, List[str]]:
+    """
+    Names of the groups (roles) of the users ordered by id, cached across the requests
+
+    Read from the primary, a replica could miss the changes of the version.
+    """
+    version = version or get_permissions_version()
+    keys = {USER_GROUPS_KEY.format(pk, version): pk for pk in user_ids}
+    groups = {keys[key]: names for key, names in cache.get_many(keys).items()}
+    missing = {pk: [] for pk in keys.values() if pk not in groups}
+    if missing:
+        memberships = get_user_model().groups.through.objects.using(DEFAULT_DB_ALIAS).filter(
+            user__in=missing
+        ).order_by('group_id').values_list('user_id', 'group__name')
+        for user_id, name in memberships:
+            missing[user_id].append(name)
+        cache.set_many({
+            USER_GROUPS_KEY.format(pk, version): names for pk, names in missing.items()
+        }, settings.PERMISSIONS_CACHE_TIMEOUT)
+        groups.update(missing)
+    return groups
+
+
+def get_all_permissions(user) -> List[str]:
+    """
+    Same as ModelBackend.get_all_permissions, read from the primary as get_users_groups
+    """
+    if not user.is_active:
+        return []
+    permissions = Permission.objects.using(DEFAULT_DB_ALIAS)
+    if not user.is_superuser:
+        permissions = permissions.filter(Q(user=user) | Q(group__user=user))
+    return sorted({
+        f'{app_label}.{codename}'
+        for app_label, codename in permissions.values_list('content_type__app_label', 'codename')
+    })
+
+
+class UserPermissions:
+    """
+    Groups and permissions of the user, cached across the requests by user id and permissions
+    version, and kept for the request (the user is per request)
+
+    The edit and delete rules of the owned objects (superuser, ADMIN role or owner) are evaluated
+    either on an instance or for a whole queryset as an annotation.
+    """
+    def __init__(self, user):
+        self.user = user
+        self._version = None
+        self._groups = None
+        self._perms = None
+
+    @property
+    def version(self) -> str:
+        if self._version is None:
+            self._version = get_permissions_version()
+        return self._version
+
+    @property
+    def group_names(self) -> List[str]:
+        if self._groups is None:
+            self._groups = get_users_groups(
+                [self.user.pk], self.version
+            )[self.user.pk] if self.user.is_authenticated else []
+        return self._groups
+
+    @property
+    def groups(self) -> set:
+        return set(self.group_names)
+
+    @property
+    def role(self) -> Optional[str]:
+        return self.group_names[0] if self.group_names else None
+
+    @property
+    def perms(self) -> set:
+        if self._perms is None:
+            if not self.user.is_authenticated:
+                self._perms = set()
+                return self._perms
+            # the permissions of a superuser or of an inactive user are not those of its groups
+            key = USER_PERMISSIONS_KEY.format(
+                self.user.pk, self.version, f'{int(self.user.is_superuser)}{int(self.user.is_active)}'
+            )
+            perms = cache.get(key)
+            if perms is None:
+                perms = get_all_permissions(self.user)
+                cache.set(key, perms, settings.PERMISSIONS_CACHE_TIMEOUT)
+            self._perms = set(perms)
+            # so that user.has_perm is answered by the backend without the queries
+            self.user._perm_cache = self._perms
+        return self._perms
+
+    @property
+    def is_admin(self) -> bool:
+        return self.user.is_superuser or ADMIN in self.groups
+
+    def has_perms(self, perms: List[str]) -> bool:
+        # same as the ModelBackend
+        if not self.user.is_active:
+            return False
+        return self.user.is_superuser or set(perms) <= self.perms
+
+    @staticmethod
+    def get_perm(model, action: str) -> str:
+        return f'{model._meta.app_label}.{action}_{model._meta.model_name}'
+
+    def is_owner_or_admin(self, owner_id) -> bool:
+        if self.is_admin:
+            return True
+        return self.user.is_authenticated and owner_id is not None and owner_id == self.user.pk
+
+    def get_expression(self, action: str, model, owner_lookup: str):
+        if not self.has_perms([self.get_perm(model, action)]):
+            return Value(False, output_field=BooleanField())
+        if self.is_admin:
+            return Value(True, output_field=BooleanField())
+        return Case(
+            When(Q(**{owner_lookup: self.user.pk}), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+
+    def annotate(self, qs, owner_lookup: str, fields=PERMISSION_FIELDS):
+        """
+        Annotates the flags on the rows (eg. canEdit as `_can_edit`), see resolve_permission
+        """
+        return qs.annotate(**{
+            get_annotation_name(field): self.get_expression(PERMISSION_FIELDS[field], qs.model, owner_lookup)
+            for field in fields
+        })
+
+
+def get_annotation_name(field: str) -> str:
+    # eg. canEdit -> _can_edit
+    return '_can_' + field[len('can'):].lower()
+
+
+def get_user_permissions(user) -> UserPermissions:
+    permissions = getattr(user, '_user_permissions', None)
+    if permissions is None:
+        permissions = user._user_permissions = UserPermissions(user)
+    return permissions
+
+
+def resolve_permission(root, info, field: str) -> bool:
+    """
+    Resolver of the canEdit/canDelete flags, annotated along with the lists (see utils/optimizer.py)
+    or evaluated with `can_be_updated_by` of the instance
+    """
+    annotation = get_annotation_name(field)
+    if hasattr(root, annotation):
+        return getattr(root, annotation)
+    user = info.context.user
+    permissions = get_user_permissions(user)
+    return permissions.has_perms([permissions.get_perm(type(root), PERMISSION_FIELDS[field])]) \
+        and root.can_be_updated_by(user)
+
 
 def permission_checker(perms: List[str]) -> Callable[..., Callable]:
     def wrapped(func):
         def wrapped_func(root, info, *args, **kwargs):
-            if not info.context.user.has_perms(perms):
+            if not get_user_permissions(info.context.user).has_perms(perms):
                 raise PermissionDenied(gettext(PERMISSION_DENIED_MESSAGE))
             return func(root, info, *args, **kwargs)
         return wrapped_func
@@ -0,0 +1,38 @@
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.base import Database
+
+from utils.db import PoolTimeout, close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # the database can not be dropped with connections open
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend taking its connections from the pool of the process (see utils/db.py)
+
+    The connections are returned to the pool when closed by django, eg. at the end of the
+    requests with CONN_MAX_AGE = 0.
+    """
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, conn_params)
+        try:
+            connection = pool.get(partial(super().get_new_connection, conn_params))
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        self.pool = pool
+        # as set by the postgresql backend when opening the connection
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.put(self.connection)
@@ -0,0 +1,133 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from graphql.language import ast
+
+# root fields always read from the primary, eg. right after the login
+PRIMARY_FIELDS = {'me'}
+# set on the responses of the requests which wrote, the reads of the session then use the primary
+PRIMARY_COOKIE = 'helix_primary'
+
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+class RoutingState:
+    """
+    Database of the reads of a graphql request, the primary unless a replica is chosen for it
+    """
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.read_alias = None
+        self.decided = False
+        self.wrote = False
+        self.lock = Lock()
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def routing_scope(request):
+    """
+    The reads of the queries in the scope can be routed to a replica (see ReplicaMiddleware)
+    """
+    state = RoutingState(pinned=PRIMARY_COOKIE in request.COOKIES)
+    token = routing_state.set(state)
+    try:
+        yield state
+    finally:
+        routing_state.reset(token)
+
+
+def pin_to_primary(response):
+    # read-your-writes, for READ_YOUR_WRITES_WINDOW seconds
+    response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.READ_YOUR_WRITES_WINDOW, httponly=True, samesite='Lax')
+
+
+# alias: (lag in seconds, checked at)
+replica_lags = {}
+replica_lags_lock = Lock()
+
+
+def get_replica_lag(alias: str) -> float:
+    """
+    Replication delay of the replica, checked at most every REPLICA_LAG_CHECK_INTERVAL seconds
+    by each process, infinite if the replica can not be reached
+    """
+    now = time.monotonic()
+    with replica_lags_lock:
+        lag, checked_at = replica_lags.get(alias, (None, 0))
+    if lag is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0] or 0)
+    except Exception:
+        lag = float('inf')
+    with replica_lags_lock:
+        replica_lags[alias] = (lag, now)
+    return lag
+
+
+def choose_replica() -> Optional[str]:
+    replicas = [
+        alias for alias in settings.READ_REPLICAS
+        if get_replica_lag(alias) <= settings.REPLICA_MAX_LAG
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+def may_miss_writes(newest_version: int) -> bool:
+    """
+    Whether the reads of the request can miss the writes of the version (see utils/counts.py), from a
+    replica lagging up to REPLICA_MAX_LAG seconds, the values read then are not cached
+    """
+    state = routing_state.get()
+    return state is not None and state.read_alias is not None and \
+        time.time_ns() - newest_version < settings.REPLICA_MAX_LAG * 10 ** 9
+
+
+def is_replica_operation(operation) -> bool:
+    # the fragments at the root could hide a primary field, they are not resolved here
+    return operation.operation == 'query' and all(
+        isinstance(selection, ast.Field) and selection.name.value not in PRIMARY_FIELDS
+        for selection in operation.selection_set.selections
+    )
+
+
+class ReplicaRouter:
+    """
+    Reads from the replica chosen for the current graphql request, if any, and everything else
+    from the primary
+    """
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or state.read_alias is None:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from graphql.language import ast
+from graphql.language.printer import print_ast
+from graphql.type.definition import get_named_type
+
+from utils.backends import get_query_hash
+from utils.counts import get_dependent_models, get_table_versions
+from utils.permissions import PERMISSION_FIELDS, get_user_permissions
+from utils.replicas import may_miss_writes
+
+RESPONSE_CACHE_KEY = 'graphql_response_{}'
+ANONYMOUS_ROLE = 'anonymous'
+
+
+def get_operation(document_ast, operation_name: Optional[str]):
+    operations = [each for each in document_ast.definitions if isinstance(each, ast.OperationDefinition)]
+    if operation_name:
+        operations = [each for each in operations if each.name and each.name.value == operation_name]
+    return operations[0] if len(operations) == 1 else None
+
+
+def get_response_models(schema, document_ast, operation_name: Optional[str]) -> Optional[set]:
+    """
+    Models of the types selected by the operation with the models they relate to (the tags of the
+    response), None if the response is not cached: not a query, with root fields other than the
+    GRAPHQL_CACHED_FIELDS, or selecting the permission flags (they depend on the user, not only on
+    its role, eg. canEdit of the owner)
+    """
+    operation = get_operation(document_ast, operation_name)
+    if operation is None or operation.operation != 'query' or not all(
+        isinstance(selection, ast.Field) and selection.name.value in settings.GRAPHQL_CACHED_FIELDS
+        for selection in operation.selection_set.selections
+    ):
+        return None
+    fragments = {
+        each.name.value: each for each in document_ast.definitions
+        if isinstance(each, ast.FragmentDefinition)
+    }
+    models = set()
+    per_user = []
+
+    def visit(selection_set, graphql_type):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    visit(fragment.selection_set, schema.get_type(fragment.type_condition.name.value))
+                continue
+            if isinstance(selection, ast.InlineFragment):
+                condition = selection.type_condition
+                visit(selection.selection_set, schema.get_type(condition.name.value) if condition else graphql_type)
+                continue
+            field = getattr(graphql_type, 'fields', {}).get(selection.name.value)
+            if field is None:
+                # eg. __typename
+                continue
+            if selection.name.value in PERMISSION_FIELDS:
+                per_user.append(selection.name.value)
+            field_type = get_named_type(field.type)
+            meta = getattr(getattr(field_type, 'graphene_type', None), '_meta', None)
+            if getattr(meta, 'model', None) is not None:
+                models.update(get_dependent_models(meta.model))
+            if selection.selection_set:
+                visit(selection.selection_set, field_type)
+
+    visit(operation.selection_set, schema.get_query_type())
+    return None if per_user else models
+
+
+def get_role(user) -> str:
+    """
+    Responses are shared by the users with the same permissions
+    """
+    if not user.is_authenticated:
+        return ANONYMOUS_ROLE
+    permissions = json.dumps([user.is_superuser, sorted(get_user_permissions(user).perms)])
+    return hashlib.sha256(permissions.encode()).hexdigest()
+
+
+def get_response_cache_key(schema, document, operation_name, variables, request) -> Optional[Tuple[str, int]]:
+    """
+    Cache key of the response with the newest version of its models, None if it is not cached
+
+    The key changes with the versions of the models (see utils/counts.py), so the responses
+    are invalidated by the writes to any of them.
+    """
+    # computed once for each operation of the cached documents
+    cache_info = getattr(document, 'response_cache_info', None)
+    if cache_info is None:
+        cache_info = document.response_cache_info = {}
+    if operation_name not in cache_info:
+        cache_info[operation_name] = (
+            get_query_hash(print_ast(document.document_ast)),
+            get_response_models(schema, document.document_ast, operation_name),
+        )
+    query_hash, models = cache_info[operation_name]
+    if models is None:
+        return None
+    versions = get_table_versions(models)
+    key = json.dumps([
+        query_hash,
+        operation_name,
+        variables or {},
+        get_role(request.user),
+        sorted((model._meta.label_lower, version) for model, version in versions.items()),
+    ], sort_keys=True, cls=DjangoJSONEncoder)
+    return RESPONSE_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest()), max(versions.values(), default=0)
+
+
+def set_cached_response(key: str, newest_version: int, response: tuple):
+    if may_miss_writes(newest_version):
+        return
+    cache.set(key, response, settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT)
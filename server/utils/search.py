@@ -0,0 +1,63 @@
+import re
+from typing import List, Tuple
+
+from django.contrib.postgres.search import SearchQuery
+
+# text search configuration of the search vectors and the queries
+SEARCH_CONFIG = 'english'
+
+
+def get_search_query(value: str) -> SearchQuery:
+    """
+    Prefix matching query of all the words of the value, eg. `flood bangla` matches `Bangladesh floods`
+    """
+    words = re.findall(r'\w+', value)
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def get_search_vector_sql(table: str, columns: List[Tuple[str, str]]) -> Tuple[str, str]:
+    """
+    SQL (and its reverse) of the trigger keeping the `search_vector` of the table up to date,
+    the existing rows are updated as well
+
+    columns: (column, weight) eg. [('name', 'A'), ('event_narrative', 'B')]
+    """
+    function = f'{table}_search_vector_update'
+
+    def get_vector(prefix=''):
+        return ' || '.join(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({prefix}{column}, '')), '{weight}')"
+            for column, weight in columns
+        )
+
+    sql = f'''
+        CREATE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {get_vector('NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {function}
+            BEFORE INSERT OR UPDATE OF {', '.join(column for column, _ in columns)}
+            ON {table} FOR EACH ROW EXECUTE PROCEDURE {function}();
+
+        UPDATE {table} SET search_vector = {get_vector()};
+    '''
+    reverse_sql = f'''
+        DROP TRIGGER IF EXISTS {function} ON {table};
+        DROP FUNCTION IF EXISTS {function}();
+    '''
+    return sql, reverse_sql
+
+
+def get_trigram_index_sql(table: str, column: str) -> Tuple[str, str]:
+    """
+    SQL (and its reverse) of the trigram index used by the `icontains` lookups of the column,
+    which are `UPPER(column::text) LIKE UPPER(...)` in postgres
+    """
+    index = f'{table}_{column}_trgm'
+    return (
+        f'CREATE INDEX {index} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops);',
+        f'DROP INDEX IF EXISTS {index};',
+    )
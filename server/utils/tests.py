@@ -38,6 +38,11 @@ class CommonSetupClassMixin:
     EMAIL_BACKEND=TEST_EMAIL_BACKEND,
     MEDIA_ROOT=TEST_MEDIA_ROOT,
     DEFAULT_FILE_STORAGE=TEST_FILE_STORAGE,
+    JOBS_EAGER=True,
+    # the connections of the other threads do not see the test transaction
+    GRAPHQL_EXECUTOR_THREADS=0,
+    # the cache outlives the rollback of each test
+    GRAPHQL_RESPONSE_CACHE_TIMEOUT=0,
 )
 class HelixGraphQLTestCase(CommonSetupClassMixin, GraphQLTestCase):
     GRAPHQL_URL = '/graphql'
@@ -96,6 +101,8 @@ class ImmediateOnCommitMixin(object):
     EMAIL_BACKEND=TEST_EMAIL_BACKEND,
     DEFAULT_FILE_STORAGE=TEST_FILE_STORAGE,
     MEDIA_ROOT=TEST_MEDIA_ROOT,
+    JOBS_EAGER=True,
+    GRAPHQL_EXECUTOR_THREADS=0,
 )
 class HelixTestCase(CommonSetupClassMixin, ImmediateOnCommitMixin, TestCase):
     pass
@@ -0,0 +1,149 @@
+from typing import Optional
+
+from django.conf import settings
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLObjectType, GraphQLInterfaceType, get_named_type
+from graphql.validation.rules.base import ValidationRule
+from graphene_django_extras.settings import graphql_api_settings
+
+# arguments with the number of items of a (paginated) list
+PAGE_SIZE_ARGUMENTS = ('pageSize', 'perPage')
+
+
+def _get_fields(selection_set, fragments: dict):
+    """
+    Field nodes of the selection set with the fragments flattened
+    """
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _get_fields(selection.selection_set, fragments)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment:
+                yield from _get_fields(fragment.selection_set, fragments)
+
+
+def _get_page_size(node: ast.Field, variables: Optional[dict]) -> int:
+    max_page_size = graphql_api_settings.MAX_PAGE_SIZE
+    for argument in node.arguments or []:
+        if argument.name.value not in PAGE_SIZE_ARGUMENTS:
+            continue
+        value = argument.value
+        if isinstance(value, ast.Variable):
+            if variables is None:
+                # unknown during the validation, assume the worst case
+                return max_page_size
+            value = variables.get(value.name.value)
+        elif isinstance(value, ast.IntValue):
+            value = int(value.value)
+        if isinstance(value, int) and value > 0:
+            return min(value, max_page_size)
+    return graphql_api_settings.DEFAULT_PAGE_SIZE
+
+
+def _get_results_field_name(_type) -> Optional[str]:
+    graphene_type = getattr(_type, 'graphene_type', None)
+    return getattr(getattr(graphene_type, '_meta', None), 'results_field_name', None)
+
+
+def _is_list(_type) -> bool:
+    while hasattr(_type, 'of_type'):
+        if isinstance(_type, GraphQLList):
+            return True
+        _type = _type.of_type
+    return False
+
+
+def _get_cost(selection_set, parent_type, fragments: dict, variables: Optional[dict],
+              results_size: int = None) -> int:
+    cost = 0
+    if selection_set is None or not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+        return cost
+    results_field_name = _get_results_field_name(parent_type)
+    for node in _get_fields(selection_set, fragments):
+        name = node.name.value
+        if name.startswith('__'):
+            # introspection
+            continue
+        field = parent_type.fields.get(name)
+        if field is None:
+            continue
+        _type = get_named_type(field.type)
+        if _get_results_field_name(_type):
+            # paginated list, the page size applies to its results
+            cost += _get_cost(node.selection_set, _type, fragments, variables,
+                              results_size=_get_page_size(node, variables))
+            continue
+        if not isinstance(_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            # scalars and enums
+            continue
+        size = 1
+        if name == results_field_name and results_size:
+            size = results_size
+        elif _is_list(field.type):
+            size = _get_page_size(node, variables)
+        cost += size * (1 + _get_cost(node.selection_set, _type, fragments, variables))
+    return cost
+
+
+def _get_depth(selection_set, fragments: dict, depth: int = 0) -> int:
+    if selection_set is None or depth > settings.GRAPHQL_MAX_QUERY_DEPTH:
+        # no need to go further (also guards the fragment cycles, reported by another rule)
+        return depth
+    return max(
+        [
+            _get_depth(node.selection_set, fragments, depth + 1)
+            for node in _get_fields(selection_set, fragments)
+            if not node.name.value.startswith('__')
+        ],
+        default=depth,
+    )
+
+
+def _get_operation(document: ast.Document, operation_name: str = None) -> Optional[ast.OperationDefinition]:
+    operations = [each for each in document.definitions if isinstance(each, ast.OperationDefinition)]
+    if operation_name:
+        return next((each for each in operations if each.name and each.name.value == operation_name), None)
+    return operations[0] if len(operations) == 1 else None
+
+
+def get_query_cost(schema, document: ast.Document, variables: dict = None, operation_name: str = None) -> int:
+    """
+    Estimated number of objects resolved by the operation
+
+    Each object field costs 1, lists are multiplied by their page size (`pageSize`/`perPage`,
+    DEFAULT_PAGE_SIZE when missing, at most MAX_PAGE_SIZE) and nested lists multiply each other.
+    Variables which are not given count as MAX_PAGE_SIZE.
+    """
+    operation = _get_operation(document, operation_name)
+    if operation is None:
+        return 0
+    fragments = {
+        each.name.value: each for each in document.definitions if isinstance(each, ast.FragmentDefinition)
+    }
+    root_type = {
+        'query': schema.get_query_type,
+        'mutation': schema.get_mutation_type,
+        'subscription': schema.get_subscription_type,
+    }[operation.operation]()
+    return _get_cost(operation.selection_set, root_type, fragments, variables)
+
+
+class QueryDepthRule(ValidationRule):
+    """
+    Rejects the operations nested deeper than GRAPHQL_MAX_QUERY_DEPTH
+    """
+    def enter_OperationDefinition(self, node, *args):
+        fragments = {
+            each.name.value: each for each in self.context.get_ast().definitions
+            if isinstance(each, ast.FragmentDefinition)
+        }
+        depth = _get_depth(node.selection_set, fragments)
+        if depth > settings.GRAPHQL_MAX_QUERY_DEPTH:
+            self.context.report_error(GraphQLError(
+                f'Query depth {depth} exceeds the maximum allowed depth {settings.GRAPHQL_MAX_QUERY_DEPTH}.',
+                [node],
+            ))
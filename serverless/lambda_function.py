@@ -2,6 +2,7 @@ try:
     import unzip_requirements
 except ImportError:
     pass
+import hashlib
 import os
 from subprocess import call
 import sys
@@ -15,24 +16,27 @@ S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', 'togglecorp-helix')
 
 def handle(event, context):
     url = event.get('url', 'https://google.com')
-    filename = event.get('filename', 'test.pdf')
 
     config = pdfkit.configuration(wkhtmltopdf='/opt/bin/wkhtmltopdf')
     pdf_content = pdfkit.from_url(url, False, configuration=config)
+    # stored by content, the identical pdfs are kept once
+    content_hash = hashlib.sha256(pdf_content).hexdigest()
+    key = 'source/previews/' + content_hash + '.pdf'
     client.put_object(
         ACL='public-read',
         Body=pdf_content,
         ContentType='application/pdf',
         Bucket=S3_BUCKET_NAME,
-        Key='source/previews/' + filename
+        Key=key
     )
 
-    object_url = 'https://{0}.s3.amazonaws.com/{1}'.format(S3_BUCKET_NAME, filename)
+    object_url = 'https://{0}.s3.amazonaws.com/{1}'.format(S3_BUCKET_NAME, key)
 
     response = {
         'statusCode': 200,
         'body': object_url,
+        'key': key,
+        'content_hash': content_hash,
         's3_bucket': S3_BUCKET_NAME
     }
     return response
-